@@ -13,13 +13,44 @@ __status__ = 'prod'
 import os
 import re
 import sys
-import numpy
+import json
+import mmap
+import time
+import uuid
+import zlib
+import bisect
+import heapq
+import runpy
+import shutil
+import struct
+import hashlib
 import logging
 import argparse
-import subprocess
-import logging
+import resource
+import tempfile
 import warnings
-from anacore.vcf import VCFIO, HeaderInfoAttr, HeaderFormatAttr
+import itertools
+import threading
+import contextlib
+import subprocess
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from anacore.vcf import VCFIO, VCFRecord, HeaderInfoAttr, HeaderFormatAttr, decodeInfoValue, encodeInfoValue
+
+
+BCFTOOLS_PATH = "/usr/bin/bcftools"
+REFERENCE_GENOME = "/mnt/chu-ngs/refData/genome/hg19_no_chr/hg19.fa"
+TABIX_MAX_POS = 2**29  # Maximum position managed by tabix index
+BGZF_BLOCK_SIZE = 0xff00  # Maximum uncompressed size of a BGZF block (as htslib)
+POSITION_REORDER_WINDOW = 10000  # Maximum distance between the position of a record and the position of a previous record in the output of the merge (for indexed output)
+NORMALIZER = "bcftools"  # Normalization engine: "bcftools" (BCFTOOLS_PATH in a sub-process) or "internal" (LineNormalizer in the merge process)
+NORMALIZATION_WINDOW = 1000  # Maximum distance of the left-alignment managed by the sort of the normalized records (as the site window of bcftools norm)
+REGIONS_PADDING = 1000  # Distance around the target regions where the records are read: the records moved in the regions by the left-alignment or sharing a position with a record overlapping the regions are merged as in a merge without regions
+MERGE_STATE_SUFFIX = ".state.json"  # Suffix of the description of the merge written next to the output with --write-state (see getMergeState)
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")  # Empty BGZF block marking the end of file
+
+log = logging.getLogger(os.path.basename(__file__))
 
 
 ########################################################################
@@ -27,30 +58,1078 @@ from anacore.vcf import VCFIO, HeaderInfoAttr, HeaderFormatAttr
 # FUNCTIONS
 #
 ########################################################################
-def normalize_vcf(input_vcf, output_vcf): # JC : left align and to split multiallelic sites
+class RunMetrics:
     """
-    Normalize a VCF file using bcftools.
-    
+    Measures of a run: wall and CPU time by phase, normalization time, records and errors by caller, shared and private variants counts and peak memory.
+
+    The time of a phase does not contain the time of the phases nested in it. The instances can be pickled: the measures of the processes merging regions are added to the main ones with update().
+    """
+    def __init__(self, inputs_variants=None, calling_sources=None):
+        """
+        Build and return an instance of RunMetrics.
+
+        :param inputs_variants: Pathes to the variants files.
+        :type inputs_variants: list
+        :param calling_sources: Names of the variants callers (in same order as inputs_variants).
+        :type calling_sources: list
+        :return: The new instance.
+        :rtype: RunMetrics
+        """
+        self.caller_by_input = dict(zip(inputs_variants or [], calling_sources or []))
+        self.phases = {}  # Wall and CPU time by phase: {"merge": {"wall_s": 12.5, "cpu_s": 12.1}}
+        self.callers = {}  # Measures by caller: {"FreeBayes": {"records": 150, "errors": {"missing AD": 2}, "prefilter": {"kept": 150, "dropped": 1200}, "merge": {...}}}
+        self.variants = {"total": 0, "shared": 0, "private": {}, "decomposed": 0}  # decomposed: SNVs removed by reconcileOverlappingRecords
+        self.concordance = None if calling_sources is None else ConcordanceStats(calling_sources)  # Differences of AD, DP and AF between callers
+        self._running = []  # Time of the nested phases by running phase: [[wall, cpu], ...]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_running"] = []
+        return state
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager measuring the time of a phase. The measures of several calls for the same phase are summed.
+
+        :param name: The phase name.
+        :type name: str
+        """
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        self._running.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            nested_wall, nested_cpu = self._running.pop()
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            if len(self._running) != 0:  # Exclude the time of this phase from the parent phase
+                self._running[-1][0] += wall
+                self._running[-1][1] += cpu
+            self.addTime(self.phases, name, wall - nested_wall, cpu - nested_cpu)
+
+    def addTime(self, container, name, wall, cpu):
+        """
+        Add wall and CPU time to the measures of name in container.
+
+        :param container: The measures by name.
+        :type container: dict
+        :param name: The measure name.
+        :type name: str
+        :param wall: The wall time (in seconds).
+        :type wall: float
+        :param cpu: The CPU time (in seconds).
+        :type cpu: float
+        """
+        if name not in container:
+            container[name] = {"wall_s": 0.0, "cpu_s": 0.0}
+        container[name]["wall_s"] += wall
+        container[name]["cpu_s"] += cpu
+
+    def getCaller(self, caller):
+        """
+        Return the measures of the caller.
+
+        :param caller: The calling source name.
+        :type caller: str
+        :return: The measures of the caller.
+        :rtype: dict
+        """
+        if caller not in self.callers:
+            self.callers[caller] = {"records": 0, "errors": {}}
+        return self.callers[caller]
+
+    def addNormalization(self, input_vcf, wall, cpu, cache):
+        """
+        Add the measures of the normalization of one input.
+
+        :param input_vcf: Path to the input VCF file.
+        :type input_vcf: str
+        :param wall: The wall time (in seconds).
+        :type wall: float
+        :param cpu: The CPU time of the normalization process (in seconds).
+        :type cpu: float
+        :param cache: Status of the normalization cache: "hit", "miss" or None without cache.
+        :type cache: str
+        """
+        caller_metrics = self.getCaller(self.caller_by_input.get(input_vcf, input_vcf))
+        self.addTime(caller_metrics, "normalization", wall, cpu)
+        caller_metrics["normalization"]["cache"] = cache
+
+    def addMergePlan(self, merge_plan):
+        """
+        Add the records, errors and prefiltered lines counted in a merge plan (see mergeRecord and VariantLinesReader).
+
+        :param merge_plan: The merge plan of the caller (see getMergePlan).
+        :type merge_plan: dict
+        """
+        caller_metrics = self.getCaller(merge_plan["caller"])
+        caller_metrics["records"] += merge_plan["nb_records"]
+        for error_type, count in merge_plan["errors"].items():
+            caller_metrics["errors"][error_type] = caller_metrics["errors"].get(error_type, 0) + count
+        self.addPrefilter(caller_metrics, merge_plan["prefilter"])
+
+    def addPrefilter(self, caller_metrics, prefilter):
+        """
+        Add the lines kept and dropped by the prefilter of a caller. Nothing is added when the prefilter is not used.
+
+        :param caller_metrics: The measures of the caller (see getCaller).
+        :type caller_metrics: dict
+        :param prefilter: Counters of the kept and dropped lines.
+        :type prefilter: dict
+        """
+        if prefilter["kept"] + prefilter["dropped"] == 0:
+            return
+        if "prefilter" not in caller_metrics:
+            caller_metrics["prefilter"] = {"kept": 0, "dropped": 0}
+        for status, count in prefilter.items():
+            caller_metrics["prefilter"][status] += count
+
+    def countVariant(self, record):
+        """
+        Count a merged record as shared or private from its SRC and add its AD and DP to the concordance between callers.
+
+        :param record: The merged record.
+        :type record: VCFRecord
+        """
+        if self.concordance is not None:
+            self.concordance.add(record)
+        callers = set(record.info["SRC"])
+        self.variants["total"] += 1
+        if len(callers) > 1:
+            self.variants["shared"] += 1
+        else:
+            caller = callers.pop()
+            self.variants["private"][caller] = self.variants["private"].get(caller, 0) + 1
+
+    def update(self, other):
+        """
+        Add the measures of another run part (ex: a region merged in another process).
+
+        :param other: The measures to add.
+        :type other: RunMetrics
+        """
+        for name, measures in other.phases.items():
+            self.addTime(self.phases, name, measures["wall_s"], measures["cpu_s"])
+        for caller, other_caller_metrics in other.callers.items():
+            caller_metrics = self.getCaller(caller)
+            caller_metrics["records"] += other_caller_metrics["records"]
+            for error_type, count in other_caller_metrics["errors"].items():
+                caller_metrics["errors"][error_type] = caller_metrics["errors"].get(error_type, 0) + count
+            if "prefilter" in other_caller_metrics:
+                self.addPrefilter(caller_metrics, other_caller_metrics["prefilter"])
+            for step in ["normalization", "merge"]:
+                if step in other_caller_metrics:
+                    self.addTime(caller_metrics, step, other_caller_metrics[step]["wall_s"], other_caller_metrics[step]["cpu_s"])
+        self.variants["total"] += other.variants["total"]
+        self.variants["shared"] += other.variants["shared"]
+        self.variants["decomposed"] += other.variants["decomposed"]
+        for caller, count in other.variants["private"].items():
+            self.variants["private"][caller] = self.variants["private"].get(caller, 0) + count
+        if self.concordance is not None and other.concordance is not None:
+            self.concordance.update(other.concordance)
+
+    def toDict(self):
+        """
+        Return the measures. The records by second of a caller are computed on its merge time when callers are merged one after the other, otherwise on the merge phase.
+
+        :return: The measures.
+        :rtype: dict
+        """
+        merge_wall = sum(
+            measures["wall_s"] for name, measures in self.phases.items() if name in {"merge", "merge_and_write", "regions"}
+        )
+        callers = {}
+        for caller, caller_metrics in self.callers.items():
+            callers[caller] = dict(caller_metrics)
+            caller_wall = caller_metrics["merge"]["wall_s"] if "merge" in caller_metrics else merge_wall
+            callers[caller]["records_per_s"] = caller_metrics["records"] / caller_wall if caller_wall > 0 else None
+        return {
+            "phases": self.phases,
+            "callers": callers,
+            "variants": self.variants,
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "peak_children_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        }
+
+    def write(self, out_path):
+        """
+        Write the measures in a JSON file.
+
+        :param out_path: Path to the output file.
+        :type out_path: str
+        """
+        with open(out_path, "w") as FH_out:
+            json.dump(self.toDict(), FH_out, indent=2)
+
+
+class ConcordanceStats:
+    """
+    Differences of AD, DP and AF between the callers of the shared variants.
+
+    The values of each caller are read from the prefixed FORMAT sN_AD and sN_DP (alternative allele depth is the last value of AD) and stored in preallocated arrays of CHUNK_SIZE rows (one row by shared variant and sample). Each full chunk is reduced in histograms of the absolute differences by pair of callers: the memory does not depend on the number of variants. The AD and DP differences are exact up to MAX_DEPTH_DIFF and the AF differences are rounded to 1 / AF_BINS.
+    """
+    CHUNK_SIZE = 65536
+    MAX_DEPTH_DIFF = 10000
+    AF_BINS = 1000
+
+    def __init__(self, calling_sources):
+        """
+        Build and return an instance of ConcordanceStats.
+
+        :param calling_sources: Names of the variants callers (in same order as the inputs).
+        :type calling_sources: list
+        :return: The new instance.
+        :rtype: ConcordanceStats
+        """
+        self.calling_sources = list(calling_sources)
+        self.nb_variants = 0  # Number of shared variants
+        self.pairs = list(itertools.combinations(range(len(self.calling_sources)), 2))
+        self.histograms = None  # By metric: counts of differences by pair and by bin
+        self.max_diff = None  # By metric: maximum difference by pair
+        self._idx_by_caller = {caller: idx for idx, caller in enumerate(self.calling_sources)}
+        self._tags = [("s{}_AD".format(idx), "s{}_DP".format(idx)) for idx in range(len(self.calling_sources))]
+        self._AD = None
+        self._DP = None
+        self._nb_rows = 0
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        state["_AD"] = None
+        state["_DP"] = None
+        return state
+
+    def _allocate(self):
+        import numpy  # Lazy import: numpy is loaded only if some variants are shared
+        self._AD = numpy.full((ConcordanceStats.CHUNK_SIZE, len(self.calling_sources)), numpy.nan)
+        self._DP = numpy.full((ConcordanceStats.CHUNK_SIZE, len(self.calling_sources)), numpy.nan)
+        if self.histograms is None:
+            nb_bins = {"AD": ConcordanceStats.MAX_DEPTH_DIFF + 1, "DP": ConcordanceStats.MAX_DEPTH_DIFF + 1, "AF": ConcordanceStats.AF_BINS + 1}
+            self.histograms = {metric: numpy.zeros((len(self.pairs), bins), dtype=numpy.int64) for metric, bins in nb_bins.items()}
+            self.max_diff = {metric: numpy.full(len(self.pairs), -1.0) for metric in nb_bins}
+
+    @staticmethod
+    def _lastValue(value):
+        if value is None:
+            return float("nan")
+        if isinstance(value, str):  # Raw value of LazyRecord
+            value = value.rsplit(",", 1)[-1]
+            return float("nan") if value == "." else float(value)
+        if isinstance(value, list):
+            value = value[-1] if len(value) != 0 else None
+            return float("nan") if value is None else float(value)
+        return float(value)
+
+    def add(self, record):
+        """
+        Add the AD and DP of the callers of a merged record. The records found by only one caller are ignored.
+
+        :param record: The merged record.
+        :type record: anacore.vcf.VCFRecord | LazyRecord
+        """
+        callers = dict.fromkeys(record.info["SRC"])
+        if len(callers) < 2:
+            return
+        if self._AD is None:
+            self._allocate()
+        self.nb_variants += 1
+        samples = record.sample_tokens if isinstance(record, LazyRecord) else record.samples
+        for spl_data in samples.values():
+            if self._nb_rows == ConcordanceStats.CHUNK_SIZE:
+                self.flush()
+            row = self._nb_rows
+            for caller in callers:
+                idx = self._idx_by_caller[caller]
+                AD_tag, DP_tag = self._tags[idx]
+                self._AD[row, idx] = ConcordanceStats._lastValue(spl_data.get(AD_tag))
+                self._DP[row, idx] = ConcordanceStats._lastValue(spl_data.get(DP_tag))
+            self._nb_rows += 1
+
+    def flush(self):
+        """Add the differences of the stored rows to the histograms and reset the storage."""
+        if self._nb_rows == 0:
+            return
+        import numpy  # Lazy import: numpy is loaded only if some variants are shared
+        AD = self._AD[:self._nb_rows]
+        DP = self._DP[:self._nb_rows]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            AF = numpy.where(DP > 0, AD / DP, numpy.nan)
+        first_idx = numpy.array([pair[0] for pair in self.pairs])
+        second_idx = numpy.array([pair[1] for pair in self.pairs])
+        pair_offsets = numpy.arange(len(self.pairs))[numpy.newaxis, :]
+        for metric, values, scale in [("AD", AD, 1), ("DP", DP, 1), ("AF", AF, ConcordanceStats.AF_BINS)]:
+            diff = numpy.abs(values[:, first_idx] - values[:, second_idx])  # Rows x pairs
+            is_valid = ~numpy.isnan(diff)
+            histogram = self.histograms[metric]
+            nb_bins = histogram.shape[1]
+            bins = numpy.minimum(numpy.rint(numpy.where(is_valid, diff, 0) * scale), nb_bins - 1).astype(numpy.int64)
+            histogram += numpy.bincount(
+                (pair_offsets * nb_bins + bins)[is_valid],
+                minlength=histogram.size
+            ).reshape(histogram.shape)
+            self.max_diff[metric] = numpy.maximum(self.max_diff[metric], numpy.where(is_valid, diff, -1).max(axis=0))
+        self._AD[:self._nb_rows] = numpy.nan
+        self._DP[:self._nb_rows] = numpy.nan
+        self._nb_rows = 0
+
+    def update(self, other):
+        """
+        Add the differences of another run part (ex: a region merged in another process).
+
+        :param other: The differences to add.
+        :type other: ConcordanceStats
+        """
+        other.flush()
+        self.nb_variants += other.nb_variants
+        if other.histograms is None:
+            return
+        import numpy  # Lazy import: numpy is loaded only if some variants are shared
+        if self.histograms is None:
+            self._allocate()
+        for metric, histogram in other.histograms.items():
+            self.histograms[metric] += histogram
+            self.max_diff[metric] = numpy.maximum(self.max_diff[metric], other.max_diff[metric])
+
+    def toDict(self):
+        """
+        Return the median, the 75th and the 90th percentiles (nearest rank) and the maximum of the differences by pair of callers. The missing values are excluded.
+
+        :return: The differences by pair of callers: {"shared_variants": 12, "pairs": {"FreeBayes/GATK": {"AD": {"count": 12, "median": 1, "p75": 2, "p90": 3, "max": 8}, "DP": {...}, "AF": {...}}}}.
+        :rtype: dict
+        """
+        self.flush()
+        stats = {"shared_variants": self.nb_variants, "pairs": {}}
+        if self.histograms is None:
+            return stats
+        import numpy  # Lazy import: numpy is loaded only if some variants are shared
+        quantiles = {"median": 0.5, "p75": 0.75, "p90": 0.9}
+        by_metric = {}
+        for metric, histogram in self.histograms.items():
+            cumulative = numpy.cumsum(histogram, axis=1)
+            counts = cumulative[:, -1]
+            scale = ConcordanceStats.AF_BINS if metric == "AF" else 1
+            by_metric[metric] = {"count": counts, "max": self.max_diff[metric]}
+            for name, quantile in quantiles.items():
+                rank = numpy.maximum(numpy.ceil(counts * quantile), 1)
+                by_metric[metric][name] = (cumulative >= rank[:, numpy.newaxis]).argmax(axis=1) / scale
+        for idx_pair, (first_idx, second_idx) in enumerate(self.pairs):
+            pair_stats = {}
+            for metric, values in by_metric.items():
+                if values["count"][idx_pair] == 0:
+                    pair_stats[metric] = {"count": 0, "median": None, "p75": None, "p90": None, "max": None}
+                else:
+                    cast = float if metric == "AF" else int
+                    pair_stats[metric] = {"count": int(values["count"][idx_pair])}
+                    for name in ["median", "p75", "p90", "max"]:
+                        pair_stats[metric][name] = cast(values[name][idx_pair])
+            stats["pairs"]["{}/{}".format(self.calling_sources[first_idx], self.calling_sources[second_idx])] = pair_stats
+        return stats
+
+    def write(self, out_path):
+        """
+        Write the differences in a JSON file.
+
+        :param out_path: Path to the output file.
+        :type out_path: str
+        """
+        with open(out_path, "w") as FH_out:
+            json.dump(self.toDict(), FH_out, indent=2)
+
+
+class RegionIndex:
+    """
+    Sorted and merged target regions used to restrict the merge. The overlapping and the adjacent intervals are merged and the coordinates are 1-based and inclusive.
+    """
+
+    def __init__(self, intervals):
+        """
+        Build and return an instance of RegionIndex.
+
+        :param intervals: The intervals (chrom, start, end) with 1-based inclusive coordinates in any order.
+        :type intervals: iterable
+        :return: The new instance.
+        :rtype: RegionIndex
+        """
+        self.starts_by_chrom = {}
+        self.ends_by_chrom = {}
+        for chrom, start, end in sorted(intervals):
+            starts = self.starts_by_chrom.setdefault(chrom, [])
+            ends = self.ends_by_chrom.setdefault(chrom, [])
+            if len(ends) != 0 and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+    @classmethod
+    def fromBED(cls, bed_path):
+        """
+        Return the regions of a BED file.
+
+        :param bed_path: Path to the regions (format: BED). The header lines (#, track and browser) are ignored.
+        :type bed_path: str
+        :return: The regions.
+        :rtype: RegionIndex
+        """
+        intervals = []
+        with open(bed_path) as FH_bed:
+            for line in FH_bed:
+                if line.strip() == "" or line.startswith(("#", "track", "browser")):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                try:
+                    intervals.append((fields[0], int(fields[1]) + 1, int(fields[2])))
+                except (IndexError, ValueError):
+                    raise ValueError("The line {} of {} is not a valid BED line.".format(line.rstrip("\n"), bed_path))
+        return cls(intervals)
+
+    def __iter__(self):
+        for chrom, starts in self.starts_by_chrom.items():
+            yield from ((chrom, start, end) for start, end in zip(starts, self.ends_by_chrom[chrom]))
+
+    def getIntervals(self, chrom):
+        """
+        Return the intervals of a contig.
+
+        :param chrom: The contig name.
+        :type chrom: str
+        :return: The intervals (start, end) sorted by position.
+        :rtype: list
+        """
+        return list(zip(self.starts_by_chrom.get(chrom, []), self.ends_by_chrom.get(chrom, [])))
+
+    def getPadded(self, padding):
+        """
+        Return the regions extended on both sides.
+
+        :param padding: Size added on each side of the intervals.
+        :type padding: int
+        :return: The extended regions.
+        :rtype: RegionIndex
+        """
+        return RegionIndex((chrom, max(1, start - padding), end + padding) for chrom, start, end in self)
+
+    def overlaps(self, chrom, start, end):
+        """
+        Return True if the interval overlaps the regions.
+
+        :param chrom: The contig name.
+        :type chrom: str
+        :param start: Start of the interval (1-based).
+        :type start: int
+        :param end: End of the interval (1-based, inclusive).
+        :type end: int
+        :return: True if the interval overlaps the regions.
+        :rtype: bool
+        """
+        starts = self.starts_by_chrom.get(chrom)
+        if starts is None:
+            return False
+        idx = bisect.bisect_right(starts, end) - 1  # Last interval starting before the end
+        return idx >= 0 and self.ends_by_chrom[chrom][idx] >= start
+
+    def overlapsRecord(self, record):
+        """
+        Return True if the reference allele of the record overlaps the regions.
+
+        :param record: The record.
+        :type record: anacore.vcf.VCFRecord | LazyRecord
+        :return: True if the reference allele of the record overlaps the regions.
+        :rtype: bool
+        """
+        return self.overlaps(record.chrom, record.pos, record.pos + max(len(record.ref), 1) - 1)
+
+    def toBED(self):
+        """
+        Return the regions in BED format.
+
+        :return: The BED lines.
+        :rtype: str
+        """
+        return "".join("{}\t{}\t{}\n".format(chrom, start - 1, end) for chrom, start, end in self)
+
+
+class IndexedFasta:
+    """
+    Read the sequences of a FASTA file indexed with samtools faidx (.fai). The file is memory-mapped and the sequences are read by windows of WINDOW_SIZE nucleotids: the CACHE_SIZE most recently used windows are kept in memory. The case of the sequences is kept.
+    """
+    WINDOW_SIZE = 4096
+    CACHE_SIZE = 64
+
+    def __init__(self, filepath):
+        """
+        Build and return an instance of IndexedFasta.
+
+        :param filepath: Path to the sequences file (format: FASTA). The index must be in filepath + ".fai".
+        :type filepath: str
+        :return: The new instance.
+        :rtype: IndexedFasta
+        """
+        self.filepath = filepath
+        self.index = {}  # By sequence name: (length, offset, line bases, line width)
+        with open(filepath + ".fai") as FH_fai:
+            for line in FH_fai:
+                name, length, offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+                self.index[name] = (int(length), int(offset), int(line_bases), int(line_width))
+        self.file_handle = open(filepath, "rb")
+        self._mmap = mmap.mmap(self.file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._windows = OrderedDict()  # Sequence by (sequence name, window index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the file."""
+        self._windows.clear()
+        self._mmap.close()
+        self.file_handle.close()
+
+    def _getWindow(self, chrom, idx_window):
+        key = (chrom, idx_window)
+        window = self._windows.get(key)
+        if window is None:
+            length, offset, line_bases, line_width = self.index[chrom]
+            start = idx_window * self.WINDOW_SIZE  # 0-based
+            end = min(length, start + self.WINDOW_SIZE)  # 0-based excluded
+            start_offset = offset + (start // line_bases) * line_width + start % line_bases
+            end_offset = offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases + 1
+            window = self._mmap[start_offset:end_offset].replace(b"\n", b"").replace(b"\r", b"").decode()
+            self._windows[key] = window
+            if len(self._windows) > self.CACHE_SIZE:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+        return window
+
+    def getSub(self, chrom, start, end):
+        """
+        Return the sub-sequence.
+
+        :param chrom: The sequence name.
+        :type chrom: str
+        :param start: Start of the sub-sequence (1-based).
+        :type start: int
+        :param end: End of the sub-sequence (1-based, inclusive).
+        :type end: int
+        :return: The sub-sequence.
+        :rtype: str
+        """
+        if chrom not in self.index:
+            raise KeyError("The sequence {} is not in {}.".format(chrom, self.filepath))
+        if start < 1 or end > self.index[chrom][0]:
+            raise ValueError("The region {}:{}-{} is out of the sequence in {}.".format(chrom, start, end, self.filepath))
+        first_window = (start - 1) // self.WINDOW_SIZE
+        last_window = (end - 1) // self.WINDOW_SIZE
+        if first_window == last_window:
+            window = self._getWindow(chrom, first_window)
+        else:
+            window = "".join(self._getWindow(chrom, idx_window) for idx_window in range(first_window, last_window + 1))
+        window_start = first_window * self.WINDOW_SIZE + 1
+        return window[start - window_start:end - window_start + 1]
+
+
+class NormalizationError(ValueError):
+    """Error raised when a record cannot be normalized on the reference genome (reference allele different from the reference sequence, unknown sequence)."""
+
+
+class LineNormalizer:
+    """
+    Normalize the raw lines of a VCF as "bcftools norm -m -both -f reference": the multiallelic records are split in one record by alternative allele, and the alleles are left-aligned on the reference and trimmed. As in bcftools, the alleles of the moved records are uppercased and the bases added before the indels keep the case of the reference. Only the changed fields are re-written: the lines of biallelic records are not parsed and INFO and samples are split only for the multiallelic records.
+
+    In split records, the values of the INFO and FORMAT with Number A, R and G are selected for the allele and the other alternative alleles of GT are replaced by the reference allele. The REF must correspond to the reference sequence.
+    """
+    GT_SEPARATOR_REGEXP = re.compile(r"([/|])")
+
+    def __init__(self, FH_in, reference, targets=None):
+        """
+        Build and return an instance of LineNormalizer.
+
+        :param FH_in: The VCF file of the lines. Its header is used to split the INFO and FORMAT values.
+        :type FH_in: anacore.vcf.VCFIO
+        :param reference: The reference sequences.
+        :type reference: IndexedFasta
+        :param targets: Regions of the kept lines: the lines with a position outside these regions are dropped before normalization (as the targets option of bcftools). None to keep all the lines.
+        :type targets: RegionIndex
+        :return: The new instance.
+        :rtype: LineNormalizer
+        """
+        self.FH_in = FH_in
+        self.reference = reference
+        self.targets = targets
+
+    def iterLines(self, lines):
+        """
+        Return generator on the normalized lines sorted by position (the records moved upstream by more than NORMALIZATION_WINDOW are not sorted).
+
+        :param lines: The VCF record lines without end of line.
+        :type lines: iterable
+        :return: The normalized lines.
+        :rtype: generator for str
+        """
+        pending = []  # Heap of the normalized lines waiting for the next lines: (position, index, line)
+        pending_chrom = None
+        idx_line = 0
+        for line in lines:
+            chrom, pos = line.split("\t", 2)[:2]
+            pos = int(pos)
+            if self.targets is not None and not self.targets.overlaps(chrom, pos, pos):
+                continue
+            if chrom != pending_chrom:
+                while len(pending) != 0:
+                    yield heapq.heappop(pending)[-1]
+                pending_chrom = chrom
+            while len(pending) != 0 and pending[0][0] < pos - NORMALIZATION_WINDOW:
+                yield heapq.heappop(pending)[-1]
+            for new_pos, new_line in self.normalizeLine(line):
+                heapq.heappush(pending, (new_pos, idx_line, new_line))
+                idx_line += 1
+        while len(pending) != 0:
+            yield heapq.heappop(pending)[-1]
+
+    def normalizeLine(self, line):
+        """
+        Return the normalized lines corresponding to the line.
+
+        :param line: The VCF record line without end of line.
+        :type line: str
+        :return: The normalized lines with their position: [(position, line), ...].
+        :rtype: list
+        """
+        fields = line.split("\t")
+        alts = fields[4].split(",")
+        if len(alts) == 1:
+            splitted = [fields]
+        else:
+            splitted = [self.getAlleleFields(fields, len(alts), idx_alt) for idx_alt in range(len(alts))]
+        normalized = []
+        for allele_fields in splitted:
+            pos = int(allele_fields[1])
+            new_pos, new_ref, new_alt = self.leftAlign(allele_fields[0], pos, allele_fields[3], allele_fields[4])
+            if new_pos != pos or new_ref != allele_fields[3] or new_alt != allele_fields[4]:
+                allele_fields = list(allele_fields)
+                allele_fields[1] = str(new_pos)
+                allele_fields[3] = new_ref
+                allele_fields[4] = new_alt
+            normalized.append((new_pos, line if allele_fields is fields else "\t".join(allele_fields)))
+        return normalized
+
+    def leftAlign(self, chrom, pos, ref, alt):
+        """
+        Return the most upstream representation of the allele with the minimal alleles (an indel keeps one nucleotid before the event).
+
+        :param chrom: The sequence name.
+        :type chrom: str
+        :param pos: The position of the allele.
+        :type pos: int
+        :param ref: The reference allele.
+        :type ref: str
+        :param alt: The alternative allele.
+        :type alt: str
+        :return: The position, the reference allele and the alternative allele.
+        :rtype: (int, str, str)
+        """
+        if alt == "." or alt == "*" or alt.startswith("<") or "[" in alt or "]" in alt:  # Missing, overlapping deletion or symbolic allele
+            return pos, ref, alt
+        try:
+            ref_seq = self.reference.getSub(chrom, pos, pos + len(ref) - 1)
+        except (KeyError, ValueError) as error:  # Unknown sequence or out of the sequence
+            raise NormalizationError("The variant {}:{} cannot be placed on the reference: {}".format(chrom, pos, error.args[0])) from error
+        if ref.upper() != ref_seq.upper():
+            raise NormalizationError("The reference allele {} of the variant {}:{} does not correspond to the reference sequence {} in {}.".format(ref, chrom, pos, ref_seq, self.reference.filepath))
+        if len(ref) == 1 and len(alt) == 1:  # SNV
+            return pos, ref, alt
+        if ref.upper() == alt.upper():
+            return pos, ref, alt
+        new_ref = ref.upper()
+        new_alt = alt.upper()
+        is_changed = False
+        while True:  # Trim the end and extend the start when an allele is empty
+            if new_ref != "" and new_alt != "" and new_ref[-1].upper() == new_alt[-1].upper():
+                new_ref = new_ref[:-1]
+                new_alt = new_alt[:-1]
+                is_changed = True
+            elif (new_ref == "" or new_alt == "") and pos > 1:
+                previous_nt = self.reference.getSub(chrom, pos - 1, pos - 1)
+                new_ref = previous_nt + new_ref
+                new_alt = previous_nt + new_alt
+                pos -= 1
+            else:
+                break
+        while len(new_ref) > 1 and len(new_alt) > 1 and new_ref[0].upper() == new_alt[0].upper():  # Trim the start
+            new_ref = new_ref[1:]
+            new_alt = new_alt[1:]
+            pos += 1
+            is_changed = True
+        if not is_changed:
+            return pos, ref, alt
+        return pos, new_ref, new_alt
+
+    @staticmethod
+    def _getAlleleValues(raw_value, number, nb_alt, idx_alt):
+        """
+        Return the raw value of a field for one alternative allele.
+
+        :param raw_value: The raw value of the field in the multiallelic record.
+        :type raw_value: str
+        :param number: The number of values of the field (ex: "A", "R", "G", 1).
+        :type number: str | int
+        :param nb_alt: The number of alternative alleles in the multiallelic record.
+        :type nb_alt: int
+        :param idx_alt: The index of the alternative allele.
+        :type idx_alt: int
+        :return: The raw value for the allele.
+        :rtype: str
+        """
+        if number not in {"A", "R", "G"}:
+            return raw_value
+        values = raw_value.split(",")
+        allele = idx_alt + 1
+        if number == "A" and len(values) == nb_alt:
+            return values[idx_alt]
+        if number == "R" and len(values) == nb_alt + 1:
+            return values[0] + "," + values[allele]
+        if number == "G":
+            if len(values) == nb_alt + 1:  # Haploid
+                return values[0] + "," + values[allele]
+            if len(values) == (nb_alt + 1) * (nb_alt + 2) // 2:  # Diploid: index of j/k (j <= k) is k * (k + 1) / 2 + j
+                het_idx = allele * (allele + 1) // 2
+                return ",".join([values[0], values[het_idx], values[het_idx + allele]])
+        return raw_value
+
+    def getAlleleFields(self, fields, nb_alt, idx_alt):
+        """
+        Return the fields of the record of one alternative allele of a multiallelic record.
+
+        :param fields: The fields of the multiallelic record.
+        :type fields: list
+        :param nb_alt: The number of alternative alleles.
+        :type nb_alt: int
+        :param idx_alt: The index of the alternative allele.
+        :type idx_alt: int
+        :return: The fields of the record of the allele.
+        :rtype: list
+        """
+        allele_fields = fields[:4] + [fields[4].split(",")[idx_alt]] + fields[5:7]
+        # INFO
+        if fields[7] == ".":
+            allele_fields.append(".")
+        else:
+            info_tokens = []
+            for token in fields[7].split(";"):
+                key, sep, raw_value = token.partition("=")
+                if sep != "" and key in self.FH_in.info:
+                    raw_value = self._getAlleleValues(raw_value, self.FH_in.info[key].number, nb_alt, idx_alt)
+                info_tokens.append(key + sep + raw_value)
+            allele_fields.append(";".join(info_tokens))
+        # Samples
+        if len(fields) > 8:
+            allele_fields.append(fields[8])
+            format_tags = fields[8].split(":")
+            allele = str(idx_alt + 1)
+            for spl_field in fields[9:]:
+                spl_tokens = spl_field.split(":")
+                for idx_tag, raw_value in enumerate(spl_tokens):
+                    tag = format_tags[idx_tag] if idx_tag < len(format_tags) else None
+                    if tag == "GT":
+                        spl_tokens[idx_tag] = "".join(
+                            elt if elt in {"/", "|", "."} else ("1" if elt == allele else "0")
+                            for elt in self.GT_SEPARATOR_REGEXP.split(raw_value)
+                        )
+                    elif tag in self.FH_in.format and raw_value != ".":
+                        spl_tokens[idx_tag] = self._getAlleleValues(raw_value, self.FH_in.format[tag].number, nb_alt, idx_alt)
+                allele_fields.append(":".join(spl_tokens))
+        return allele_fields
+
+
+@contextlib.contextmanager
+def profiling(profile_path):
+    """
+    Context manager profiling the code of the context with cProfile. The statistics are dumped in profile_path (see pstats). Nothing is done if profile_path is None.
+
+    :param profile_path: Path to the statistics file.
+    :type profile_path: str
+    """
+    if profile_path is None:
+        yield
+    else:
+        import cProfile  # Lazy import: only used for profiling
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+
+def normalize_cmd(input_vcf, output_vcf, targets_bed=None):
+    """
+    Return the bcftools command used to left align and split multiallelic sites of a VCF file.
+
     :param input_vcf: Path to the input VCF file.
     :param output_vcf: Path to the output normalized VCF file.
+    :param targets_bed: Path to the regions where the records are kept (format: BED). None to keep all the records.
+    :return: The command and its arguments.
+    :rtype: list
     """
-    bcftools_path = "/usr/bin/bcftools"
-    reference_genome = "/mnt/chu-ngs/refData/genome/hg19_no_chr/hg19.fa"
-    cmd = f"{bcftools_path} norm -f {reference_genome} -m -both -o {output_vcf} -O z {input_vcf}"
-    
-    # Print the command that will be executed for debugging purposes
-    #print(f"Running command: {cmd}")
-    
+    cmd = [BCFTOOLS_PATH, "norm", "-f", REFERENCE_GENOME, "-m", "-both", "-o", output_vcf, "-O", "z", input_vcf]
+    if targets_bed is not None:
+        cmd[-1:-1] = ["-T", targets_bed]  # Streamed filter: the input does not need an index
+    return cmd
+
+def exitNormalizationError(input_vcf, error, caller=None):
+    """
+    Log the error of the normalization of an input and exit with status 1.
+
+    :param input_vcf: Path to the input VCF file.
+    :type input_vcf: str
+    :param error: The normalization error.
+    :type error: Exception
+    :param caller: Name of the caller of the input. None if it is unknown.
+    :type caller: str
+    """
+    input_desc = input_vcf if caller is None else "{} ({})".format(input_vcf, caller)
+    log.error("Error normalizing VCF file {}: {}".format(input_desc, error))
+    print("Error during normalization: {}".format(error))
+    sys.exit(1)
+
+def writeNormalizedVCF(input_vcf, output_vcf, targets=None, aborted=None):
+    """
+    Normalize a VCF file in the current process with LineNormalizer (same result as normalize_cmd).
+
+    :param input_vcf: Path to the input VCF file.
+    :param output_vcf: Path to the output normalized VCF file (format: VCF.GZ). The tabix index is written with the file.
+    :param targets: Regions where the records are kept. None to keep all the records.
+    :param aborted: Event set to stop the normalization before its end (the output is incomplete). None to always complete the normalization.
+    :return: True if the normalization is complete, False if it has been stopped by aborted.
+    :rtype: bool
+    """
+    with VCFIO(input_vcf) as FH_in, IndexedFasta(REFERENCE_GENOME) as reference:
+        with MergedVCFIO(output_vcf, "w") as FH_out:
+            FH_out.copyHeader(FH_in)
+            FH_out.writeHeader()
+            normalizer = LineNormalizer(FH_in, reference, targets)
+            lines = (line.rstrip("\n") for line in FH_in.file_handle)
+            for line in normalizer.iterLines(line for line in lines if FH_in.isRecordLine(line)):
+                if aborted is not None and aborted.is_set():
+                    return False
+                FH_out.writeVCFLine(line)
+    return True
+
+def normalization_cache_key(input_vcf, targets=None):
+    """
+    Return the key of the normalized VCF in normalization cache.
+
+    The key is a hash of the input content, of the reference genome identity (path, size, modification time and index) and of the normalization engine and options (with the content of the targets regions).
+
+    :param input_vcf: Path to the input VCF file.
+    :param targets: Regions where the records are kept. None to keep all the records.
+    :return: The cache key.
+    :rtype: str
+    """
+    hasher = hashlib.sha256()
+    # Normalization options
+    if NORMALIZER == "internal":
+        hasher.update("\t".join(["internal", REFERENCE_GENOME, "-m", "-both", "" if targets is None else "TARGETS"]).encode())
+    else:
+        hasher.update("\t".join(normalize_cmd("INPUT", "OUTPUT", None if targets is None else "TARGETS")).encode())
+    if targets is not None:
+        hasher.update(targets.toBED().encode())
+    # Reference identity
+    for curr_path in [REFERENCE_GENOME, REFERENCE_GENOME + ".fai"]:
+        if os.path.exists(curr_path):
+            stat = os.stat(curr_path)
+            hasher.update("{}\t{}\t{}".format(os.path.realpath(curr_path), stat.st_size, stat.st_mtime_ns).encode())
+    # Input content
+    with open(input_vcf, "rb") as FH_in:
+        for chunk in iter(lambda: FH_in.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def link_or_copy(src, dst):
+    """
+    Atomically create dst as hard link on src (or as a copy if the link is not possible).
+
+    :param src: Path to the source file.
+    :param dst: Path to the created file.
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):  # Already linked (rename on a link to the same file does nothing)
+        return
+    tmp_dst = "{}.{}.tmp".format(dst, uuid.uuid4().hex)
     try:
-        print(f"Starting normalization for file: {input_vcf}")
-        subprocess.run(cmd, shell=True, check=True)
-        print(f"Normalization complete for file: {input_vcf} -> {output_vcf}")
+        os.link(src, tmp_dst)
+    except OSError:
+        shutil.copyfile(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+
+def evict_normalization_cache(cache_dir, max_size):
+    """
+    Remove the least recently used normalized VCFs until the cache size is lower or equal to max_size.
+
+    :param cache_dir: Path to the cache directory.
+    :param max_size: Maximum size of the cache (in bytes).
+    """
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(".normalized.vcf.gz"):
+            try:
+                stat = os.stat(os.path.join(cache_dir, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+            except FileNotFoundError:  # Removed by a concurrent process
+                pass
+    cache_size = sum(size for mtime, size, filename in entries)
+    for mtime, size, filename in sorted(entries):
+        if cache_size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, filename))
+        except FileNotFoundError:  # Removed by a concurrent process
+            pass
+        cache_size -= size
+
+def normalize_vcfs(inputs_vcf, nb_jobs=1, cache_dir=None, cache_max_size=None, metrics=None, regions=None):
+    """
+    Normalize VCF files concurrently using bcftools (or LineNormalizer in threads if NORMALIZER is "internal").
+
+    At most nb_jobs normalizations run at the same time. As soon as one normalization fails, the pending ones are cancelled, the running ones are killed (the internal normalizations stop at their next record) and the script exits.
+    With a cache directory, the normalized files are stored by normalization_cache_key() and the normalization is skipped when the input has already been normalized. The cache can be shared by concurrent processes: entries are written atomically and are linked (not moved) to the outputs. The outputs are replaced by rename, never rewritten in place: a later run without cache does not modify the cache entry linked to the output.
+    With regions, only the records overlapping the regions extended by REGIONS_PADDING are kept.
+
+    :param inputs_vcf: Paths to the input VCF files.
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :param cache_dir: Path to the normalization cache directory. None to disable the cache.
+    :param cache_max_size: Maximum size of the cache (in bytes). The least recently used entries are removed beyond this size. None for unlimited.
+    :param metrics: Measures of the run completed by the normalization time by input.
+    :param regions: Target regions. None to normalize all the records.
+    :return: Paths to the normalized VCF files (in same order as inputs_vcf).
+    :rtype: list
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    targets = None if regions is None else regions.getPadded(REGIONS_PADDING)
+    targets_bed = None
+    running_by_input = {}
+    lock = threading.Lock()
+    aborted = threading.Event()
+
+    def report(msg):
+        with lock:
+            print(msg)
+
+    def normalize(input_vcf):
+        start_time = time.time()
+        output_vcf = f"{input_vcf}.normalized.vcf.gz"
+        target_vcf = output_vcf  # Final path of the normalized file
+        cache_status = None
+        if cache_dir is not None:
+            cache_key = normalization_cache_key(input_vcf, targets)
+            cached_vcf = os.path.join(cache_dir, f"{cache_key}.normalized.vcf.gz")
+            try:
+                os.utime(cached_vcf)  # Most recently used
+                link_or_copy(cached_vcf, output_vcf)
+            except FileNotFoundError:
+                report(f"Normalization cache miss for file: {input_vcf}")
+                target_vcf = cached_vcf
+                cache_status = "miss"
+            else:
+                report(f"Normalization cache hit for file: {input_vcf} -> {output_vcf}")
+                with lock:
+                    metrics.addNormalization(input_vcf, time.time() - start_time, 0.0, "hit")
+                return output_vcf
+        # The normalization is written in a temporary file renamed at the end: the output can be a link to a cache entry which must not be truncated
+        process_output = "{}.{}.tmp.vcf.gz".format(target_vcf, uuid.uuid4().hex)
+        with lock:
+            if aborted.is_set():
+                return None
+            print(f"Starting normalization for file: {input_vcf}")
+            if NORMALIZER != "internal":
+                process = subprocess.Popen(normalize_cmd(input_vcf, process_output, targets_bed))
+                running_by_input[input_vcf] = process
+        if NORMALIZER == "internal":  # In the thread
+            start_cpu = time.thread_time()
+            try:
+                is_complete = writeNormalizedVCF(input_vcf, process_output, targets, aborted)
+            except Exception:
+                if os.path.exists(process_output):
+                    os.remove(process_output)
+                raise
+            finally:
+                if os.path.exists(process_output + ".tbi"):
+                    os.remove(process_output + ".tbi")
+            if not is_complete:  # Stopped by the failure of another normalization
+                os.remove(process_output)
+                return None
+            process_cpu = time.thread_time() - start_cpu
+        else:
+            process_cpu = 0.0
+            try:  # Wait and get the CPU time of the process
+                pid, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                process_cpu = usage.ru_utime + usage.ru_stime
+            except ChildProcessError:  # Already waited by a kill
+                process.wait()
+            with lock:
+                del running_by_input[input_vcf]
+            if process.returncode != 0:
+                if os.path.exists(process_output):
+                    os.remove(process_output)
+                raise subprocess.CalledProcessError(process.returncode, process.args)
+        os.replace(process_output, target_vcf)
+        if target_vcf != output_vcf:  # Stored in cache
+            link_or_copy(cached_vcf, output_vcf)
+            if cache_max_size is not None:
+                evict_normalization_cache(cache_dir, cache_max_size)
+        report(f"Normalization complete for file: {input_vcf} -> {output_vcf} ({time.time() - start_time:.1f}s)")
+        with lock:
+            metrics.addNormalization(input_vcf, time.time() - start_time, process_cpu, cache_status)
         return output_vcf
-    except subprocess.CalledProcessError as e:
-        # Log an error message if the normalization fails
-        logging.error(f"Error normalizing VCF file {input_vcf}: {e}")
-        print(f"Error during normalization: {e}")
-        sys.exit(1)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    try:
+        if targets is not None and NORMALIZER != "internal":
+            fd_targets, targets_bed = tempfile.mkstemp(suffix=".bed")
+            with os.fdopen(fd_targets, "w") as FH_targets:
+                FH_targets.write(targets.toBED())
+        with metrics.phase("normalization"), ThreadPoolExecutor(max_workers=nb_jobs) as executor:
+            future_by_input = {curr_in: executor.submit(normalize, curr_in) for curr_in in inputs_vcf}
+            done, not_done = wait(future_by_input.values(), return_when=FIRST_EXCEPTION)
+            for curr_in, future in future_by_input.items():
+                if future in done and future.exception() is not None:
+                    # Fail fast: stop the siblings normalizations
+                    aborted.set()
+                    for sibling in not_done:
+                        sibling.cancel()
+                    with lock:
+                        for process in running_by_input.values():
+                            process.kill()
+                    exitNormalizationError(curr_in, future.exception())
+    finally:
+        if targets_bed is not None:
+            os.remove(targets_bed)
+    return [future_by_input[curr_in].result() for curr_in in inputs_vcf]
+
+def redirectWarnings(error_log):
+    """
+    Redirect warnings to the error log.
+
+    :param error_log: File handle where the warnings are written.
+    :type error_log: file
+    :return: The previous function used to display warnings.
+    :rtype: function
+    """
+    default_showwarning = warnings.showwarning
+
+    def custom_showwarning(message, category, filename, lineno, file=None, line=None):
+        error_log.write(f"WARNING: {message}, {category.__name__}, {filename}, {lineno}\n")
+
+    warnings.showwarning = custom_showwarning
+    return default_showwarning
 
 def is_complex_variant(record): # JC
     """
@@ -78,12 +1157,16 @@ def update_rs_id(record): # JC : add rs at the ID column
                 record.id = id_part
                 break
 
-def getNewHeaderAttr(args):
+def getNewHeaderAttr(args, previous_header=None, first_idx=0):
     """
     Return renamed and new VCFHeader elements for the merged VCF.
 
     :param args: The script's parameters.
     :type args: NameSpace
+    :param previous_header: VCFHeader elements of a previous merge of the callers before first_idx. These elements are extended with the elements of the following callers. None to build the elements from all the callers.
+    :type previous_header: dict
+    :param first_idx: Index of the first caller added to previous_header.
+    :type first_idx: int
     :return: VCFHeader elements (filter, info, format, samples).
     :rtype: dict
     """
@@ -95,6 +1178,10 @@ def getNewHeaderAttr(args):
             )
         )
     }
+    if args.reconcile_overlaps:
+        final_info["DECSRC"] = HeaderInfoAttr(
+            "DECSRC", type="String", number=".", description="Variant callers where the variant is identified in decomposed form (SNVs removed by the reconciliation of overlapping variants)."
+        )
     final_format = {
         "AD": HeaderFormatAttr("AD", type="Integer", number="A", description="Allele Depth"),
         "DP": HeaderFormatAttr("DP", type="Integer", number="1", description="Total Depth"),
@@ -102,7 +1189,14 @@ def getNewHeaderAttr(args):
         "DPSRC": HeaderFormatAttr("DPSRC", type="Integer", number=".", description="Total Depth by source")
     }
     final_samples = None
+    if previous_header is not None:
+        final_filter = dict(previous_header["filter"])
+        final_info = {**previous_header["info"], **final_info}
+        final_format = dict(previous_header["format"])
+        final_samples = previous_header["samples"]
     for idx_in, curr_in in enumerate(args.inputs_variants):
+        if idx_in < first_idx:
+            continue
         with VCFIO(curr_in) as FH_vcf:
             # Samples
             if final_samples is None:
@@ -149,6 +1243,7 @@ def getNewHeaderAttr(args):
             # final_info[qual_tag] = HeaderInfoAttr(qual_tag, type="Float", number="1", description="The variant quality", source=args.calling_sources[idx_in])
             # end removed
             # FORMAT
+            caller_regex = re.compile(rf'{args.calling_sources[idx_in]}')
             for tag, data in FH_vcf.format.items():
                 # Rename FORMAT
                 # modif david 26/03/2021
@@ -161,7 +1256,7 @@ def getNewHeaderAttr(args):
                 # if tag in final_format:
                 new_tag = "s{}_{}".format(idx_in, tag)
                 data.id = new_tag
-                if not re.search(rf'{args.calling_sources[idx_in]}', data.description):
+                if not caller_regex.search(data.description):
                     data.description += ', {}'.format(args.calling_sources[idx_in])
                 final_format[new_tag] = data
             # print(final_format)
@@ -172,315 +1267,2564 @@ def getNewHeaderAttr(args):
         "samples": final_samples
     }
 
-def getMergedRecords(inputs_variants, calling_sources, annotations_field, shared_filters, prioritize):
+class CallerAdapter:
     """
-    Merge VCFRecords coming from several variant callers.
+    Extract genotype, alternative allele depth and depth of the samples from the records of a variant caller.
 
-    :param inputs_variants: Pathes to the variants files.
-    :type inputs_variants: list
-    :param calling_sources: Names of the variants callers (in same order as inputs_variants).
-    :type calling_sources: list
-    :param annotations_field: Field used to store annotations.
-    :type annotations_field: str
-    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
-    :type shared_filters: set
-    :param prioritize: Whether to prioritize complex variants over simple variants.
-    :type prioritize: bool
-    :return: Merged VCF records.
-    :rtype: list
+    This generic adapter uses anacore.vcf.VCFRecord.getAltAD and getDP. The sub-classes manage the particularities of variant callers, they are registered by registerCallerAdapter and selected once by input with getCallerAdapter.
     """
-    variant_by_name = {}
-    error_log = open("error_records.log", "w")  # Log
+    name = "generic"
+    aliases = []  # Calling sources names (case insensitive) selecting the adapter
+    header_patterns = []  # Regular expressions recognizing the caller from header lines (case insensitive)
+    header_regexes = []  # Compiled header_patterns (set by registerCallerAdapter)
 
+    def __init__(self, FH_in):
+        """
+        Build and return an instance of CallerAdapter.
 
-    # JC : Redirect warnings to error log
-    def custom_showwarning(message, category, filename, lineno, file=None, line=None):
-        error_log.write(f"WARNING: {message}, {category.__name__}, {filename}, {lineno}\n")
+        :param FH_in: The caller VCF file.
+        :type FH_in: anacore.vcf.VCFIO
+        :return: The new instance.
+        :rtype: CallerAdapter
+        """
+        self.samples = FH_in.samples
 
-    warnings.showwarning = custom_showwarning
+    @classmethod
+    def matchesName(cls, caller_name):
+        """
+        Return True if the calling source name corresponds to the caller.
 
-    for idx_in, curr_in in enumerate(inputs_variants):
-        curr_caller = calling_sources[idx_in]
-
-        # JC : Normalize the VCF file to ensure multi-allelic sites are split.
-        normalized_vcf = normalize_vcf(curr_in, f"{curr_in}.normalized.vcf.gz")
-        
-        with VCFIO(normalized_vcf) as FH_in:  # Use the normalized VCF file for further processing.
-            log.info("Process {}".format(curr_caller))
-            record_counter = 0  # 5 records printed per caller for debug use
-            for record in FH_in:
-                variant_name = record.getName()
-                # Extract AD and DP
-                support_by_spl = {}
-                try:
-                    for spl in FH_in.samples:
-                        # JC : Special handling for FreeBayes format
-                        if curr_caller.lower() == "freebayes":
-                            gt = record.samples[spl]["GT"]
-                            dp = record.samples[spl]["DP"]
-                            ad = record.samples[spl]["AD"]
-                            
-                            if isinstance(dp, list):
-                                dp = dp[0]  # Assuming first value is the one we need
-                            if isinstance(ad, list):
-                                ad = ad[0]  # SAme here
-
-                            # JC : Print extracted values for validation and debug
-                            #if record_counter < 5:
-                                #print(f"FreeBayes - Variant: {variant_name}, Sample: {spl}, GT: {gt}, DP: {dp}, AD: {ad}")
-
-                            support_by_spl[spl] = {
-                                "AD": int(ad),
-                                "DP": int(dp),
-                                "GT": gt
-                            }
-                        elif curr_caller.lower() == "strelka2":
-                            # Extract GT, DP, and AD from the sample fields
-                            sample_values = record.samples[spl]
-                            gt = sample_values["GT"]
-                            # ONLY FOR STRELKA2 : use DP if available, otherwise fallback to DPI
-                            dp = sample_values.get("DP", sample_values.get("DPI", None))
-                            ad = sample_values["AD"]
-
-                            if isinstance(dp, list):
-                                dp = dp[0]  # Assuming first value is the one we need
-                            if isinstance(ad, list):
-                                ad = ad[0]  # Assuming first value is the one we need
-
-                            # JC : Print extracted values for validation
-                            #if record_counter < 5:
-                                #print(f"Strelka2 - Variant: {variant_name}, Sample: {spl}, GT: {gt}, DP: {dp}, AD: {ad}")
-
-                            support_by_spl[spl] = {
-                                "AD": int(ad),
-                                "DP": int(dp),
-                                "GT": gt
-                            }
-                        else:
-                            support_by_spl[spl] = {
-                                "AD": record.getAltAD(spl)[0],
-                                "DP": record.getDP(spl),
-                                "GT": record.samples[spl]["GT"]
-                            }
-                    record_counter += 1
-                except Exception as e:
-                    error_log.write(f"Error processing {variant_name} in {curr_caller}: {str(e)}\n")
-                    error_log.write(f"{curr_caller} - Error details: {record.samples[spl]}\n")
-                    continue
-		# JC : end of the modification
-                # Rename filters
-                if record.filter is not None:
-                    new_filter = []
-                    for tag in record.filter:
-                        if tag != "PASS":
-                            if tag in shared_filters:  # Rename filters not based on caller
-                                new_filter.append(tag)
-                            else:
-                                new_filter.append("s{}_{}".format(idx_in, tag))
-                    record.filter = new_filter
-                # Rename INFO
-                new_info = {}
-                for key, val in record.info.items():
-                    if key == annotations_field:
-                        new_info[key] = val
-                    else:
-                        new_info["s{}_{}".format(idx_in, key)] = val
-                record.info = new_info
-                # Backup quality
-                if record.qual is not None:
-                    record.info["s{}_VCQUAL".format(idx_in)] = record.qual
-                # Rename FORMAT
-                # modif david 16/03/2021
-                # for s0 or 1st occurence of format we want a double value with and without prefix
-                if variant_name not in variant_by_name:
-                    record.format = [curr_filter for curr_filter in record.format]
-                    record.format += ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
-                else:
-                    record.format = ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
-                # genuine record.format = ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
-                # end modif david
-                for spl_name, spl_info in record.samples.items():
-                    renamed_info = {}
-                    for key, val in spl_info.items():
-                        # Rename FORMAT
-                        # modif david 16/03/2021
-                        # for s0 or 1st occurence of format we want a double value with and without prefix
-                        if key not in renamed_info:
-                            renamed_info[key] = val
-                        renamed_info["s{}_{}".format(idx_in, key)] = val
-                        # genuine renamed_info["s{}_{}".format(idx_in, key)] = val
-                        # end modif david
-                    record.samples[spl_name] = renamed_info
-
-                # Add to storage
-                if variant_name not in variant_by_name:
-                    if record.samples[spl_name]['GT'] != '0/0':
-                        update_rs_id(record) # JC
-                        variant_by_name[variant_name] = record
-                        # Data source
-                        record.info["SRC"] = [curr_caller]
-                        # Quality
-                        if idx_in != 0:
-                            record.qual = None  # For consistency, the quality of the variant comes only from the first caller of the variant
-                        # AD and DP by sample (from the first caller finding the variant: callers are in user order)
-                        # david removed as it is placed before GT and gatk combinevariant complains
-                        #record.format.insert(0, "ADSRC")
-                        #record.format.insert(0, "DPSRC")
-                        # end removed
-                        # david removed as we already have them
-                        # record.format.insert(0, "AD")
-                        # record.format.insert(0, "DP")
-                        # end removed
-                        # david removed as now useless
-                        # for spl_name, spl_data in record.samples.items():
-                        # end removed
-                            # david removed as we already have them
-                            # spl_data["AD"] = [support_by_spl[spl_name]["AD"]]
-                            # spl_data["DP"] = support_by_spl[spl_name]["DP"]
-                            # end removed
-                            # david removed as it is placed before GT and gatk combinevariant complains
-                            # spl_data["ADSRC"] = [support_by_spl[spl_name]["AD"]]
-                            # spl_data["DPSRC"] = [support_by_spl[spl_name]["DP"]]
-                            # end removed
-                else:
-                    if record.samples[spl_name]['GT'] != '0/0':
-                        prev_variant = variant_by_name[variant_name]
-                        prev_variant.info["SRC"].append(curr_caller)
-                        # JC : Prioritize complex variants when -p
-                        if prioritize and is_complex_variant(record) and not is_complex_variant(prev_variant):
-                            variant_by_name[variant_name] = record
-                            prev_variant = record
-                        # IDs
-                        if record.id is not None:
-                            prev_ids = prev_variant.id.split(";") if prev_variant.id else [] # JC : 
-                            prev_ids.extend(record.id.split(";"))
-                            prev_ids = sorted(list(set(prev_ids)))
-                            prev_variant.id = ";".join(prev_ids)
-                        # FILTERS
-                        if record.filter is not None:
-                            if prev_variant.filter is None:
-                                prev_variant.filter = record.filter
-                            else:
-                                prev_variant.filter = list(set(prev_variant.filter) or set(record.filter))
-                        # FORMAT
-                        prev_variant.format.extend(record.format)
-                        # INFO
-                        prev_variant.info.update(record.info)
-                        for spl_name, spl_data in prev_variant.samples.items():
-                            spl_data.update(record.samples[spl_name])
-                            # david removed as it is placed before GT and gatk combinevariant complains
-                            # spl_data["ADSRC"].append(support_by_spl[spl_name]["AD"])
-                            # spl_data["DPSRC"].append(support_by_spl[spl_name]["DP"])
-                            # end removed
-                        update_rs_id(prev_variant)
-
-                        # Traitement des ID pour s'assurer que les ID sont correctement définis en tant que "rs..."
-                        if prev_variant.id is None or prev_variant.id == ".":
-                            for key, val in record.info.items():
-                                if key.startswith('rs'):
-                                    prev_variant.id = key
-                                    break
+        :param caller_name: The calling source name.
+        :type caller_name: str
+        :return: True if the calling source name corresponds to the caller.
+        :rtype: bool
+        """
+        return caller_name.lower() in {name.lower() for name in cls.aliases}
 
-    return variant_by_name.values()
-    error_log.close() # JC
+    @classmethod
+    def matchesHeader(cls, FH_in):
+        """
+        Return True if the VCF header has been produced by the caller.
+
+        :param FH_in: The caller VCF file.
+        :type FH_in: anacore.vcf.VCFIO
+        :return: True if the VCF header has been produced by the caller.
+        :rtype: bool
+        """
+        for regex in cls.header_regexes:
+            for header_line in FH_in.extra_header:
+                if regex.search(header_line):
+                    return True
+        return False
+
+    def extract(self, record, spl):
+        """
+        Return genotype, alternative allele depth and depth of the sample. When the sample does not contain the fields required to retrieve them, the support is None and the reason is returned (ex: "missing AD"). The other problems raise an exception.
 
-def logACVariance(variants, log):
+        :param record: The VCF record.
+        :type record: VCFRecord
+        :param spl: The sample name.
+        :type spl: str
+        :return: Support of the variant in sample ({"AD": int, "DP": int, "GT": str}) or None and reason why the support cannot be retrieved or None.
+        :rtype: (dict, str)
+        """
+        spl_data = record.samples[spl]
+        if "GT" not in spl_data:
+            return None, "missing GT"
+        is_population = len(record.samples) == 1
+        has_DP = "DP" in spl_data or (is_population and "DP" in record.info)
+        has_AF = "AF" in spl_data or (is_population and "AF" in record.info)
+        if "AD" not in spl_data and not (is_population and "AD" in record.info) and not (has_AF and has_DP):
+            return None, "missing AD"
+        if not has_DP and not ("AD" in spl_data and ("AF" in spl_data or len(record.getAD(spl)) == len(record.alt) + 1)):
+            return None, "missing DP"
+        return {
+            "AD": record.getAltAD(spl)[0],
+            "DP": record.getDP(spl),
+            "GT": spl_data["GT"]
+        }, None
+
+
+CALLER_ADAPTERS = []  # Registered sub-classes of CallerAdapter. The last registered has priority.
+
+
+def registerCallerAdapter(adapter_class):
     """
-    Display in log the variance on allele counts (AD and AF) between callers.
+    Register an adapter. This function can be used as class decorator.
 
-    :param variants: Merged VCF records.
-    :type variants: list
-    :param log: Logger object.
-    :type log: logging.Logger
+    :param adapter_class: The adapter class.
+    :type adapter_class: CallerAdapter sub-class
+    :return: The adapter class.
+    :rtype: CallerAdapter sub-class
     """
-    diff_AD = []
-    diff_AF = []
-    nb_var = 0
-    for record in variants:
-        if len(record.info["SRC"]) > 1:
-            nb_var += 1
-            for spl_name, spl_data in record.samples.items():
-                # AD
-                retained_AD = spl_data["AD"][0]
-                max_diff = 0
-                for curr_AD in spl_data["ADSRC"][1:]:
-                    max_diff = max(max_diff, abs(retained_AD - curr_AD))
-                diff_AD.append(max_diff)
-                # AF
-                AF = [AD / DP for AD, DP in zip(spl_data["ADSRC"], spl_data["DPSRC"])]
-                retained_AF = AF[0]
-                max_diff = 0
-                for curr_AF in AF[1:]:
-                    max_diff = max(max_diff, abs(retained_AF - curr_AF))
-                diff_AF.append(max_diff)
-    # Log
-    if nb_var == 0:
-        log.info("Differences between retained AF and others callers (without missing): 0 common variants")
-        log.info("Differences between retained AD and others callers (without missing): 0 common variants")
-    else:
-        log.info("Differences between retained AF and others callers (without missing): median={:.1%}, upper_quartile={:.1%}, 90_persentile={:.1%} and max={:.1%} on {} variants".format(
-            numpy.percentile(diff_AF, 50, interpolation='midpoint'),
-            numpy.percentile(diff_AF, 75, interpolation='midpoint'),
-            numpy.percentile(diff_AF, 90, interpolation='midpoint'),
-            max(diff_AF),
-            nb_var
-        ))
-        log.info("Differences between retained AD and others callers (without missing): median={}, upper_quartile={}, 90_persentile={} and max={} on {} variants".format(
-            int(numpy.percentile(diff_AD, 50, interpolation='midpoint')),
-            int(numpy.percentile(diff_AD, 75, interpolation='midpoint')),
-            int(numpy.percentile(diff_AD, 90, interpolation='midpoint')),
-            max(diff_AD),
-            nb_var
-        ))
+    adapter_class.header_regexes = [re.compile(pattern, re.IGNORECASE) for pattern in adapter_class.header_patterns]
+    CALLER_ADAPTERS.append(adapter_class)
+    return adapter_class
 
+def loadCallerAdapters(path):
+    """
+    Load the adapters registered in a python file. CallerAdapter and registerCallerAdapter are available in the file without import.
 
-########################################################################
-#
-# MAIN
-#
-########################################################################
-if __name__ == "__main__":
-    # Manage parameters
-    parser = argparse.ArgumentParser(description='Merge VCF coming from different calling on same sample(s). It is strongly recommended to apply this script after standardization and before annotation and filtering/tagging.')
-    parser.add_argument('-a', '--annotations-field', default="ANN", help='Field used to store annotations. [Default: %(default)s]')
-    parser.add_argument('-s', '--shared-filters', nargs='*', default=["lowAF", "OOT", "homoP", "popAF", "CSQ", "ANN.COLLOC", "ANN.RNA", "ANN.CSQ", "ANN.popAF"], help='Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix. [Default: %(default)s]')
-    parser.add_argument('-c', '--calling-sources', required=True, nargs='+', help='Name of the source in same order of --inputs-variants.')
-    parser.add_argument('-p', '--prioritize', action='store_true', help='Prioritize complex variants over simple variants at the same position.') # JC
-    group_input = parser.add_argument_group('Inputs')  # Inputs
-    group_input.add_argument('-i', '--inputs-variants', required=True, nargs='+', help='Path to the variants files coming from different callers (format: VCF). The order determine the which AF and AD are retained: the first caller where it is found in this list.')
-    group_output = parser.add_argument_group('Outputs')  # Outputs
-    group_input.add_argument('-o', '--output-variants', required=True, help='Path to the merged variants file (format: VCF).')
-    args = parser.parse_args()
-    args.shared_filters = set(args.shared_filters)
+    :param path: Path to the python file.
+    :type path: str
+    """
+    runpy.run_path(path, init_globals={"CallerAdapter": CallerAdapter, "registerCallerAdapter": registerCallerAdapter})
 
-    # Logger
-    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
-    log = logging.getLogger(os.path.basename(__file__))
-    log.setLevel(logging.INFO)
-    log.info("Command: " + " ".join(sys.argv))
-
-    # Get merged records
-    variants = getMergedRecords(args.inputs_variants, args.calling_sources, args.annotations_field, args.shared_filters, args.prioritize)
-
-    # david removed as it is requires ADSRC and removed
-    # Log differences in AF and AD
-    # logACVariance(variants, log)
-    # end removed
-
-    # Write
-    with VCFIO(args.output_variants, "w") as FH_out:
-        # Header
-        new_header = getNewHeaderAttr(args)
-        FH_out.samples = new_header["samples"]
-        FH_out.info = new_header["info"]
-        FH_out.format = new_header["format"]
-        FH_out.filter = new_header["filter"]
-        FH_out.writeHeader()
-        # Records
-        for record in sorted(variants, key=lambda record: (record.chrom, record.refStart(), record.refEnd())):
-            if record.filter is not None and len(record.filter) == 0:
-                record.filter = ["PASS"]
-            FH_out.write(record)
-    if os.path.getsize("error_records.log") > 0:
-        print("There are some variants that require your attention. Please check error_records.log for warnings or errors that occurred during processing.") # JC
-    log.info("End of job")
\ No newline at end of file
+def getCallerAdapter(caller_name, FH_in):
+    """
+    Return the adapter for the input: the adapter corresponding to the calling source name, otherwise the adapter recognizing the header (reported as warning), otherwise the generic adapter.
+
+    :param caller_name: The calling source name.
+    :type caller_name: str
+    :param FH_in: The caller VCF file.
+    :type FH_in: anacore.vcf.VCFIO
+    :return: The adapter.
+    :rtype: CallerAdapter
+    """
+    for adapter_class in reversed(CALLER_ADAPTERS):
+        if adapter_class.matchesName(caller_name):
+            return adapter_class(FH_in)
+    for adapter_class in reversed(CALLER_ADAPTERS):
+        if adapter_class.matchesHeader(FH_in):
+            log.warning("The calling source {} does not correspond to a caller adapter: the adapter {} is selected from the VCF header.".format(caller_name, adapter_class.name))
+            return adapter_class(FH_in)
+    return CallerAdapter(FH_in)
+
+
+@registerCallerAdapter
+class FreeBayesAdapter(CallerAdapter):
+    """Adapter for FreeBayes: AD and DP are read directly from the sample fields."""
+    name = "FreeBayes"
+    aliases = ["freebayes"]
+    header_patterns = [r"^##source=freeBayes"]
+
+    def getDepth(self, spl_data):
+        return spl_data.get("DP")
+
+    def extract(self, record, spl):
+        spl_data = record.samples[spl]
+        if "GT" not in spl_data:
+            return None, "missing GT"
+        dp = self.getDepth(spl_data)
+        ad = spl_data.get("AD")
+        if isinstance(dp, list):
+            dp = dp[0]  # Assuming first value is the one we need
+        if isinstance(ad, list):
+            ad = ad[0]  # SAme here
+        if ad is None:
+            return None, "missing AD"
+        if dp is None:
+            return None, "missing DP"
+        return {
+            "AD": int(ad),
+            "DP": int(dp),
+            "GT": spl_data["GT"]
+        }, None
+
+@registerCallerAdapter
+class Strelka2Adapter(FreeBayesAdapter):
+    """Adapter for Strelka2: AD is read directly from the sample fields and DP falls back to DPI for indels."""
+    name = "Strelka2"
+    aliases = ["strelka2"]
+    header_patterns = [r"^##source=strelka"]
+
+    def getDepth(self, spl_data):
+        # ONLY FOR STRELKA2 : use DP if available, otherwise fallback to DPI
+        return spl_data.get("DP", spl_data.get("DPI", None))
+
+@registerCallerAdapter
+class HaplotypeCallerAdapter(CallerAdapter):
+    """Adapter for GATK HaplotypeCaller (AD for reference and alternative alleles and DP)."""
+    name = "HaplotypeCaller"
+    aliases = ["haplotypecaller", "gatk"]
+    header_patterns = [r"^##GATKCommandLine.*=<ID=HaplotypeCaller", r"^##source=HaplotypeCaller"]
+
+@registerCallerAdapter
+class DeepVariantAdapter(CallerAdapter):
+    """Adapter for DeepVariant (AD for reference and alternative alleles and DP)."""
+    name = "DeepVariant"
+    aliases = ["deepvariant"]
+    header_patterns = [r"^##DeepVariant_version="]
+
+@registerCallerAdapter
+class Mutect2Adapter(CallerAdapter):
+    """Adapter for GATK Mutect2 (AD for reference and alternative alleles and DP)."""
+    name = "Mutect2"
+    aliases = ["mutect2"]
+    header_patterns = [r"^##GATKCommandLine.*=<ID=Mutect2", r"^##source=Mutect2"]
+
+@registerCallerAdapter
+class VarDictAdapter(CallerAdapter):
+    """Adapter for VarDict (AD for reference and alternative alleles and DP)."""
+    name = "VarDict"
+    aliases = ["vardict", "vardictjava"]
+    header_patterns = [r"^##source=VarDict"]
+
+
+def decodeInfoField(info_attr, raw_value):
+    """
+    Return the typed value of an INFO field as anacore.vcf.VCFIO does. None is returned for the missing values excluded by VCFIO.
+
+    :param info_attr: The header description of the field.
+    :type info_attr: anacore.vcf.HeaderInfoAttr
+    :param raw_value: The value in VCF (True for flag).
+    :type raw_value: str | bool
+    :return: The typed value.
+    :rtype: *
+    """
+    if raw_value is True:  # Flag
+        return True
+    if info_attr._number == 1:  # The field contains an unique value
+        if raw_value == ".":
+            return None
+        value = info_attr._type(raw_value)
+        return decodeInfoValue(value) if info_attr.type == "String" else value
+    # The field contains a list
+    if raw_value == "":
+        return []
+    if raw_value == ".":
+        return None
+    if info_attr.type == "String":
+        return [decodeInfoValue(info_attr._type(elt)) for elt in raw_value.split(",")]
+    return [info_attr._type(elt) for elt in raw_value.split(",")]
+
+def decodeFormatField(format_attr, raw_value, nb_alt):
+    """
+    Return the typed value of a sample field as anacore.vcf.VCFIO does.
+
+    :param format_attr: The header description of the field.
+    :type format_attr: anacore.vcf.HeaderFormatAttr
+    :param raw_value: The value in VCF.
+    :type raw_value: str
+    :param nb_alt: Number of alternative alleles in record.
+    :type nb_alt: int
+    :return: The typed value.
+    :rtype: *
+    """
+    if format_attr._number is None or format_attr._number > 1:  # Value is list
+        if raw_value == ".":  # Value is None in VCF
+            if format_attr.number == "A":
+                return [None for idx in range(nb_alt)]
+            if format_attr.number == "R":
+                return [None for idx in range(nb_alt + 1)]
+            if format_attr._number is not None:
+                return [None for idx in range(format_attr._number)]
+            return [None]
+        value = []
+        for elt in raw_value.split(","):
+            if elt == ".":
+                value.append(None)
+            elif format_attr.type == "String":
+                value.append(decodeInfoValue(format_attr._type(elt)))
+            else:
+                value.append(format_attr._type(elt))
+        return value
+    if format_attr._number == 1:  # Value is not a list
+        if raw_value == ".":
+            return None
+        value = format_attr._type(raw_value)
+        return decodeInfoValue(value) if format_attr.type == "String" else value
+    return True  # Number == 0
+
+
+class RawValue(str):
+    """Value of INFO field kept as written in the caller VCF."""
+    __slots__ = ()
+
+
+class LazySample(Mapping):
+    """Fields of one sample in a LazyRecord. The values are kept as raw strings and they are decoded on access."""
+    __slots__ = ("raw_fields", "_record")
+
+    def __init__(self, record, raw_cell):
+        """
+        Build and return an instance of LazySample.
+
+        :param record: The record containing the sample.
+        :type record: LazyRecord
+        :param raw_cell: The sample column.
+        :type raw_cell: str
+        :return: The new instance.
+        :rtype: LazySample
+        """
+        self._record = record
+        self.raw_fields = {} if record.raw_format is None else dict(zip(record.raw_format, raw_cell.split(":")))
+
+    def __getitem__(self, key):
+        return decodeFormatField(self._record.header.format[key], self.raw_fields[key], len(self._record.alt))
+
+    def __contains__(self, key):
+        return key in self.raw_fields
+
+    def __iter__(self):
+        return iter(self.raw_fields)
+
+    def __len__(self):
+        return len(self.raw_fields)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class LazyInfo(Mapping):
+    """Typed view on the INFO of a LazyRecord before renaming. The values are decoded on access."""
+    __slots__ = ("_record",)
+
+    def __init__(self, record):
+        self._record = record
+
+    def __getitem__(self, key):
+        value = decodeInfoField(self._record.header.info[key], self._record.info[key])
+        if value is None:  # Missing value are excluded by VCFIO
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (key for key in self._record.info if key in self)
+
+    def __contains__(self, key):
+        if key not in self._record.info:
+            return False
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+
+class LazyRecord:
+    """
+    Compact record used by the lazy merge. The INFO values are kept as raw strings and the samples columns are split and decoded only when they are needed (extraction of AD/DP/GT, merge of several callers). A record found by only one caller is written from its raw samples columns.
+
+    The methods getName, getAD, getAltAD, getAF, getAltAF, getDP, refStart and refEnd are the same as in anacore.vcf.VCFRecord.
+    """
+    __slots__ = (
+        "chrom", "pos", "id", "ref", "alt", "qual", "filter", "info", "format",
+        "header", "raw_format", "_raw_samples", "_samples", "_tokens", "_format_table", "_is_first", "_coord", "_line"
+    )
+
+    def __init__(self, header, line):
+        """
+        Build and return an instance of LazyRecord.
+
+        :param header: The VCF file containing the record (used for fields types).
+        :type header: LazyVCFIO
+        :param line: The VCF line.
+        :type line: str
+        :return: The new instance.
+        :rtype: LazyRecord
+        """
+        fields = line.rstrip("\r\n").split("\t")
+        self.header = header
+        self.chrom = fields[0]
+        self.pos = int(fields[1])
+        self.id = fields[2]
+        self.ref = fields[3]
+        self.alt = fields[4].split(",")
+        self.qual = float(fields[5]) if fields[5] != "." else None
+        self.filter = fields[6].split(";") if fields[6] != "." and fields[6] != "" else []
+        self.info = {}
+        if len(fields) >= 8 and fields[7] != ".":
+            for tag_and_value in fields[7].split(";"):
+                if "=" not in tag_and_value:  # Flag
+                    self.info[tag_and_value] = True
+                else:
+                    tag, value = tag_and_value.split("=", 1)
+                    self.info[tag] = RawValue(value)
+        self.format = None
+        if len(fields) >= 9:
+            self.format = fields[8].split(":") if fields[8] != "." else None
+        self.raw_format = self.format
+        self._raw_samples = fields[9:]
+        self._samples = None
+        self._tokens = None
+        self._format_table = None
+        self._is_first = True
+        self._coord = None
+        self._line = line if self.alt[0].startswith("<") else None  # Symbolic alleles coordinates depend on INFO
+
+    @property
+    def samples(self):
+        """
+        Return the fields by sample. The values are decoded on access.
+
+        :return: Fields by sample.
+        :rtype: dict
+        """
+        if self._samples is None:
+            self._samples = {spl: LazySample(self, cell) for spl, cell in zip(self.header.samples, self._raw_samples)}
+        return self._samples
+
+    @property
+    def sample_tokens(self):
+        """
+        Return the renamed raw fields by sample (the unprefixed tags are kept for the first occurrence of the variant). They are built on first access and updated by the merge.
+
+        :return: Raw fields by sample.
+        :rtype: dict
+        """
+        if self._tokens is None:
+            self._tokens = {}
+            for spl_name, spl_data in self.samples.items():
+                renamed_info = {}
+                for key, val in spl_data.raw_fields.items():
+                    if key not in renamed_info:
+                        renamed_info[key] = val
+                    renamed_info[self._format_table[key]] = val
+                self._tokens[spl_name] = renamed_info
+        return self._tokens
+
+    def renameSamples(self, format_table, is_first):
+        """
+        Set the renaming of samples fields. The fields are renamed when they are written or merged.
+
+        :param format_table: New name by FORMAT tag.
+        :type format_table: dict
+        :param is_first: True if it is the first occurrence of the variant in merged records.
+        :type is_first: bool
+        """
+        self._format_table = format_table
+        self._is_first = is_first
+
+    def compact(self):
+        """Release the split samples fields. They are split again from the raw columns if they are needed."""
+        self._samples = None
+
+    def toVCFRecord(self):
+        """
+        Return the anacore.vcf.VCFRecord corresponding to the raw record (before renaming).
+
+        :return: The record.
+        :rtype: anacore.vcf.VCFRecord
+        """
+        if self._line is not None:
+            return parseVCFLine(self.header, self._line)
+        return VCFRecord(self.chrom, self.pos, self.id, self.ref, list(self.alt))
+
+    def _typedView(self):
+        return LazyTypedView(self)
+
+    def getAD(self, spl_name):
+        return self._typedView().getAD(spl_name)
+
+    def getAltAD(self, spl_name):
+        return self._typedView().getAltAD(spl_name)
+
+    def getAF(self, spl_name):
+        return self._typedView().getAF(spl_name)
+
+    def getAltAF(self, spl_name):
+        return self._typedView().getAltAF(spl_name)
+
+    def getDP(self, spl_name):
+        return self._typedView().getDP(spl_name)
+
+    getName = VCFRecord.getName
+
+    def refStart(self):
+        if self._coord is None:
+            coord_record = self.toVCFRecord()
+            self._coord = (coord_record.refStart(), coord_record.refEnd())
+        return self._coord[0]
+
+    def refEnd(self):
+        self.refStart()
+        return self._coord[1]
+
+    def toVCFLine(self):
+        """
+        Return the record in VCF format. INFO and samples values coming from callers are written as they are in callers VCF.
+
+        :return: The VCF line.
+        :rtype: str
+        """
+        line = "\t".join([
+            self.chrom,
+            str(self.pos),
+            ("." if self.id is None else self.id),
+            self.ref,
+            ",".join(self.alt),
+            ("." if self.qual is None else str(self.qual)),
+            ("." if len(self.filter) == 0 else ";".join(self.filter))
+        ])
+        # Info
+        if len(self.info) == 0:
+            line += "\t."
+        else:
+            info_fields = []
+            for key in sorted(self.info):
+                value = self.info[key]
+                if value is True:  # Flag
+                    info_fields.append(key)
+                elif isinstance(value, RawValue):
+                    info_fields.append(key + "=" + value)
+                elif isinstance(value, (list, tuple)):
+                    info_fields.append(key + "=" + ",".join([encodeInfoValue(str(elt)) for elt in value]))
+                else:
+                    info_fields.append(key + "=" + encodeInfoValue(str(value)))
+            line += "\t" + ";".join(info_fields)
+        # Format
+        if self.format is None:
+            line += "\t." * (1 + len(self.header.samples))
+        else:
+            line += "\t" + ":".join(self.format)
+            if self._tokens is None:  # Samples fields are written from raw columns
+                nb_fields = len(self.raw_format)
+                for cell in self._raw_samples:
+                    values = cell.split(":")
+                    if len(values) < nb_fields:  # Trailing missing fields
+                        values += ["." for idx in range(nb_fields - len(values))]
+                    cell = ":".join(values)
+                    line += "\t" + (cell + ":" + cell if self._is_first else cell)
+            else:
+                for spl_name in self.header.samples:
+                    spl_tokens = self._tokens[spl_name]
+                    line += "\t" + ":".join([spl_tokens.get(key, ".") for key in self.format])
+        return line
+
+
+class LazyTypedView:
+    """Typed view on a LazyRecord before renaming. It is used to compute AD, AF and DP with the methods of anacore.vcf.VCFRecord."""
+    __slots__ = ("chrom", "pos", "ref", "alt", "info", "samples")
+
+    def __init__(self, record):
+        self.chrom = record.chrom
+        self.pos = record.pos
+        self.ref = record.ref
+        self.alt = record.alt
+        self.info = LazyInfo(record)
+        self.samples = record.samples
+
+    getName = VCFRecord.getName
+    getAD = VCFRecord.getAD
+    getAltAD = VCFRecord.getAltAD
+    getAF = VCFRecord.getAF
+    getAltAF = VCFRecord.getAltAF
+    getDP = VCFRecord.getDP
+
+
+def parseVCFLine(FH_vcf, line):
+    """
+    Return the anacore.vcf.VCFRecord corresponding to the line.
+
+    :param FH_vcf: The VCF file containing the line (used for fields types).
+    :type FH_vcf: anacore.vcf.VCFIO
+    :param line: The VCF line.
+    :type line: str
+    :return: The record.
+    :rtype: anacore.vcf.VCFRecord
+    """
+    current_line = FH_vcf.current_line
+    FH_vcf.current_line = line
+    try:
+        return VCFIO._parseLine(FH_vcf)
+    finally:
+        FH_vcf.current_line = current_line
+
+
+class LazyVCFIO(VCFIO):
+    """Read VCF file in LazyRecord."""
+
+    def _parseLine(self):
+        """
+        Return a lazy record from the VCF current line.
+
+        :return: The variant described by the current line.
+        :rtype: LazyRecord
+        """
+        return LazyRecord(self, self.current_line)
+
+
+class VariantLinesReader:
+    """
+    Read the records of a VCF without the hom-ref, no-call and reference blocks lines. These lines are selected on the raw ALT and GT tokens before the record construction: they are not parsed. A line is dropped if its ALT is a reference block (<NON_REF> or <*>) or if the GT of all the samples contains only reference and missing alleles (ex: 0/0, 0|0, ./., 0).
+
+    With a normalizer, the lines read by iteration are normalized before the selection (see LineNormalizer).
+    """
+    REFERENCE_BLOCKS_ALT = {"<NON_REF>", "<*>"}
+
+    def __init__(self, FH_in, counts=None, normalizer=None):
+        """
+        Build and return an instance of VariantLinesReader.
+
+        :param FH_in: The VCF file. The records are parsed by this file.
+        :type FH_in: anacore.vcf.VCFIO
+        :param counts: Counters of the kept and dropped lines: {"kept": 0, "dropped": 0}. They are updated by the reading. None to keep all the lines.
+        :type counts: dict
+        :param normalizer: The normalizer applied on the lines of FH_in. None if FH_in is already normalized.
+        :type normalizer: LineNormalizer
+        :return: The new instance.
+        :rtype: VariantLinesReader
+        """
+        self.FH_in = FH_in
+        self.counts = counts
+        self.normalizer = normalizer
+        self._gt_idx_by_format = {}  # Index of GT by raw FORMAT (None without GT)
+
+    def __iter__(self):
+        lines = (line.rstrip("\n") for line in self.FH_in.file_handle)
+        lines = (line for line in lines if self.FH_in.isRecordLine(line))
+        if self.normalizer is not None:
+            lines = self.normalizer.iterLines(lines)
+        return self._iterRecords(lines)
+
+    def getSub(self, chrom, start, end, counted_start=None, counted_end=None):
+        """
+        Return generator on records overlapping the specified region (see anacore.vcf.VCFIO.getSub).
+
+        :param chrom: Chromosome name of the selected region.
+        :type chrom: str
+        :param start: Start of the selected region (1-based).
+        :type start: int
+        :param end: End of the selected region (1-based).
+        :type end: int
+        :param counted_start: Only the lines with POS greater or equal to this value are counted: the lines overlapping several regions are counted only once. None for no limit.
+        :type counted_start: int
+        :param counted_end: Only the lines with POS lower or equal to this value are counted. None for no limit.
+        :type counted_end: int
+        :return: Records overlapping the specified region.
+        :rtype: generator for anacore.vcf.VCFRecord
+        """
+        if chrom not in self.FH_in._index.contigs:
+            return iter([])
+        return self._iterRecords(self.FH_in._index.fetch(chrom, start - 1, end), counted_start, counted_end)
+
+    def isVariantLine(self, line):
+        """
+        Return True if the line is not a hom-ref, a no-call or a reference block.
+
+        :param line: The VCF record line.
+        :type line: str
+        :return: True if the line is not a hom-ref, a no-call or a reference block.
+        :rtype: bool
+        """
+        fields = line.split("\t")
+        if fields[4] in self.REFERENCE_BLOCKS_ALT:
+            return False
+        if len(fields) < 10:  # Without samples the genotype cannot be evaluated
+            return True
+        raw_format = fields[8]
+        if raw_format in self._gt_idx_by_format:
+            gt_idx = self._gt_idx_by_format[raw_format]
+        else:
+            format_tags = raw_format.split(":")
+            gt_idx = format_tags.index("GT") if "GT" in format_tags else None
+            self._gt_idx_by_format[raw_format] = gt_idx
+        if gt_idx is None:
+            return True
+        for spl_field in fields[9:]:
+            spl_tokens = spl_field.split(":", gt_idx + 1)
+            if len(spl_tokens) > gt_idx:
+                for allele in spl_tokens[gt_idx].replace("|", "/").split("/"):
+                    if allele != "0" and allele != ".":
+                        return True
+        return False
+
+    def _iterRecords(self, lines, counted_start=None, counted_end=None):
+        counts = self.counts
+        if counts is None:
+            for line in lines:
+                self.FH_in.current_line = line
+                yield self.FH_in._parseLine()
+            return
+        is_limited = counted_start is not None or counted_end is not None
+        for line in lines:
+            is_counted = True
+            if is_limited:
+                pos = int(line.split("\t", 2)[1])
+                is_counted = (counted_start is None or pos >= counted_start) and (counted_end is None or pos <= counted_end)
+            if self.isVariantLine(line):
+                if is_counted:
+                    counts["kept"] += 1
+                self.FH_in.current_line = line
+                yield self.FH_in._parseLine()
+            elif is_counted:
+                counts["dropped"] += 1
+
+
+class BGZFWriter:
+    """
+    Write text in BGZF format (blocked gzip used by tabix). The blocks are compressed in parallel by a pool of threads and written in order.
+
+    The position of the text written is returned by getPosition() as block index << 16 | offset in block. The compressed offset of each block is in block_offsets once the block is written, the position is converted in virtual offset with getVirtualOffset().
+    """
+
+    def __init__(self, filepath, nb_threads=1, level=6):
+        """
+        Build and return an instance of BGZFWriter.
+
+        :param filepath: Path to the output file.
+        :type filepath: str
+        :param nb_threads: Number of threads used to compress the blocks.
+        :type nb_threads: int
+        :param level: Compression level (see zlib).
+        :type level: int
+        :return: The new instance.
+        :rtype: BGZFWriter
+        """
+        self.file_handle = open(filepath, "wb")
+        self.level = level
+        self.block_offsets = [0]  # Compressed offset by block index. The last element is the offset of the next block.
+        self._buffer = bytearray()
+        self._nb_blocks = 0  # Number of blocks submitted to the compression
+        self._executor = ThreadPoolExecutor(max_workers=nb_threads)
+        self._pending = []  # Futures on compressed blocks in write order
+        self._max_pending = 4 * nb_threads
+
+    @staticmethod
+    def compressBlock(data, level):
+        """
+        Return the BGZF block corresponding to the data.
+
+        :param data: The uncompressed data (at most BGZF_BLOCK_SIZE bytes).
+        :type data: bytes
+        :param level: Compression level (see zlib).
+        :type level: int
+        :return: The BGZF block.
+        :rtype: bytes
+        """
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        return b"".join([
+            struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25),
+            cdata,
+            struct.pack("<II", zlib.crc32(data), len(data))
+        ])
+
+    def _writePending(self, nb_kept):
+        while len(self._pending) > nb_kept:
+            block = self._pending.pop(0).result()
+            self.file_handle.write(block)
+            self.block_offsets.append(self.block_offsets[-1] + len(block))
+
+    def _submitBlock(self, data):
+        self._nb_blocks += 1
+        self._pending.append(self._executor.submit(BGZFWriter.compressBlock, bytes(data), self.level))
+        self._writePending(self._max_pending)
+
+    def write(self, text):
+        """
+        Write text.
+
+        :param text: The text.
+        :type text: str
+        """
+        self.writeBytes(text.encode())
+
+    def writeBytes(self, data):
+        """
+        Write bytes.
+
+        :param data: The data.
+        :type data: bytes
+        """
+        self._buffer += data
+        if len(self._buffer) >= BGZF_BLOCK_SIZE:
+            nb_full = len(self._buffer) // BGZF_BLOCK_SIZE
+            for idx_block in range(nb_full):
+                self._submitBlock(self._buffer[idx_block * BGZF_BLOCK_SIZE:(idx_block + 1) * BGZF_BLOCK_SIZE])
+            del self._buffer[:nb_full * BGZF_BLOCK_SIZE]
+
+    def getPosition(self):
+        """
+        Return the position of the next written text.
+
+        :return: Block index << 16 | offset in the uncompressed block.
+        :rtype: int
+        """
+        return self._nb_blocks << 16 | len(self._buffer)
+
+    def getVirtualOffset(self, position):
+        """
+        Return the virtual offset (compressed offset of the block << 16 | offset in the uncompressed block) of a position returned by getPosition(). The block must be written.
+
+        :param position: Block index << 16 | offset in the uncompressed block.
+        :type position: int
+        :return: The virtual offset.
+        :rtype: int
+        """
+        return self.block_offsets[position >> 16] << 16 | position & 0xffff
+
+    def close(self):
+        """Write the last block and the end of file marker and close the file."""
+        if self.file_handle is not None:
+            if len(self._buffer) != 0:
+                self._submitBlock(self._buffer)
+                self._buffer = bytearray()
+            self._writePending(0)
+            self._executor.shutdown()
+            self.file_handle.write(BGZF_EOF)
+            self.file_handle.close()
+            self.file_handle = None
+
+
+class TabixIndexer:
+    """
+    Build the tabix index (.tbi) of a VCF written in BGZF from the positions of the records in the BGZF blocks.
+
+    The records must be grouped by contig and sorted by position in each contig. Otherwise the index is not valid and error contains the reason. If the positions are too high for the tabix bins, csi_required is also set: the file can be indexed in CSI format.
+    """
+    META_BIN = 37450  # Pseudo-bin storing the offsets and the number of records of a contig
+
+    def __init__(self):
+        """
+        Build and return an instance of TabixIndexer.
+
+        :return: The new instance.
+        :rtype: TabixIndexer
+        """
+        self.contigs = []
+        self.error = None
+        self.csi_required = False
+        self._bins = None  # By bin of the current contig: chunks [start position, end position]
+        self._linear = None  # By 16kb window of the current contig: position of the first record overlapping the window
+        self._indexes = []  # By contig: (bins, linear index, first position, last position, number of records)
+        self._last_beg = None
+
+    @staticmethod
+    def reg2bin(beg, end):
+        """
+        Return the smallest bin containing the 0-based region [beg, end[ (see SAM specifications).
+
+        :param beg: Start of the region (0-based).
+        :type beg: int
+        :param end: End of the region (0-based, excluded).
+        :type end: int
+        :return: The bin.
+        :rtype: int
+        """
+        end -= 1
+        for shift, offset in [(14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)]:
+            if beg >> shift == end >> shift:
+                return offset + (beg >> shift)
+        return 0
+
+    def addLine(self, line, start_position, end_position):
+        """
+        Add a VCF record to the index.
+
+        :param line: The VCF line without end of line.
+        :type line: str
+        :param start_position: Position (see BGZFWriter.getPosition()) of the start of the line in BGZF file.
+        :type start_position: int
+        :param end_position: Position (see BGZFWriter.getPosition()) of the end of the line in BGZF file.
+        :type end_position: int
+        """
+        if self.error is not None:
+            return
+        fields = line.split("\t", 8)
+        chrom = fields[0]
+        beg = int(fields[1]) - 1
+        end = beg + len(fields[3])
+        info = fields[7]
+        if "END=" in info and (info.startswith("END=") or ";END=" in info):  # As htslib
+            end_value = info[info.index("END=") + 4:].split(";", 1)[0] if info.startswith("END=") else info.split(";END=", 1)[1].split(";", 1)[0]
+            try:
+                if int(end_value) > beg:
+                    end = int(end_value)
+            except ValueError:
+                pass
+        end = max(end, beg + 1)
+        if len(self.contigs) == 0 or chrom != self.contigs[-1]:
+            if chrom in self.contigs:
+                self.error = "the records of the contig {} are not grouped".format(chrom)
+                return
+            self.contigs.append(chrom)
+            self._bins = {}
+            self._linear = {}
+            self._indexes.append([self._bins, self._linear, start_position, end_position, 0])
+            self._last_beg = beg
+        if beg < self._last_beg:
+            self.error = "the records are not sorted by position on contig {} at position {}".format(chrom, beg + 1)
+            return
+        if end > TABIX_MAX_POS:
+            self.error = "the position {} on contig {} is too high for a tabix index".format(end, chrom)
+            self.csi_required = True
+            return
+        self._last_beg = beg
+        # Bin
+        chunks = self._bins.setdefault(TabixIndexer.reg2bin(beg, end), [])
+        if len(chunks) != 0 and chunks[-1][1] == start_position:  # Contiguous with the previous chunk
+            chunks[-1][1] = end_position
+        else:
+            chunks.append([start_position, end_position])
+        # Linear index
+        first_window = beg >> 14
+        last_window = (end - 1) >> 14
+        if first_window == last_window:
+            if first_window not in self._linear:
+                self._linear[first_window] = start_position
+        else:
+            for window in range(first_window, last_window + 1):
+                if window not in self._linear:
+                    self._linear[window] = start_position
+        # Contig
+        self._indexes[-1][3] = end_position
+        self._indexes[-1][4] += 1
+
+    def write(self, out_path, writer):
+        """
+        Write the index.
+
+        :param out_path: Path to the index (format: TBI).
+        :type out_path: str
+        :param writer: The writer of the indexed file (all the blocks must be written).
+        :type writer: BGZFWriter
+        """
+        names = b"".join(contig.encode() + b"\0" for contig in self.contigs)
+        data = [
+            b"TBI\1",
+            struct.pack("<8i", len(self.contigs), 2, 1, 2, 0, ord("#"), 0, len(names)),  # VCF preset
+            names
+        ]
+        for bins, linear, first_position, last_position, nb_records in self._indexes:
+            data.append(struct.pack("<i", len(bins) + 1))
+            for bin_id in sorted(bins):
+                chunks = bins[bin_id]
+                data.append(struct.pack("<Ii", bin_id, len(chunks)))
+                for start_position, end_position in chunks:
+                    data.append(struct.pack("<QQ", writer.getVirtualOffset(start_position), writer.getVirtualOffset(end_position)))
+            data.append(struct.pack(
+                "<IiQQQQ", TabixIndexer.META_BIN, 2,
+                writer.getVirtualOffset(first_position), writer.getVirtualOffset(last_position), nb_records, 0
+            ))
+            # Linear index: the missing windows take the offset of the previous window (the first window takes the offset of the contig)
+            nb_windows = max(linear) + 1
+            offsets = []
+            previous_offset = writer.getVirtualOffset(first_position)
+            for window in range(nb_windows):
+                if window in linear:
+                    previous_offset = writer.getVirtualOffset(linear[window])
+                offsets.append(previous_offset)
+            data.append(struct.pack("<i{}Q".format(nb_windows), nb_windows, *offsets))
+        data.append(struct.pack("<Q", 0))  # Number of records without coordinates
+        index_writer = BGZFWriter(out_path)
+        index_writer.writeBytes(b"".join(data))
+        index_writer.close()
+
+
+class MergedVCFIO(VCFIO):
+    """
+    Write merged VCF from anacore.vcf.VCFRecord or LazyRecord.
+
+    If the path ends with .gz, the file is written in BGZF with blocks compressed in parallel and the tabix index (.tbi) is built during the write from the positions of the records in blocks.
+    If matrix is set, the records written by write() are also added to this VariantMatrixWriter and it is closed with the file.
+    The merged records are sorted by (chrom, refStart, refEnd) and tabix needs records sorted by position: a variant with a common prefix between REF and ALT can be placed after a variant with a higher position. In BGZF output, the records are sorted by position in a window of POSITION_REORDER_WINDOW before the write: the order of the records can differ from the plain VCF output and a ValueError is raised if a record must be moved further. For positions beyond TABIX_MAX_POS, a CSI index is built by pysam from the finished file.
+    """
+
+    def __init__(self, filepath, mode="r", nb_threads=1):
+        """
+        Build and return an instance of MergedVCFIO.
+
+        :param filepath: The filepath.
+        :type filepath: str
+        :param mode: Mode to open the file ('r', 'w', 'a', 'i').
+        :type mode: str
+        :param nb_threads: Number of threads used to compress the output in BGZF.
+        :type nb_threads: int
+        :return: The new instance.
+        :rtype: MergedVCFIO
+        """
+        super().__init__(filepath, mode)
+        self._indexer = None
+        self._pending = []  # Heap of the records waiting for the write in BGZF output: (position, index, line)
+        self._pending_chrom = None
+        self._written_pos = None  # Position of the last record written in BGZF output for _pending_chrom
+        self._nb_lines = 0
+        self._position = None  # Position of the next line in BGZF output
+        self.matrix = None  # Columnar output of the records (see VariantMatrixWriter)
+        if mode == "w" and filepath.endswith(".gz"):
+            self.file_handle.close()
+            self.file_handle = BGZFWriter(filepath, nb_threads)
+            self._indexer = TabixIndexer()
+
+    def recToVCFLine(self, record):
+        """
+        Return the record in VCF format.
+
+        :param record: The record to process.
+        :type record: anacore.vcf.VCFRecord | LazyRecord
+        :return: The VCF line.
+        :rtype: str
+        """
+        if isinstance(record, LazyRecord):
+            return record.toVCFLine()
+        return super().recToVCFLine(record)
+
+    def write(self, record):
+        """
+        Write the record in file.
+
+        :param record: The record to write.
+        :type record: anacore.vcf.VCFRecord | LazyRecord
+        """
+        if self.matrix is not None:
+            self.matrix.add(record)
+        self.writeVCFLine(self.recToVCFLine(record))
+
+    def writeVCFLine(self, line):
+        """
+        Write a record already converted in VCF format.
+
+        :param line: The VCF line without end of line.
+        :type line: str
+        """
+        if self._indexer is None:
+            self.file_handle.write(line + "\n")
+        else:
+            chrom, pos = line.split("\t", 2)[:2]
+            pos = int(pos)
+            if chrom != self._pending_chrom:
+                self._writePending()
+                self._pending_chrom = chrom
+                self._written_pos = None
+            elif self._written_pos is not None and pos < self._written_pos:
+                raise ValueError(
+                    "The record {}:{} cannot be written in {} before the record at position {}: the records are sorted by position only in a window of {} (POSITION_REORDER_WINDOW). Use an uncompressed output.".format(
+                        chrom, pos, self.filepath, self._written_pos, POSITION_REORDER_WINDOW
+                    )
+                )
+            heapq.heappush(self._pending, (pos, self._nb_lines, line))
+            self._nb_lines += 1
+            # The next records have a position greater than pos - POSITION_REORDER_WINDOW
+            while self._pending[0][0] < pos - POSITION_REORDER_WINDOW:
+                self._written_pos, _, pending_line = heapq.heappop(self._pending)
+                self._writeIndexedLine(pending_line)
+
+    def _writePending(self):
+        while len(self._pending) != 0:
+            self._written_pos, _, pending_line = heapq.heappop(self._pending)
+            self._writeIndexedLine(pending_line)
+
+    def _writeIndexedLine(self, line):
+        start_position = self._position
+        if start_position is None:  # First record after the header
+            start_position = self.file_handle.getPosition()
+        self.file_handle.write(line + "\n")
+        self._position = self.file_handle.getPosition()
+        self._indexer.addLine(line, start_position, self._position)
+
+    def close(self):
+        """Close the file and the columnar output and write the index of BGZF output."""
+        if getattr(self, "matrix", None) is not None:
+            self.matrix.close()
+            self.matrix = None
+        if getattr(self, "_indexer", None) is not None and self.file_handle is not None:
+            self._writePending()
+            self.file_handle.close()
+            index_path = self.filepath + ".tbi"
+            if self._indexer.error is None:
+                self._indexer.write(index_path, self.file_handle)
+            else:
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+                if self._indexer.csi_required:
+                    from pysam import tabix_index  # Lazy import: only used for the positions beyond TABIX_MAX_POS
+                    log.warning("The tabix index of {} cannot be created: {}. A CSI index is built from the finished file.".format(self.filepath, self._indexer.error))
+                    tabix_index(self.filepath, preset="vcf", force=True, csi=True)
+                else:  # Unsorted or ungrouped records of a caller VCF (see writeNormalizedVCF)
+                    log.warning("The index of {} cannot be created: {}.".format(self.filepath, self._indexer.error))
+            self._indexer = None
+        super().close()
+
+
+class VariantMatrixWriter:
+    """
+    Write the merged variants in columns: one NumPy file (.npy) by column with one row by merged variant, in the order of the merge. The files can be loaded without parsing and memory-mapped with readVariantMatrix or numpy.load(path, mmap_mode="r").
+
+    Columns:
+        * chrom (int32): index of the contig in the contigs of matrix.json.
+        * pos (int64): position of the variant (1-based).
+        * ref_offsets and alt_offsets (int64, nb_variants + 1): the REF (or the ALT joined by ",") of the variant i are the bytes ref_data[ref_offsets[i]:ref_offsets[i + 1]].
+        * ref_data and alt_data (uint8): the ASCII concatenation of REF (or ALT).
+        * src (uint64): bit N is set if the caller N (sN_ prefix) has found the variant.
+        * qual (float32, nb_variants x nb_callers): sN_VCQUAL (NaN if missing).
+        * gt (int8, nb_variants x nb_callers x nb_samples): number of alternative alleles in sN_GT (-1 if missing).
+        * ad (int32, nb_variants x nb_callers x nb_samples): alternative allele depth, last value of sN_AD (-1 if missing).
+        * dp (int32, nb_variants x nb_callers x nb_samples): sN_DP (-1 if missing).
+    """
+    HEADER_SIZE = 128  # Size reserved for the header of the .npy files. The number of rows is written on close.
+    BUFFER_SIZE = 8192  # Number of rows stored before write
+    COLUMNS = {
+        "chrom": ("<i4", ()),
+        "pos": ("<i8", ()),
+        "ref_offsets": ("<i8", ()),
+        "ref_data": ("|u1", ()),
+        "alt_offsets": ("<i8", ()),
+        "alt_data": ("|u1", ()),
+        "src": ("<u8", ()),
+        "qual": ("<f4", ("callers",)),
+        "gt": ("|i1", ("callers", "samples")),
+        "ad": ("<i4", ("callers", "samples")),
+        "dp": ("<i4", ("callers", "samples"))
+    }
+
+    def __init__(self, out_dir, calling_sources, samples):
+        """
+        Build and return an instance of VariantMatrixWriter.
+
+        :param out_dir: Path to the output directory. It is created if it does not exist.
+        :type out_dir: str
+        :param calling_sources: Names of the variants callers (in same order as the inputs).
+        :type calling_sources: list
+        :param samples: Names of the samples.
+        :type samples: list
+        :return: The new instance.
+        :rtype: VariantMatrixWriter
+        """
+        if len(calling_sources) > 64:
+            raise ValueError("The columnar output manages at most 64 callers.")
+        self.out_dir = out_dir
+        self.calling_sources = list(calling_sources)
+        self.samples = list(samples)
+        self.contigs = []
+        self.nb_variants = 0
+        self._idx_by_contig = {}
+        self._idx_by_caller = {caller: idx for idx, caller in enumerate(self.calling_sources)}
+        self._gt_codes = {}  # Number of alternative alleles by GT
+        self._nb_rows = {"ref_offsets": 1, "alt_offsets": 1, "ref_data": 0, "alt_data": 0}  # Rows of the columns not indexed by variant
+        self._next_offsets = {"ref": 0, "alt": 0}
+        self._buffer = None
+        os.makedirs(out_dir, exist_ok=True)
+        self._handles = {}
+        for column in VariantMatrixWriter.COLUMNS:
+            self._handles[column] = open(os.path.join(out_dir, column + ".npy"), "wb")
+            self._handles[column].write(b"\0" * VariantMatrixWriter.HEADER_SIZE)
+        self._handles["ref_offsets"].write(struct.pack("<q", 0))
+        self._handles["alt_offsets"].write(struct.pack("<q", 0))
+        self._resetBuffer()
+
+    def _resetBuffer(self):
+        self._buffer = {column: [] for column in ["chrom", "pos", "ref", "alt", "src", "qual", "gt", "ad", "dp"]}
+
+    def _getGTCode(self, gt):
+        if gt not in self._gt_codes:
+            alleles = gt.replace("|", "/").split("/")
+            if gt == "" or all(allele == "." for allele in alleles):
+                self._gt_codes[gt] = -1
+            else:
+                self._gt_codes[gt] = sum(1 for allele in alleles if allele not in {"0", "."})
+        return self._gt_codes[gt]
+
+    @staticmethod
+    def _lastInt(value):
+        if value is None:
+            return -1
+        if isinstance(value, str):  # Raw value of LazyRecord
+            value = value.rsplit(",", 1)[-1]
+            return -1 if value == "." else int(value)
+        if isinstance(value, list):
+            value = value[-1] if len(value) != 0 else None
+            return -1 if value is None else int(value)
+        return int(value)
+
+    def add(self, record):
+        """
+        Add a merged record.
+
+        :param record: The merged record.
+        :type record: anacore.vcf.VCFRecord | LazyRecord
+        """
+        if record.chrom not in self._idx_by_contig:
+            self._idx_by_contig[record.chrom] = len(self.contigs)
+            self.contigs.append(record.chrom)
+        buffer = self._buffer
+        buffer["chrom"].append(self._idx_by_contig[record.chrom])
+        buffer["pos"].append(record.pos)
+        buffer["ref"].append(record.ref)
+        buffer["alt"].append(",".join(record.alt))
+        nb_callers = len(self.calling_sources)
+        nb_samples = len(self.samples)
+        qual = [float("nan")] * nb_callers
+        gt = [-1] * (nb_callers * nb_samples)
+        ad = [-1] * (nb_callers * nb_samples)
+        dp = [-1] * (nb_callers * nb_samples)
+        src = 0
+        samples = record.sample_tokens if isinstance(record, LazyRecord) else record.samples
+        for caller in record.info["SRC"]:
+            idx_caller = self._idx_by_caller[caller]
+            src |= 1 << idx_caller
+            prefix = "s{}_".format(idx_caller)
+            caller_qual = record.info.get(prefix + "VCQUAL")
+            if caller_qual is not None:
+                qual[idx_caller] = float(caller_qual)
+            for idx_spl, spl_name in enumerate(self.samples):
+                spl_data = samples[spl_name]
+                idx_cell = idx_caller * nb_samples + idx_spl
+                spl_gt = spl_data.get(prefix + "GT")
+                if spl_gt is not None:
+                    gt[idx_cell] = self._getGTCode(spl_gt)
+                ad[idx_cell] = VariantMatrixWriter._lastInt(spl_data.get(prefix + "AD"))
+                dp[idx_cell] = VariantMatrixWriter._lastInt(spl_data.get(prefix + "DP"))
+        buffer["src"].append(src)
+        buffer["qual"].append(qual)
+        buffer["gt"].append(gt)
+        buffer["ad"].append(ad)
+        buffer["dp"].append(dp)
+        self.nb_variants += 1
+        if len(buffer["pos"]) == VariantMatrixWriter.BUFFER_SIZE:
+            self.flush()
+
+    def _writeStrings(self, name, values):
+        import numpy  # Lazy import: only used for the columnar output
+        data = "".join(values).encode()
+        offsets = numpy.cumsum([len(value) for value in values], dtype=numpy.int64) + self._next_offsets[name]
+        self._handles[name + "_offsets"].write(offsets.tobytes())
+        self._handles[name + "_data"].write(data)
+        self._nb_rows[name + "_offsets"] += len(values)
+        self._nb_rows[name + "_data"] += len(data)
+        self._next_offsets[name] += len(data)
+
+    def flush(self):
+        """Write the stored rows."""
+        import numpy  # Lazy import: only used for the columnar output
+        buffer = self._buffer
+        if len(buffer["pos"]) == 0:
+            return
+        for column in ["chrom", "pos", "src", "qual", "gt", "ad", "dp"]:
+            self._handles[column].write(numpy.array(buffer[column], dtype=VariantMatrixWriter.COLUMNS[column][0]).tobytes())
+        self._writeStrings("ref", buffer["ref"])
+        self._writeStrings("alt", buffer["alt"])
+        self._resetBuffer()
+
+    def append(self, matrix_dir):
+        """
+        Add the rows of another matrix (ex: a region merged in another process). The stored rows are written before.
+
+        :param matrix_dir: Path to the directory of the matrix (see readVariantMatrix).
+        :type matrix_dir: str
+        """
+        import numpy  # Lazy import: only used for the columnar output
+        self.flush()
+        other = readVariantMatrix(matrix_dir, None)
+        if other["calling_sources"] != self.calling_sources or other["samples"] != self.samples:
+            raise ValueError("The callers or the samples of the matrix {} are not the same as in {}.".format(matrix_dir, self.out_dir))
+        contigs_codes = []
+        for contig in other["contigs"]:
+            if contig not in self._idx_by_contig:
+                self._idx_by_contig[contig] = len(self.contigs)
+                self.contigs.append(contig)
+            contigs_codes.append(self._idx_by_contig[contig])
+        self._handles["chrom"].write(numpy.array(contigs_codes, dtype="<i4")[other["chrom"]].tobytes())
+        for column in ["pos", "src", "qual", "gt", "ad", "dp"]:
+            self._handles[column].write(numpy.ascontiguousarray(other[column]).tobytes())
+        for name in ["ref", "alt"]:
+            self._handles[name + "_offsets"].write((other[name + "_offsets"][1:] + self._next_offsets[name]).tobytes())
+            self._handles[name + "_data"].write(other[name + "_data"].tobytes())
+            self._nb_rows[name + "_offsets"] += len(other[name + "_offsets"]) - 1
+            self._nb_rows[name + "_data"] += len(other[name + "_data"])
+            self._next_offsets[name] += len(other[name + "_data"])
+        self.nb_variants += len(other["pos"])
+
+    def _writeNpyHeader(self, column):
+        dtype, dimensions = VariantMatrixWriter.COLUMNS[column]
+        nb_by_dimension = {"callers": len(self.calling_sources), "samples": len(self.samples)}
+        shape = (self._nb_rows.get(column, self.nb_variants),) + tuple(nb_by_dimension[dimension] for dimension in dimensions)
+        header = "{{'descr': '{}', 'fortran_order': False, 'shape': {}, }}".format(dtype, repr(shape))
+        header_size = VariantMatrixWriter.HEADER_SIZE - 10  # Magic string, version and header length
+        if len(header) + 1 > header_size:
+            raise ValueError("The shape {} of column {} is too large for the header.".format(shape, column))
+        header = header.ljust(header_size - 1) + "\n"
+        FH_column = self._handles[column]
+        FH_column.seek(0)
+        FH_column.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", header_size) + header.encode("latin1"))
+
+    def close(self):
+        """Write the stored rows, the columns headers and the description of the matrix (matrix.json)."""
+        if self._handles is None:
+            return
+        self.flush()
+        for column, FH_column in self._handles.items():
+            self._writeNpyHeader(column)
+            FH_column.close()
+        self._handles = None
+        with open(os.path.join(self.out_dir, "matrix.json"), "w") as FH_desc:
+            json.dump({
+                "nb_variants": self.nb_variants,
+                "calling_sources": self.calling_sources,
+                "samples": self.samples,
+                "contigs": self.contigs,
+                "columns": list(VariantMatrixWriter.COLUMNS)
+            }, FH_desc, indent=2)
+
+
+def readVariantMatrix(matrix_dir, mmap_mode="r"):
+    """
+    Return the columns and the description of a matrix written by VariantMatrixWriter.
+
+    :param matrix_dir: Path to the directory of the matrix.
+    :type matrix_dir: str
+    :param mmap_mode: Memory-map mode of the columns (see numpy.load). None to load the columns in memory.
+    :type mmap_mode: str
+    :return: The description (nb_variants, calling_sources, samples and contigs) and the arrays by column name.
+    :rtype: dict
+    """
+    import numpy  # Lazy import: only used for the columnar output
+    with open(os.path.join(matrix_dir, "matrix.json")) as FH_desc:
+        matrix = json.load(FH_desc)
+    for column in matrix["columns"]:
+        matrix[column] = numpy.load(os.path.join(matrix_dir, column + ".npy"), mmap_mode=mmap_mode)
+    return matrix
+
+
+class RenamingTable(dict):
+    """Dictionary of new name by tag. The tags missing from the header (for example flags in INFO) are renamed on first access."""
+
+    def __init__(self, rename_fct, tags):
+        """
+        Build and return an instance of RenamingTable.
+
+        :param rename_fct: Function returning the new name of a tag.
+        :type rename_fct: function
+        :param tags: Tags known from the header.
+        :type tags: iterable
+        :return: The new instance.
+        :rtype: RenamingTable
+        """
+        super().__init__()
+        self.rename_fct = rename_fct
+        for tag in tags:
+            self[tag] = rename_fct(tag)
+
+    def __missing__(self, tag):
+        new_tag = self.rename_fct(tag)
+        self[tag] = new_tag
+        return new_tag
+
+def getMergePlan(idx_in, curr_caller, FH_in, annotations_field, shared_filters):
+    """
+    Return the translation tables used to rename the caller dependant elements of the records coming from one caller.
+
+    :param idx_in: Index of the caller in inputs.
+    :type idx_in: int
+    :param curr_caller: Name of the variant caller.
+    :type curr_caller: str
+    :param FH_in: The caller VCF file.
+    :type FH_in: anacore.vcf.VCFIO
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :return: The merge plan: caller index, caller name, samples, adapter and its support extraction function, new names by FILTER (None for PASS which is removed), INFO and FORMAT tag, quality backup tag, cache of the renamed FORMAT lists and counters of the processed records, errors and prefiltered lines.
+    :rtype: dict
+    """
+    prefix = "s{}_".format(idx_in)
+    filter_table = RenamingTable(
+        lambda tag: sys.intern(tag if tag in shared_filters else prefix + tag),  # Rename filters not based on caller
+        FH_in.filter
+    )
+    filter_table["PASS"] = None
+    adapter = getCallerAdapter(curr_caller, FH_in)
+    return {
+        "idx": idx_in,
+        "caller": curr_caller,
+        "samples": FH_in.samples,
+        "adapter": adapter,
+        "extract_support": adapter.extract,
+        "filter": filter_table,
+        "info": RenamingTable(
+            lambda tag: sys.intern(tag if tag == annotations_field else prefix + tag),
+            FH_in.info
+        ),
+        "format": RenamingTable(lambda tag: sys.intern(prefix + tag), FH_in.format),
+        "qual": sys.intern(prefix + "VCQUAL"),
+        "format_lists": {},  # By FORMAT: (unprefixed and prefixed tags for the first occurrence of the variant, prefixed tags)
+        "nb_records": 0,  # Number of records processed by mergeRecord
+        "errors": {},  # Number of records without support by reason (see CallerAdapter.extract)
+        "prefilter": {"kept": 0, "dropped": 0}  # Number of lines kept and dropped by VariantLinesReader
+    }
+
+def renameRecord(record, merge_plan, is_first):
+    """
+    Rename FILTER, INFO and FORMAT of the record with the translation tables of the caller.
+
+    :param record: The VCF record coming from the caller.
+    :type record: VCFRecord
+    :param merge_plan: The translation tables of the caller (see getMergePlan).
+    :type merge_plan: dict
+    :param is_first: True if it is the first occurrence of the variant in merged records.
+    :type is_first: bool
+    """
+    # Rename filters
+    if record.filter is not None:
+        filter_table = merge_plan["filter"]
+        new_filter = []
+        for tag in record.filter:
+            new_tag = filter_table[tag]
+            if new_tag is not None:
+                new_filter.append(new_tag)
+        record.filter = new_filter
+    # Rename INFO
+    info_table = merge_plan["info"]
+    record.info = {info_table[key]: val for key, val in record.info.items()}
+    # Backup quality
+    if record.qual is not None:
+        record.info[merge_plan["qual"]] = record.qual
+    # Rename FORMAT
+    # modif david 16/03/2021
+    # for s0 or 1st occurence of format we want a double value with and without prefix
+    format_table = merge_plan["format"]
+    format_key = tuple(record.format)
+    if format_key not in merge_plan["format_lists"]:
+        prefixed_format = [format_table[curr_filter] for curr_filter in record.format]
+        merge_plan["format_lists"][format_key] = (list(record.format) + prefixed_format, prefixed_format)
+    if is_first:
+        record.format = list(merge_plan["format_lists"][format_key][0])
+    else:
+        record.format = list(merge_plan["format_lists"][format_key][1])
+    # end modif david
+    if isinstance(record, LazyRecord):  # Samples are renamed when they are written or merged
+        record.renameSamples(format_table, is_first)
+        return
+    for spl_name, spl_info in record.samples.items():
+        renamed_info = {}
+        for key, val in spl_info.items():
+            if key not in renamed_info:
+                renamed_info[key] = val
+            renamed_info[format_table[key]] = val
+        record.samples[spl_name] = renamed_info
+
+def mergeRecord(variant_by_name, record, merge_plan, prioritize, error_log):
+    """
+    Rename the caller dependant elements of the record and add it to the merged records.
+
+    :param variant_by_name: Merged VCF records by variant name. It is updated by this function.
+    :type variant_by_name: dict
+    :param record: The VCF record coming from the caller.
+    :type record: VCFRecord
+    :param merge_plan: The translation tables of the caller (see getMergePlan).
+    :type merge_plan: dict
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param error_log: File handle where the records that cannot be processed are reported.
+    :type error_log: file
+    """
+    idx_in = merge_plan["idx"]
+    curr_caller = merge_plan["caller"]
+    merge_plan["nb_records"] += 1
+    variant_name = record.getName()
+    # Extract AD and DP
+    support_by_spl = {}
+    extract_support = merge_plan["extract_support"]
+    for spl in merge_plan["samples"]:
+        support, reason = extract_support(record, spl)
+        if support is None:
+            merge_plan["errors"][reason] = merge_plan["errors"].get(reason, 0) + 1
+            error_log.write(f"Error processing {variant_name} in {curr_caller}: {reason}\n")
+            error_log.write(f"{curr_caller} - Error details: {record.samples[spl]}\n")
+            return
+        support_by_spl[spl] = support
+    # JC : end of the modification
+    renameRecord(record, merge_plan, variant_name not in variant_by_name)
+
+    # Add to storage
+    spl_name = merge_plan["samples"][-1]  # The genotype is checked on the last sample
+    if variant_name not in variant_by_name:
+        if record.samples[spl_name]['GT'] != '0/0':
+            update_rs_id(record) # JC
+            variant_by_name[variant_name] = record
+            # Data source
+            record.info["SRC"] = [curr_caller]
+            # Quality
+            if idx_in != 0:
+                record.qual = None  # For consistency, the quality of the variant comes only from the first caller of the variant
+            # AD and DP by sample (from the first caller finding the variant: callers are in user order)
+            # david removed as it is placed before GT and gatk combinevariant complains
+            #record.format.insert(0, "ADSRC")
+            #record.format.insert(0, "DPSRC")
+            # end removed
+            # david removed as we already have them
+            # record.format.insert(0, "AD")
+            # record.format.insert(0, "DP")
+            # end removed
+            # david removed as now useless
+            # for spl_name, spl_data in record.samples.items():
+            # end removed
+                # david removed as we already have them
+                # spl_data["AD"] = [support_by_spl[spl_name]["AD"]]
+                # spl_data["DP"] = support_by_spl[spl_name]["DP"]
+                # end removed
+                # david removed as it is placed before GT and gatk combinevariant complains
+                # spl_data["ADSRC"] = [support_by_spl[spl_name]["AD"]]
+                # spl_data["DPSRC"] = [support_by_spl[spl_name]["DP"]]
+                # end removed
+    else:
+        if record.samples[spl_name]['GT'] != '0/0':
+            prev_variant = variant_by_name[variant_name]
+            prev_variant.info["SRC"].append(curr_caller)
+            # JC : Prioritize complex variants when -p
+            if prioritize and is_complex_variant(record) and not is_complex_variant(prev_variant):
+                variant_by_name[variant_name] = record
+                prev_variant = record
+            # IDs
+            if record.id is not None:
+                prev_ids = prev_variant.id.split(";") if prev_variant.id else [] # JC : 
+                prev_ids.extend(record.id.split(";"))
+                prev_ids = sorted(list(set(prev_ids)))
+                prev_variant.id = ";".join(prev_ids)
+            # FILTERS
+            if record.filter is not None:
+                if prev_variant.filter is None:
+                    prev_variant.filter = record.filter
+                else:
+                    prev_variant.filter = list(set(prev_variant.filter) or set(record.filter))
+            # FORMAT
+            prev_variant.format.extend(record.format)
+            # INFO
+            prev_variant.info.update(record.info)
+            if isinstance(prev_variant, LazyRecord):  # Samples are merged on raw fields
+                for spl_name, spl_data in prev_variant.sample_tokens.items():
+                    spl_data.update(record.sample_tokens[spl_name])
+            else:
+                for spl_name, spl_data in prev_variant.samples.items():
+                    spl_data.update(record.samples[spl_name])
+                    # david removed as it is placed before GT and gatk combinevariant complains
+                    # spl_data["ADSRC"].append(support_by_spl[spl_name]["AD"])
+                    # spl_data["DPSRC"].append(support_by_spl[spl_name]["DP"])
+                    # end removed
+            update_rs_id(prev_variant)
+
+            # Traitement des ID pour s'assurer que les ID sont correctement définis en tant que "rs..."
+            if prev_variant.id is None or prev_variant.id == ".":
+                for key, val in record.info.items():
+                    if key.startswith('rs'):
+                        prev_variant.id = key
+                        break
+
+
+def reconcileOverlappingRecords(records, calling_sources, metrics=None):
+    """
+    Return generator on the merged records where the SNVs of a caller are removed when they are the decomposed form of a complex variant (MNV, indel) found by other callers.
+
+    The records are read with a sweep line on their reference intervals: the records with overlapping [refStart, refEnd] are grouped and the group is processed as soon as the next record starts after its end. In a group, each complex variant is split in the substitutions of its bases (position, REF base, ALT base) and a SNV is removed if it matches a substitution of a complex variant found by none of the callers of the SNV. The callers of the removed SNVs are added in the INFO DECSRC of the complex variant. The time and the memory are linear in the number of records and in the size of the groups.
+
+    :param records: Merged records sorted by (chrom, refStart, refEnd).
+    :type records: iterable
+    :param calling_sources: Names of the variants callers (DECSRC is in this order).
+    :type calling_sources: list
+    :param metrics: Measures of the run completed by the number of removed SNVs.
+    :type metrics: RunMetrics
+    :return: The reconciled records in the same order.
+    :rtype: generator for anacore.vcf.VCFRecord | LazyRecord
+    """
+    caller_rank = {caller: idx for idx, caller in enumerate(calling_sources)}
+
+    def reconcileGroup(group):
+        complex_by_substitution = {}  # Complex variants by substitution (position, REF base, ALT base)
+        for record in group:
+            if is_complex_variant(record):
+                for alt in record.alt:
+                    if not alt.startswith("<"):
+                        for offset in range(min(len(record.ref), len(alt))):
+                            if record.ref[offset] != alt[offset]:
+                                complex_by_substitution.setdefault((record.pos + offset, record.ref[offset], alt[offset]), []).append(record)
+        if len(complex_by_substitution) == 0:
+            return group
+        kept = []
+        nb_decomposed = 0
+        for record in group:
+            if not is_complex_variant(record) and len(record.alt) == 1:
+                snv_callers = set(record.info["SRC"])
+                complex_record = next(
+                    (
+                        curr_complex for curr_complex in complex_by_substitution.get((record.pos, record.ref, record.alt[0]), [])
+                        if snv_callers.isdisjoint(curr_complex.info["SRC"])
+                    ),
+                    None
+                )
+                if complex_record is not None:
+                    decomposed_callers = set(complex_record.info.get("DECSRC", [])) | snv_callers
+                    complex_record.info["DECSRC"] = sorted(decomposed_callers, key=lambda caller: caller_rank.get(caller, len(caller_rank)))
+                    nb_decomposed += 1
+                    continue
+            kept.append(record)
+        if metrics is not None:
+            metrics.variants["decomposed"] += nb_decomposed
+        return kept
+
+    group = []
+    group_chrom = None
+    group_end = None
+    for record in records:
+        record_start = record.refStart()
+        if len(group) != 0 and (record.chrom != group_chrom or record_start > group_end):  # End of group
+            yield from (group if len(group) == 1 else reconcileGroup(group))
+            group = []
+        if len(group) == 0:
+            group_chrom = record.chrom
+            group_end = record.refEnd()
+        else:
+            group_end = max(group_end, record.refEnd())
+        group.append(record)
+    if len(group) != 0:
+        yield from (group if len(group) == 1 else reconcileGroup(group))
+
+
+def getCallerRecords(FH_in, merge_plan, skip_non_variant=False, reference=None, targets=None):
+    """
+    Return the records of a caller read with the prefilter and the normalizer selected.
+
+    :param FH_in: The VCF file of the caller.
+    :type FH_in: anacore.vcf.VCFIO
+    :param merge_plan: The merge plan of the caller (see getMergePlan). Its prefilter counts are updated by the reading.
+    :type merge_plan: dict
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :param reference: The reference sequences used to normalize the records (see LineNormalizer). None if the file is already normalized.
+    :type reference: IndexedFasta
+    :param targets: With reference, regions where the records are kept. None to keep all the records.
+    :type targets: RegionIndex
+    :return: The records.
+    :rtype: iterable
+    """
+    if not skip_non_variant and reference is None:
+        return FH_in
+    normalizer = None if reference is None else LineNormalizer(FH_in, reference, targets)
+    return VariantLinesReader(FH_in, merge_plan["prefilter"] if skip_non_variant else None, normalizer)
+
+def getMergedRecords(inputs_variants, calling_sources, annotations_field, shared_filters, prioritize, nb_jobs=1, cache_dir=None, cache_max_size=None, lazy=False, metrics=None, error_log_path="error_records.log", regions=None, skip_non_variant=False):
+    """
+    Merge VCFRecords coming from several variant callers.
+
+    :param inputs_variants: Pathes to the variants files.
+    :type inputs_variants: list
+    :param calling_sources: Names of the variants callers (in same order as inputs_variants).
+    :type calling_sources: list
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :type nb_jobs: int
+    :param cache_dir: Path to the normalization cache directory. None to disable the cache.
+    :type cache_dir: str
+    :param cache_max_size: Maximum size of the normalization cache (in bytes). None for unlimited.
+    :type cache_max_size: int
+    :param lazy: Whether to read the records as LazyRecord (values are kept as written by the callers).
+    :type lazy: bool
+    :param metrics: Measures of the run completed by this function.
+    :type metrics: RunMetrics
+    :param error_log_path: Path to the log of the records that cannot be processed and of the warnings.
+    :type error_log_path: str
+    :param regions: Target regions: only the records overlapping the regions extended by REGIONS_PADDING are read. None to read all the records.
+    :type regions: RegionIndex
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :return: Merged VCF records.
+    :rtype: list
+    """
+    error_log = open(error_log_path, "w")  # Log
+
+
+    # JC : Redirect warnings to error log
+    default_showwarning = redirectWarnings(error_log)
+    try:
+        if NORMALIZER == "internal":  # The inputs are normalized during their reading: without intermediate files
+            with IndexedFasta(REFERENCE_GENOME) as reference:
+                targets = None if regions is None else regions.getPadded(REGIONS_PADDING)
+                return mergeNormalizedRecords(inputs_variants, calling_sources, annotations_field, shared_filters, prioritize, error_log, lazy, metrics, skip_non_variant, reference, targets)
+
+        # JC : Normalize the VCF files to ensure multi-allelic sites are split.
+        normalized_vcfs = normalize_vcfs(inputs_variants, nb_jobs, cache_dir, cache_max_size, metrics, regions)
+
+        return mergeNormalizedRecords(normalized_vcfs, calling_sources, annotations_field, shared_filters, prioritize, error_log, lazy, metrics, skip_non_variant)
+    finally:
+        warnings.showwarning = default_showwarning
+        error_log.close() # JC
+
+def mergeNormalizedRecords(normalized_vcfs, calling_sources, annotations_field, shared_filters, prioritize, error_log, lazy=False, metrics=None, skip_non_variant=False, reference=None, targets=None):
+    """
+    Merge VCFRecords coming from the normalized VCF of several variant callers.
+
+    :param normalized_vcfs: Pathes to the normalized variants files (or to the raw variants files with reference).
+    :type normalized_vcfs: list
+    :param calling_sources: Names of the variants callers (in same order as normalized_vcfs).
+    :type calling_sources: list
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param error_log: File handle of the error log.
+    :type error_log: file
+    :param lazy: Whether to read the records as LazyRecord (values are kept as written by the callers).
+    :type lazy: bool
+    :param metrics: Measures of the run completed by this function.
+    :type metrics: RunMetrics
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :param reference: The reference sequences used to normalize the records during the reading (see LineNormalizer). None if the files are already normalized.
+    :type reference: IndexedFasta
+    :param targets: With reference, regions where the records are kept. None to keep all the records.
+    :type targets: RegionIndex
+    :return: Merged VCF records.
+    :rtype: list
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    variant_by_name = {}
+    with metrics.phase("merge"):
+        for idx_in, normalized_vcf in enumerate(normalized_vcfs):
+            curr_caller = calling_sources[idx_in]
+            start_wall = time.perf_counter()
+            start_cpu = time.process_time()
+            with (LazyVCFIO if lazy else VCFIO)(normalized_vcf) as FH_in:  # Use the normalized VCF file for further processing.
+                merge_plan = getMergePlan(idx_in, curr_caller, FH_in, annotations_field, shared_filters)
+                log.info("Process {} (adapter: {})".format(curr_caller, merge_plan["adapter"].name))
+                records = getCallerRecords(FH_in, merge_plan, skip_non_variant, reference, targets)
+                try:
+                    for record in records:
+                        mergeRecord(variant_by_name, record, merge_plan, prioritize, error_log)
+                        if lazy:
+                            record.compact()
+                except NormalizationError as error:  # Raised by the normalization during the reading
+                    exitNormalizationError(normalized_vcf, error, curr_caller)
+            metrics.addTime(metrics.getCaller(curr_caller), "merge", time.perf_counter() - start_wall, time.process_time() - start_cpu)
+            metrics.addMergePlan(merge_plan)
+    return variant_by_name.values()
+
+def iterContigMergedRecords(FH_inputs, chrom, calling_sources, annotations_field, shared_filters, prioritize, error_log, start=None, end=None, metrics=None, regions=None, skip_non_variant=False):
+    """
+    Return generator on merged VCFRecords of one contig (or of one chunk of contig) sorted by (refStart, refEnd).
+
+    Records of the callers are read side by side with a k-way merge on position. All the records with the same name share the same position so they are merged as soon as the position is complete, and the merged records are yielded as soon as no input can still produce a record placed before them (refStart of a record is never lower than its position minus 0.5). The order is the same as the sort applied on the result of getMergedRecords: (chrom, refStart, refEnd) then first caller and record order in this caller.
+
+    :param FH_inputs: Normalized VCF files opened in indexed mode (same order as calling_sources).
+    :type FH_inputs: list
+    :param chrom: The contig name.
+    :type chrom: str
+    :param calling_sources: Names of the variants callers (in same order as FH_inputs).
+    :type calling_sources: list
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param error_log: File handle where the records that cannot be processed are reported.
+    :type error_log: file
+    :param start: Only the records with refStart greater or equal to this value are processed. None for the whole contig.
+    :type start: int
+    :param end: Only the records with refStart lower than this value are processed. None for the whole contig.
+    :type end: int
+    :param metrics: Measures of the run completed by the records and errors counts by caller.
+    :type metrics: RunMetrics
+    :param regions: Target regions: only the records overlapping the regions extended by REGIONS_PADDING are read with random accesses. None to read all the records.
+    :type regions: RegionIndex
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :return: Merged VCF records.
+    :rtype: generator for anacore.vcf.VCFRecord
+    """
+    if start is None:
+        fetched_intervals = [(1, TABIX_MAX_POS)]
+    else:  # A record with refStart in [start, end[ overlaps [start - 1, end] on reference
+        fetched_intervals = [(max(1, start - 1), end)]
+    if regions is not None:
+        fetched_intervals = [
+            (max(region_start, fetched_start), min(region_end, fetched_end))
+            for region_start, region_end in regions.getPadded(REGIONS_PADDING).getIntervals(chrom)
+            for fetched_start, fetched_end in fetched_intervals
+            if region_start <= fetched_end and fetched_start <= region_end
+        ]
+
+    def iterCallerRecords(idx_in, FH_in):
+        if skip_non_variant:
+            FH_in = VariantLinesReader(FH_in, merge_plans[idx_in]["prefilter"])
+        idx_record = 0
+        previous_end = 0
+        for fetched_start, fetched_end in fetched_intervals:
+            if skip_non_variant:  # Each line is counted once: by the chunk containing its position and by the first interval reading it
+                records = FH_in.getSub(chrom, fetched_start, fetched_end, max(previous_end + 1, 0 if start is None else start), None if end is None else end - 1)
+            else:
+                records = FH_in.getSub(chrom, fetched_start, fetched_end)
+            for record in records:
+                if record.pos > previous_end:  # The records starting before are already read with the previous interval
+                    if start is None or start <= record.refStart() < end:
+                        yield record.pos, idx_in, idx_record, record
+                        idx_record += 1
+            previous_end = fetched_end
+
+    merge_plans = [
+        getMergePlan(idx_in, calling_sources[idx_in], FH_in, annotations_field, shared_filters) for idx_in, FH_in in enumerate(FH_inputs)
+    ]
+    callers_records = heapq.merge(*[iterCallerRecords(idx_in, FH_in) for idx_in, FH_in in enumerate(FH_inputs)])
+    pending = []  # Heap of merged records: (refStart, refEnd, first caller index, record index in first caller, record)
+    for pos, pos_records in itertools.groupby(callers_records, key=lambda elt: elt[0]):
+        # Yield merged records placed before the current position
+        while len(pending) != 0 and pending[0][0] < pos - 0.5:
+            yield heapq.heappop(pending)[-1]
+        # Merge records at the current position
+        variant_by_name = {}
+        origin_by_name = {}
+        for record_pos, idx_in, idx_record, record in pos_records:
+            variant_name = record.getName()
+            is_new = variant_name not in variant_by_name
+            mergeRecord(variant_by_name, record, merge_plans[idx_in], prioritize, error_log)
+            if is_new and variant_name in variant_by_name:
+                origin_by_name[variant_name] = (idx_in, idx_record)
+        for variant_name, record in variant_by_name.items():
+            heapq.heappush(
+                pending,
+                (record.refStart(), record.refEnd(), *origin_by_name[variant_name], record)
+            )
+    while len(pending) != 0:
+        yield heapq.heappop(pending)[-1]
+    if metrics is not None:
+        for merge_plan in merge_plans:
+            metrics.addMergePlan(merge_plan)
+
+def getStreamedMergedRecords(inputs_variants, calling_sources, annotations_field, shared_filters, prioritize, nb_jobs=1, cache_dir=None, cache_max_size=None, lazy=False, metrics=None, error_log_path="error_records.log", regions=None, skip_non_variant=False):
+    """
+    Return generator on VCFRecords coming from several variant callers merged and sorted by (chrom, refStart, refEnd).
+
+    Contrary to getMergedRecords, records are not stored: normalized inputs are indexed and merged contig by contig (in the same order as the sort applied on the result of getMergedRecords). The memory usage does not depend on the number of variants.
+
+    :param inputs_variants: Pathes to the variants files.
+    :type inputs_variants: list
+    :param calling_sources: Names of the variants callers (in same order as inputs_variants).
+    :type calling_sources: list
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :type nb_jobs: int
+    :param cache_dir: Path to the normalization cache directory. None to disable the cache.
+    :type cache_dir: str
+    :param cache_max_size: Maximum size of the normalization cache (in bytes). None for unlimited.
+    :type cache_max_size: int
+    :param lazy: Whether to read the records as LazyRecord (values are kept as written by the callers).
+    :type lazy: bool
+    :param metrics: Measures of the run completed by this function.
+    :type metrics: RunMetrics
+    :param error_log_path: Path to the log of the records that cannot be processed and of the warnings.
+    :type error_log_path: str
+    :param regions: Target regions: only the records overlapping the regions extended by REGIONS_PADDING are read. None to read all the records.
+    :type regions: RegionIndex
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :return: Merged VCF records.
+    :rtype: generator for anacore.vcf.VCFRecord
+    """
+    error_log = open(error_log_path, "w")  # Log
+    default_showwarning = redirectWarnings(error_log)
+    FH_inputs = []
+    try:
+        # Normalize and index
+        normalized_vcfs = getIndexedNormalizedVCFs(inputs_variants, nb_jobs, cache_dir, cache_max_size, metrics, regions)
+        for idx_in, normalized_vcf in enumerate(normalized_vcfs):
+            log.info("Process {}".format(calling_sources[idx_in]))
+            FH_inputs.append((LazyVCFIO if lazy else VCFIO)(normalized_vcf, "i"))
+        # Merge
+        for chrom, start, end in getShards(normalized_vcfs, None, regions):
+            yield from iterContigMergedRecords(FH_inputs, chrom, calling_sources, annotations_field, shared_filters, prioritize, error_log, start, end, metrics, regions, skip_non_variant)
+    finally:
+        for FH_in in FH_inputs:
+            FH_in.close()
+        warnings.showwarning = default_showwarning
+        error_log.close()
+
+def getInputFingerprint(input_vcf, with_checksum=False):
+    """
+    Return the identity of an input file used to detect the changes between two runs.
+
+    :param input_vcf: Path to the input file.
+    :type input_vcf: str
+    :param with_checksum: If True, the identity contains the SHA-256 of the content: a file rewritten with the same content (ex: caller run again) can be recognized.
+    :type with_checksum: bool
+    :return: Real path, size and modification time of the file and the SHA-256 of its content if with_checksum is True.
+    :rtype: dict
+    """
+    stat = os.stat(input_vcf)
+    fingerprint = {"path": os.path.realpath(input_vcf), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_checksum:
+        hasher = hashlib.sha256()
+        with open(input_vcf, "rb") as FH_in:
+            for chunk in iter(lambda: FH_in.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        fingerprint["sha256"] = hasher.hexdigest()
+    return fingerprint
+
+def getMergeState(args, with_inputs=True):
+    """
+    Return the description of the merge used to update its output with additional callers (see getUpdateStart): callers in order of their sN index, identity and checksum of the inputs, identity of the reference genome and merge options. The header is read from the merged VCF.
+
+    :param args: The merge parameters (see processSample).
+    :type args: argparse.Namespace
+    :param with_inputs: If False, the inputs are not described: their content is not read.
+    :type with_inputs: bool
+    :return: The description of the merge.
+    :rtype: dict
+    """
+    return {
+        "calling_sources": list(args.calling_sources),
+        "caller_ids": {caller: "s{}".format(idx_in) for idx_in, caller in enumerate(args.calling_sources)},
+        "inputs_variants": [getInputFingerprint(curr_in, True) for curr_in in args.inputs_variants] if with_inputs else None,
+        "annotations_field": args.annotations_field,
+        "shared_filters": sorted(args.shared_filters),
+        "prioritize": args.prioritize,
+        "reconcile_overlaps": args.reconcile_overlaps,
+        "lazy": args.lazy,
+        "skip_non_variant": args.skip_non_variant,
+        "regions": None if args.regions is None else getInputFingerprint(args.regions),
+        "reference": getInputFingerprint(REFERENCE_GENOME) if os.path.exists(REFERENCE_GENOME) else {"path": REFERENCE_GENOME}
+    }
+
+def getUpdateStart(args, previous_path):
+    """
+    Return the index of the first caller to add to a previous merge. The previous merge can be updated if its callers are the first callers of args with the same inputs content and the same options, and if it is not produced with lazy or reconcile_overlaps (the records are not the same as in a merge of typed records). The contribution of a previous caller cannot be removed from the merged records: a previous caller with a different input cannot be updated. Only the inputs of the previous callers with the same size as in the previous merge are read to compare their checksums.
+
+    :param args: The merge parameters (see processSample).
+    :type args: argparse.Namespace
+    :param previous_path: Path to the previous merged VCF. Its description is in previous_path + MERGE_STATE_SUFFIX.
+    :type previous_path: str
+    :return: The index of the first caller to add (None if the previous merge cannot be updated) and the reason why the previous merge cannot be updated.
+    :rtype: (int, str)
+    """
+    state_path = previous_path + MERGE_STATE_SUFFIX
+    if not os.path.exists(previous_path):
+        return None, "{} does not exist".format(previous_path)
+    if not os.path.exists(state_path):
+        return None, "{} does not exist (previous merge without --write-state)".format(state_path)
+    with open(state_path) as FH_state:
+        previous_state = json.load(FH_state)
+    current_state = getMergeState(args, False)
+    for option in ["annotations_field", "shared_filters", "prioritize", "skip_non_variant", "regions", "reference"]:
+        if previous_state.get(option) != current_state[option]:
+            return None, "the option {} is different".format(option)
+    for option in ["lazy", "reconcile_overlaps"]:
+        if previous_state[option] or current_state[option]:
+            return None, "the option {} is not managed by update".format(option)
+    nb_previous = len(previous_state["calling_sources"])
+    if current_state["calling_sources"][:nb_previous] != previous_state["calling_sources"]:
+        return None, "the previous callers {} are not the first callers".format(previous_state["calling_sources"])
+    for caller, previous_input, current_path in zip(previous_state["calling_sources"], previous_state["inputs_variants"], args.inputs_variants):
+        if os.path.getsize(current_path) != previous_input["size"] or getInputFingerprint(current_path, True)["sha256"] != previous_input["sha256"]:
+            return None, "the content of the input of {} has changed ({} in previous merge and {} now)".format(caller, previous_input["path"], current_path)
+    return nb_previous, None
+
+def writeMergeState(args):
+    """
+    Write the description of the merge next to its output (see getMergeState). The file is written in a temporary file renamed at the end: a reader never sees a partial description.
+
+    :param args: The merge parameters (see processSample).
+    :type args: argparse.Namespace
+    """
+    state_path = args.output_variants + MERGE_STATE_SUFFIX
+    tmp_path = "{}.{}.tmp".format(state_path, uuid.uuid4().hex)
+    try:
+        with open(tmp_path, "w") as FH_state:
+            json.dump(getMergeState(args), FH_state, indent=2)
+        os.replace(tmp_path, state_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def getPreviousHeaderAttr(previous_path):
+    """
+    Return the VCFHeader elements of a merged VCF.
+
+    :param previous_path: Path to the merged VCF.
+    :type previous_path: str
+    :return: VCFHeader elements (filter, info, format, samples).
+    :rtype: dict
+    """
+    with VCFIO(previous_path) as FH_previous:
+        return {
+            "filter": FH_previous.filter,
+            "info": FH_previous.info,
+            "format": FH_previous.format,
+            "samples": FH_previous.samples
+        }
+
+def getRefCoordinates(record):
+    """
+    Return the first and the last positions on reference affected by the alternative allele (see anacore.vcf.VCFRecord.refStart and refEnd). Contrary to VCFRecord.refStart, INFO and samples are not copied.
+
+    :param record: The record.
+    :type record: anacore.vcf.VCFRecord | LazyRecord
+    :return: refStart and refEnd.
+    :rtype: (float, float)
+    """
+    if isinstance(record, LazyRecord) or record.alt[0].startswith("<"):  # Coordinates of symbolic alleles depend on INFO
+        return record.refStart(), record.refEnd()
+    coord_record = VCFRecord(record.chrom, record.pos, None, record.ref, list(record.alt))
+    coord_record.normalizeSingleAllele()  # The record is already a copy
+    if coord_record.ref == VCFRecord.getEmptyAlleleMarker():
+        return coord_record.pos - 0.5, coord_record.pos - 0.5
+    return coord_record.pos, coord_record.pos + len(coord_record.ref) - 1
+
+def iterPreviousMergedRecords(previous_path, calling_sources):
+    """
+    Return generator on the records of a merged VCF in merge order (chrom, refStart, refEnd, first caller, record index in first caller). The records are restored as before the write: PASS is removed from filters.
+
+    The records of a BGZF output are sorted by position (see MergedVCFIO): a record is yielded when the next records cannot be placed before it (the refStart of a record is never lower than its position minus 0.5). The first caller of a record is the first element of SRC and the records of one caller are sorted by position.
+
+    :param previous_path: Path to the merged VCF.
+    :type previous_path: str
+    :param calling_sources: Names of the variants callers of the merged VCF (in order of their sN index).
+    :type calling_sources: list
+    :return: The merged records with their coordinates: (refStart, refEnd, record).
+    :rtype: generator for tuple
+    """
+    with VCFIO(previous_path) as FH_previous:
+        idx_by_caller = {caller: idx_in for idx_in, caller in enumerate(calling_sources)}
+        pending = []  # Heap of records: (refStart, refEnd, first caller index, position, index, record)
+        pending_chrom = None
+        for idx_record, record in enumerate(FH_previous):
+            if record.filter is not None:
+                record.filter = [tag for tag in record.filter if tag != "PASS"]
+            if record.chrom != pending_chrom:
+                while len(pending) != 0:
+                    ref_start, ref_end, *sort_keys, pending_record = heapq.heappop(pending)
+                    yield ref_start, ref_end, pending_record
+                pending_chrom = record.chrom
+            ref_start, ref_end = getRefCoordinates(record)
+            limit = min(record.pos - 0.5, ref_start)  # The next records in plain (sorted by refStart) or BGZF (sorted by position) output start after this limit
+            while len(pending) != 0 and pending[0][0] < limit:
+                pending_start, pending_end, *sort_keys, pending_record = heapq.heappop(pending)
+                yield pending_start, pending_end, pending_record
+            heapq.heappush(pending, (ref_start, ref_end, idx_by_caller[record.info["SRC"][0]], record.pos, idx_record, record))
+        while len(pending) != 0:
+            ref_start, ref_end, *sort_keys, pending_record = heapq.heappop(pending)
+            yield ref_start, ref_end, pending_record
+
+def getUpdatedMergedRecords(previous_path, inputs_variants, calling_sources, first_idx, annotations_field, shared_filters, prioritize, nb_jobs=1, cache_dir=None, cache_max_size=None, metrics=None, error_log_path="error_records.log", regions=None, skip_non_variant=False):
+    """
+    Return generator on the records of a previous merge updated with the records of additional callers, sorted by (chrom, refStart, refEnd).
+
+    Only the additional callers are normalized and loaded. The previous records are read one by one and the records of the additional callers are merged in them with the same rules as in getMergedRecords (mergeRecord). The variants found only by the additional callers are inserted after the previous records with the same (chrom, refStart, refEnd). The result is the same as the merge of all the callers.
+
+    :param previous_path: Path to the previous merged VCF.
+    :type previous_path: str
+    :param inputs_variants: Pathes to the variants files of all the callers.
+    :type inputs_variants: list
+    :param calling_sources: Names of all the variants callers (in same order as inputs_variants).
+    :type calling_sources: list
+    :param first_idx: Index of the first additional caller (see getUpdateStart).
+    :type first_idx: int
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :type nb_jobs: int
+    :param cache_dir: Path to the normalization cache directory. None to disable the cache.
+    :type cache_dir: str
+    :param cache_max_size: Maximum size of the normalization cache (in bytes). None for unlimited.
+    :type cache_max_size: int
+    :param metrics: Measures of the run completed by this function.
+    :type metrics: RunMetrics
+    :param error_log_path: Path to the log of the records that cannot be processed and of the warnings.
+    :type error_log_path: str
+    :param regions: Target regions: only the records of the additional callers overlapping the regions extended by REGIONS_PADDING are read. None to read all the records.
+    :type regions: RegionIndex
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :return: Merged VCF records.
+    :rtype: generator for anacore.vcf.VCFRecord
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    error_log = open(error_log_path, "w")  # Log
+    default_showwarning = redirectWarnings(error_log)
+    try:
+        # Load records of the additional callers
+        reference = None
+        targets = None
+        if NORMALIZER == "internal":  # The inputs are normalized during their reading: without intermediate files
+            normalized_vcfs = inputs_variants[first_idx:]
+            reference = IndexedFasta(REFERENCE_GENOME)
+            targets = None if regions is None else regions.getPadded(REGIONS_PADDING)
+        else:
+            normalized_vcfs = normalize_vcfs(inputs_variants[first_idx:], nb_jobs, cache_dir, cache_max_size, metrics, regions)
+        merge_plans = {}
+        records_by_name = {}  # By variant name: [(caller index, record index, record), ...] in callers order
+        with metrics.phase("merge"):
+            for idx_in, normalized_vcf in enumerate(normalized_vcfs, first_idx):
+                with VCFIO(normalized_vcf) as FH_in:
+                    merge_plans[idx_in] = getMergePlan(idx_in, calling_sources[idx_in], FH_in, annotations_field, shared_filters)
+                    log.info("Process {} (adapter: {})".format(calling_sources[idx_in], merge_plans[idx_in]["adapter"].name))
+                    records = getCallerRecords(FH_in, merge_plans[idx_in], skip_non_variant, reference, targets)
+                    try:
+                        for idx_record, record in enumerate(records):
+                            records_by_name.setdefault(record.getName(), []).append((idx_in, idx_record, record))
+                    except NormalizationError as error:  # Raised by the normalization during the reading
+                        exitNormalizationError(normalized_vcf, error, calling_sources[idx_in])
+            if reference is not None:
+                reference.close()
+            new_keys = sorted(
+                (records[0][-1].chrom, *getRefCoordinates(records[0][-1]), variant_name) for variant_name, records in records_by_name.items()
+            )
+
+        def mergeAdditional(variant_name, variant_by_name):
+            origin = None
+            for idx_in, idx_record, record in records_by_name.pop(variant_name):
+                is_new = variant_name not in variant_by_name
+                mergeRecord(variant_by_name, record, merge_plans[idx_in], prioritize, error_log)
+                if is_new and variant_name in variant_by_name:
+                    origin = (idx_in, idx_record)
+            return origin
+
+        idx_key = 0
+
+        def iterNewVariants(until_key):  # Variants found only by the additional callers and placed before until_key
+            nonlocal idx_key
+            while idx_key < len(new_keys) and (until_key is None or new_keys[idx_key][:3] < until_key):
+                group_key = new_keys[idx_key][:3]
+                group = []
+                while idx_key < len(new_keys) and new_keys[idx_key][:3] == group_key:
+                    variant_name = new_keys[idx_key][-1]
+                    idx_key += 1
+                    if variant_name in records_by_name:  # Not merged in a previous record
+                        variant_by_name = {}
+                        origin = mergeAdditional(variant_name, variant_by_name)
+                        if variant_name in variant_by_name:
+                            group.append((origin, variant_by_name[variant_name]))
+                group.sort(key=lambda elt: elt[0])
+                for origin, record in group:
+                    yield record
+
+        # Merge
+        for ref_start, ref_end, record in iterPreviousMergedRecords(previous_path, calling_sources[:first_idx]):
+            yield from iterNewVariants((record.chrom, ref_start, ref_end))
+            variant_name = record.getName()
+            if variant_name in records_by_name:
+                mergeAdditional(variant_name, {variant_name: record})
+            yield record
+        yield from iterNewVariants(None)
+        for merge_plan in merge_plans.values():
+            metrics.addMergePlan(merge_plan)
+    finally:
+        warnings.showwarning = default_showwarning
+        error_log.close()
+
+def getIndexedNormalizedVCFs(inputs_variants, nb_jobs=1, cache_dir=None, cache_max_size=None, metrics=None, regions=None):
+    """
+    Normalize and index with tabix the variants files.
+
+    :param inputs_variants: Pathes to the variants files.
+    :type inputs_variants: list
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :type nb_jobs: int
+    :param cache_dir: Path to the normalization cache directory. None to disable the cache.
+    :type cache_dir: str
+    :param cache_max_size: Maximum size of the normalization cache (in bytes). None for unlimited.
+    :type cache_max_size: int
+    :param metrics: Measures of the run completed by the normalization and indexing time.
+    :type metrics: RunMetrics
+    :param regions: Target regions: only the records overlapping the regions extended by REGIONS_PADDING are kept. None to keep all the records.
+    :type regions: RegionIndex
+    :return: Pathes to the normalized variants files (in same order as inputs_variants).
+    :rtype: list
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    from pysam import tabix_index  # Lazy import: only used by the modes reading the inputs by region
+    normalized_vcfs = normalize_vcfs(inputs_variants, nb_jobs, cache_dir, cache_max_size, metrics, regions)
+    with metrics.phase("indexing"):
+        for normalized_vcf in normalized_vcfs:
+            tabix_index(normalized_vcf, preset="vcf", force=True)
+    return normalized_vcfs
+
+def getShards(normalized_vcfs, chunk_size=None, regions=None):
+    """
+    Return the regions merged independently, in the same order as the sort applied on the result of getMergedRecords.
+
+    The contigs are in the lexicographic order of their names (ex: 1, 10, 2) and not in the order of the ##contig header lines: the sharded output is identical to the output of the other modes.
+
+    Each region is a contig or, for the contigs longer than chunk_size (length from the ##contig header lines), a chunk of contig. A chunk contains the records with refStart in [start, end[. The first chunk of a contig starts at 0 and the last ends at TABIX_MAX_POS to keep the insertions at the ends of the contig.
+
+    :param normalized_vcfs: Pathes to the normalized and indexed variants files.
+    :type normalized_vcfs: list
+    :param chunk_size: Maximum size of the chunks of contig. None to merge each contig as one region.
+    :type chunk_size: int
+    :param regions: Target regions: the contigs and the chunks without records overlapping the regions extended by REGIONS_PADDING are skipped. None to keep all the contigs.
+    :type regions: RegionIndex
+    :return: Regions (chrom, start, end). start and end are None for a whole contig.
+    :rtype: list
+    """
+    from pysam import TabixFile  # Lazy import: only used by the modes reading the inputs by region
+    padded_regions = None if regions is None else regions.getPadded(REGIONS_PADDING)
+    contigs = set()
+    length_by_contig = {}
+    for normalized_vcf in normalized_vcfs:
+        with TabixFile(normalized_vcf) as FH_idx:
+            contigs.update(FH_idx.contigs)
+        with VCFIO(normalized_vcf) as FH_vcf:
+            for header_line in FH_vcf.extra_header:
+                if header_line.startswith("##contig="):
+                    match_id = re.search(r"[<,]ID=([^,>]+)", header_line)
+                    match_length = re.search(r"[<,]length=(\d+)", header_line)
+                    if match_id and match_length:
+                        length_by_contig[match_id.group(1)] = int(match_length.group(1))
+    shards = []
+    for chrom in sorted(contigs):
+        if padded_regions is not None and not padded_regions.overlaps(chrom, 1, TABIX_MAX_POS):
+            continue
+        if chunk_size is None or length_by_contig.get(chrom, 0) <= chunk_size:
+            shards.append((chrom, None, None))
+        else:
+            for start in range(0, length_by_contig[chrom], chunk_size):
+                end = start + chunk_size
+                if end >= length_by_contig[chrom]:
+                    end = TABIX_MAX_POS
+                if padded_regions is None or padded_regions.overlaps(chrom, max(1, start - 1), end):
+                    shards.append((chrom, start, end))
+    return shards
+
+def mergeShard(normalized_vcfs, shard, calling_sources, annotations_field, shared_filters, prioritize, header, out_path, error_path, lazy=False, profile_path=None, matrix_dir=None, reconcile_overlaps=False, regions=None, skip_non_variant=False):
+    """
+    Merge the records of one region and write them without header in out_path. This function is used by the processes of writeShardedMergedRecords.
+
+    :param normalized_vcfs: Pathes to the normalized and indexed variants files.
+    :type normalized_vcfs: list
+    :param shard: The region (chrom, start, end) as returned by getShards.
+    :type shard: tuple
+    :param calling_sources: Names of the variants callers (in same order as normalized_vcfs).
+    :type calling_sources: list
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param header: VCFHeader elements of the merged VCF (see getNewHeaderAttr).
+    :type header: dict
+    :param out_path: Path to the output records file.
+    :type out_path: str
+    :param error_path: Path to the error log of the region.
+    :type error_path: str
+    :param lazy: Whether to read the records as LazyRecord (values are kept as written by the callers).
+    :type lazy: bool
+    :param profile_path: Path to the cProfile statistics of the region. None to disable profiling.
+    :type profile_path: str
+    :param matrix_dir: Path to the columnar output of the region (see VariantMatrixWriter). None to disable this output.
+    :type matrix_dir: str
+    :param reconcile_overlaps: Whether to remove the SNVs corresponding to the decomposed form of complex variants found by other callers (see reconcileOverlappingRecords).
+    :type reconcile_overlaps: bool
+    :param regions: Target regions: only the merged records overlapping these regions are written. None to write all the records.
+    :type regions: RegionIndex
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    :return: Measures of the region merge.
+    :rtype: RunMetrics
+    """
+    chrom, start, end = shard
+    metrics = RunMetrics(calling_sources=calling_sources)
+    FH_inputs = [(LazyVCFIO if lazy else VCFIO)(normalized_vcf, "i") for normalized_vcf in normalized_vcfs]
+    with open(error_path, "w") as error_log:
+        default_showwarning = redirectWarnings(error_log)
+        try:
+            with metrics.phase("regions"), profiling(profile_path), MergedVCFIO(out_path, "w") as FH_out:
+                FH_out.samples = header["samples"]
+                FH_out.info = header["info"]
+                FH_out.format = header["format"]
+                FH_out.filter = header["filter"]
+                if matrix_dir is not None:
+                    FH_out.matrix = VariantMatrixWriter(matrix_dir, calling_sources, header["samples"])
+                records = iterContigMergedRecords(FH_inputs, chrom, calling_sources, annotations_field, shared_filters, prioritize, error_log, start, end, metrics, regions, skip_non_variant)
+                if reconcile_overlaps:
+                    records = reconcileOverlappingRecords(records, calling_sources, metrics)
+                if regions is not None:
+                    records = (record for record in records if regions.overlapsRecord(record))
+                for record in records:
+                    if record.filter is not None and len(record.filter) == 0:
+                        record.filter = ["PASS"]
+                    metrics.countVariant(record)
+                    FH_out.write(record)
+        finally:
+            warnings.showwarning = default_showwarning
+            for FH_in in FH_inputs:
+                FH_in.close()
+    return metrics
+
+def writeShardedMergedRecords(FH_out, inputs_variants, calling_sources, annotations_field, shared_filters, prioritize, header, nb_processes, chunk_size=None, nb_jobs=1, cache_dir=None, cache_max_size=None, lazy=False, metrics=None, profile_path=None, error_log_path="error_records.log", reconcile_overlaps=False, regions=None, skip_non_variant=False):
+    """
+    Merge VCFRecords coming from several variant callers by region in a pool of processes and write them in the output.
+
+    Normalized inputs are indexed and split in contigs or chunks of contigs (see getShards). Each region is merged in a process with the same rules as getStreamedMergedRecords and the regions outputs are concatenated in order: the result is the same as the other merge modes.
+
+    :param FH_out: The output file where the header is already written. The regions are added to its columnar output if it is set.
+    :type FH_out: MergedVCFIO
+    :param inputs_variants: Pathes to the variants files.
+    :type inputs_variants: list
+    :param calling_sources: Names of the variants callers (in same order as inputs_variants).
+    :type calling_sources: list
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix.
+    :type shared_filters: set
+    :param prioritize: Whether to prioritize complex variants over simple variants.
+    :type prioritize: bool
+    :param header: VCFHeader elements of the merged VCF (see getNewHeaderAttr).
+    :type header: dict
+    :param nb_processes: Number of processes used to merge the regions.
+    :type nb_processes: int
+    :param chunk_size: Maximum size of the chunks of contig. None to merge each contig as one region.
+    :type chunk_size: int
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :type nb_jobs: int
+    :param cache_dir: Path to the normalization cache directory. None to disable the cache.
+    :type cache_dir: str
+    :param cache_max_size: Maximum size of the normalization cache (in bytes). None for unlimited.
+    :type cache_max_size: int
+    :param lazy: Whether to read the records as LazyRecord (values are kept as written by the callers).
+    :type lazy: bool
+    :param metrics: Measures of the run completed by the measures of the processes. The time of the "regions" phase is summed over the processes.
+    :type metrics: RunMetrics
+    :param profile_path: Path to the cProfile statistics of the regions merge (the statistics of the processes are added). None to disable profiling.
+    :type profile_path: str
+    :param error_log_path: Path to the log of the records that cannot be processed and of the warnings.
+    :type error_log_path: str
+    :param reconcile_overlaps: Whether to remove the SNVs corresponding to the decomposed form of complex variants found by other callers (see reconcileOverlappingRecords). The variants overlapping the limit between two chunks of contig are not reconciled.
+    :type reconcile_overlaps: bool
+    :param regions: Target regions: only the merged records overlapping these regions are written. None to write all the records.
+    :type regions: RegionIndex
+    :param skip_non_variant: Whether to drop the hom-ref, no-call and reference blocks lines of the callers before parsing (see VariantLinesReader).
+    :type skip_non_variant: bool
+    """
+    from concurrent.futures import ProcessPoolExecutor  # Lazy import: only used with several processes
+    if metrics is None:
+        metrics = RunMetrics()
+    normalized_vcfs = getIndexedNormalizedVCFs(inputs_variants, nb_jobs, cache_dir, cache_max_size, metrics, regions)
+    shards = getShards(normalized_vcfs, chunk_size, regions)
+    log.info("Merge {} regions with {} processes".format(len(shards), nb_processes))
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(FH_out.filepath)))
+    try:
+        with ProcessPoolExecutor(max_workers=nb_processes) as executor, open(error_log_path, "w") as error_log:
+            futures = []
+            profiles = []
+            for idx_shard, shard in enumerate(shards):
+                shard_profile = None if profile_path is None else os.path.join(tmp_dir, "{}.prof".format(idx_shard))
+                shard_matrix = None if FH_out.matrix is None else os.path.join(tmp_dir, "{}.matrix".format(idx_shard))
+                futures.append((
+                    executor.submit(
+                        mergeShard, normalized_vcfs, shard, calling_sources, annotations_field, shared_filters, prioritize, header,
+                        os.path.join(tmp_dir, "{}.vcf".format(idx_shard)), os.path.join(tmp_dir, "{}.log".format(idx_shard)), lazy, shard_profile, shard_matrix, reconcile_overlaps, regions, skip_non_variant
+                    ),
+                    os.path.join(tmp_dir, "{}.vcf".format(idx_shard)),
+                    os.path.join(tmp_dir, "{}.log".format(idx_shard)),
+                    shard_matrix
+                ))
+                if shard_profile is not None:
+                    profiles.append(shard_profile)
+            for future, out_path, error_path, matrix_dir in futures:  # Concatenate in regions order
+                metrics.update(future.result())
+                with open(out_path) as FH_shard:
+                    for line in FH_shard:
+                        FH_out.writeVCFLine(line[:-1])
+                if matrix_dir is not None:
+                    FH_out.matrix.append(matrix_dir)
+                    shutil.rmtree(matrix_dir)
+                with open(error_path) as FH_shard_error:
+                    shutil.copyfileobj(FH_shard_error, error_log)
+                os.remove(out_path)
+                os.remove(error_path)
+        if len(profiles) != 0:
+            import pstats  # Lazy import: only used for profiling
+            pstats.Stats(*profiles).dump_stats(profile_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def logACVariance(concordance, log):
+    """
+    Display in log the differences on allele counts (AD and AF) between callers.
+
+    :param concordance: Differences of AD, DP and AF between callers of the shared variants.
+    :type concordance: ConcordanceStats
+    :param log: Logger object.
+    :type log: logging.Logger
+    """
+    stats = concordance.toDict()
+    if len(stats["pairs"]) == 0 or stats["shared_variants"] == 0:
+        log.info("Differences between callers (without missing): 0 common variants")
+        return
+    for pair, pair_stats in stats["pairs"].items():
+        for metric, value_format in [("AF", "{:.1%}"), ("AD", "{}")]:
+            metric_stats = pair_stats[metric]
+            if metric_stats["count"] == 0:
+                log.info("Differences of {} between {} (without missing): 0 common variants".format(metric, pair))
+            else:
+                log.info("Differences of {} between {} (without missing): median={}, upper_quartile={}, 90_persentile={} and max={} on {} variants by sample".format(
+                    metric,
+                    pair,
+                    value_format.format(metric_stats["median"]),
+                    value_format.format(metric_stats["p75"]),
+                    value_format.format(metric_stats["p90"]),
+                    value_format.format(metric_stats["max"]),
+                    metric_stats["count"]
+                ))
+
+
+def processSample(args, metrics=None, error_log_path="error_records.log"):
+    """
+    Merge the VCF of the callers of one sample and write the result.
+
+    :param args: The merge parameters: inputs_variants, calling_sources, output_variants, annotations_field, shared_filters (set), prioritize, jobs, cache_dir, cache_max_size (in GB), streaming, processes, chunk_size, lazy, profile, compression_threads, concordance_json, output_matrix, reconcile_overlaps, update_from, write_state, regions and skip_non_variant (see the command line parameters).
+    :type args: argparse.Namespace
+    :param metrics: Measures of the run completed by this function. None to create a new one.
+    :type metrics: RunMetrics
+    :param error_log_path: Path to the log of the records that cannot be processed and of the warnings.
+    :type error_log_path: str
+    :return: Measures of the run.
+    :rtype: RunMetrics
+    """
+    if metrics is None:
+        metrics = RunMetrics(args.inputs_variants, args.calling_sources)
+    default_showwarning = warnings.showwarning
+    try:
+        # Get merged records
+        cache_max_size = int(args.cache_max_size * 1024**3)
+        regions = None if args.regions is None else RegionIndex.fromBED(args.regions)
+        first_idx = None
+        if args.update_from is not None:
+            first_idx, reason = getUpdateStart(args, args.update_from)
+            if first_idx is None:
+                log.warning("The merge {} cannot be updated: {}. All the callers are merged.".format(args.update_from, reason))
+            else:
+                log.info("Update {} with {}".format(args.update_from, args.calling_sources[first_idx:]))
+        if first_idx is not None:
+            variants = getUpdatedMergedRecords(args.update_from, args.inputs_variants, args.calling_sources, first_idx, args.annotations_field, args.shared_filters, args.prioritize, args.jobs, args.cache_dir, cache_max_size, metrics, error_log_path, regions, args.skip_non_variant)
+        elif args.processes > 1:
+            variants = None  # Records are merged and written by regions after the header
+        elif args.streaming:
+            variants = getStreamedMergedRecords(args.inputs_variants, args.calling_sources, args.annotations_field, args.shared_filters, args.prioritize, args.jobs, args.cache_dir, cache_max_size, args.lazy, metrics, error_log_path, regions, args.skip_non_variant)
+        else:
+            with profiling(args.profile):
+                variants = getMergedRecords(args.inputs_variants, args.calling_sources, args.annotations_field, args.shared_filters, args.prioritize, args.jobs, args.cache_dir, cache_max_size, args.lazy, metrics, error_log_path, regions, args.skip_non_variant)
+            with metrics.phase("sort"):
+                variants = sorted(variants, key=lambda record: (record.chrom, record.refStart(), record.refEnd()))
+        if variants is not None and args.reconcile_overlaps:
+            variants = reconcileOverlappingRecords(variants, args.calling_sources, metrics)
+        if variants is not None and regions is not None:  # The records around the regions are merged to obtain the same result as a merge without regions
+            variants = (record for record in variants if regions.overlapsRecord(record))
+
+        # Write
+        with MergedVCFIO(args.output_variants, "w", args.compression_threads) as FH_out:
+            # Header
+            with metrics.phase("header"):
+                if first_idx is None:
+                    new_header = getNewHeaderAttr(args)
+                else:
+                    new_header = getNewHeaderAttr(args, getPreviousHeaderAttr(args.update_from), first_idx)
+            FH_out.samples = new_header["samples"]
+            FH_out.info = new_header["info"]
+            FH_out.format = new_header["format"]
+            FH_out.filter = new_header["filter"]
+            FH_out.writeHeader()
+            if args.output_matrix is not None:
+                FH_out.matrix = VariantMatrixWriter(args.output_matrix, args.calling_sources, new_header["samples"])
+            # Records
+            if variants is None:
+                with metrics.phase("merge_and_write"):
+                    writeShardedMergedRecords(FH_out, args.inputs_variants, args.calling_sources, args.annotations_field, args.shared_filters, args.prioritize, new_header, args.processes, args.chunk_size, args.jobs, args.cache_dir, cache_max_size, args.lazy, metrics, args.profile, error_log_path, args.reconcile_overlaps, regions, args.skip_non_variant)
+            else:
+                # In streaming and update modes the records are merged during the write
+                is_streamed = args.streaming or first_idx is not None
+                with metrics.phase("merge_and_write" if is_streamed else "write"), profiling(args.profile if is_streamed else None):
+                    for record in variants:
+                        if record.filter is not None and len(record.filter) == 0:
+                            record.filter = ["PASS"]
+                        metrics.countVariant(record)
+                        FH_out.write(record)
+
+        # Log prefiltered lines
+        for caller, caller_metrics in metrics.callers.items():
+            if "prefilter" in caller_metrics:
+                log.info("Prefilter {}: {} lines kept and {} hom-ref, no-call or reference blocks lines dropped".format(caller, caller_metrics["prefilter"]["kept"], caller_metrics["prefilter"]["dropped"]))
+
+        # Log differences in AF and AD
+        if metrics.concordance is not None:
+            logACVariance(metrics.concordance, log)
+            if args.concordance_json is not None:
+                metrics.concordance.write(args.concordance_json)
+        if args.write_state:
+            writeMergeState(args)
+    finally:
+        warnings.showwarning = default_showwarning
+    return metrics
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+def main(argv=None):
+    """
+    Merge the VCF with the command line parameters.
+
+    :param argv: The command line parameters without the program name. None to use sys.argv.
+    :type argv: list
+    """
+    global BCFTOOLS_PATH, NORMALIZER, REFERENCE_GENOME
+    # Manage parameters
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description='Merge VCF coming from different calling on same sample(s). It is strongly recommended to apply this script after standardization and before annotation and filtering/tagging.')
+    parser.add_argument('-a', '--annotations-field', default="ANN", help='Field used to store annotations. [Default: %(default)s]')
+    parser.add_argument('-s', '--shared-filters', nargs='*', default=["lowAF", "OOT", "homoP", "popAF", "CSQ", "ANN.COLLOC", "ANN.RNA", "ANN.CSQ", "ANN.popAF"], help='Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix. [Default: %(default)s]')
+    parser.add_argument('-c', '--calling-sources', required=True, nargs='+', help='Name of the source in same order of --inputs-variants.')
+    parser.add_argument('-p', '--prioritize', action='store_true', help='Prioritize complex variants over simple variants at the same position.') # JC
+    parser.add_argument('-g', '--reconcile-overlaps', action='store_true', help='Group the variants with overlapping reference intervals and remove the SNVs corresponding to the decomposed form of a complex variant (MNV, indel) found by other callers. The callers of the removed SNVs are reported in the INFO DECSRC of the complex variant. With several processes, the variants overlapping the limit between two chunks of contig are not reconciled. The output cannot be updated with --update-from.')
+    parser.add_argument('-v', '--update-from', help='Path to a previous merged VCF of the first callers, produced with --write-state. Only the callers added after them are normalized and merged in the previous records (the result is the same as the merge of all the callers). If the previous merge cannot be updated, a warning gives the reason and all the callers are merged (use --cache-dir to skip the normalization of the unchanged inputs): content of the input of a previous caller changed (the contribution of a caller is not removed from the previous records), previous callers not in first positions, different options or state file missing. The merges with --lazy or --reconcile-overlaps are never updated: their records are not the same as in a merge of typed records. A previous caller run again with the same output is accepted.')
+    parser.add_argument('--write-state', action='store_true', help='Write the description of the merge in [output].state.json to allow its update with --update-from. The SHA-256 of each input is computed: the inputs are read one more time.')
+    parser.add_argument('-y', '--skip-non-variant', action='store_true', help='Drop the hom-ref (ex: 0/0, 0|0), no-call (ex: ./.) and reference blocks (ALT <NON_REF> or <*>) records of the callers before parsing them: the raw lines are selected on ALT and GT. Use it with all-sites or gVCF callers outputs. Without this option only the records with GT 0/0 in the last sample are removed (after parsing). The numbers of kept and dropped lines by caller are in the metrics.')
+    parser.add_argument('-b', '--bcftools', default=BCFTOOLS_PATH, help='Path to bcftools or to a command accepting the same "norm" arguments used to normalize the inputs. [Default: %(default)s]')
+    parser.add_argument('--normalizer', choices=["bcftools", "internal"], default=NORMALIZER, help='Engine used to split the multiallelic records and to left-align the indels. "bcftools" runs "bcftools norm -m -both" in a sub-process by input. "internal" normalizes the raw lines in the merge process with the same result: the in-memory merge and --update-from read the inputs without intermediate files, and the other modes write the normalized inputs from threads. [Default: %(default)s]')
+    parser.add_argument('--reference', default=REFERENCE_GENOME, help='Path to the reference genome used by the normalization (format: FASTA indexed with samtools faidx). [Default: %(default)s]')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Maximum number of VCF normalizations running at the same time. [Default: %(default)s]')
+    parser.add_argument('-k', '--cache-dir', help='Directory used to store the normalized VCFs and to skip normalization of already normalized inputs. It can be shared by concurrent runs. [Default: no cache]')
+    parser.add_argument('-m', '--cache-max-size', type=float, default=20, help='Maximum size of the normalization cache (in GB): the least recently used files are removed beyond this size. [Default: %(default)s]')
+    parser.add_argument('-t', '--streaming', action='store_true', help='Merge the normalized inputs contig by contig with a k-way merge on position and write each merged record as soon as it is complete. The memory usage does not depend on the number of variants and the output is the same.')
+    parser.add_argument('-n', '--processes', type=int, default=1, help='Number of processes used to merge contigs (or chunks of long contigs) in parallel. With more than one process, the regions are merged as in --streaming mode. As in the other modes, the contigs are written in the lexicographic order of their names (ex: 1, 10, 2), not in the order of the ##contig header lines. [Default: %(default)s]')
+    parser.add_argument('-z', '--chunk-size', type=int, default=10000000, help='With several processes, the contigs longer than this size are split in chunks of this size. [Default: %(default)s]')
+    parser.add_argument('-l', '--lazy', action='store_true', help='Keep INFO and samples values as raw strings: they are decoded only to extract AD, DP and GT and they are written as in the callers VCF (numbers are not re-formatted and missing values are not expanded). The output cannot be updated with --update-from.')
+    parser.add_argument('-d', '--caller-adapters', nargs='*', default=[], help='Python files registering additional callers adapters used to extract AD, DP and GT (sub-classes of CallerAdapter decorated by registerCallerAdapter, both available without import). The method extract returns the support of the sample and None, or None and the reason (ex: "missing AD") when the record must be skipped. The adapter is selected from the calling source name, otherwise from the VCF header (with a warning).')
+    parser.add_argument('-e', '--metrics-json', help='Path to the measures of the run (format: JSON): wall and CPU time by phase, normalization time, records, records by second and errors by caller, shared and private variants counts and peak memory. [Default: no metrics file]')
+    parser.add_argument('-q', '--concordance-json', help='Path to the differences of AD, DP and AF between each pair of callers on the shared variants: median, 75th and 90th percentiles and maximum (format: JSON). These differences are always displayed in the log. [Default: no concordance file]')
+    parser.add_argument('-f', '--profile', help='Path to the cProfile statistics of the merge (format: pstats). With several processes, the statistics of the processes are added. [Default: no profiling]')
+    parser.add_argument('-u', '--compression-threads', type=int, default=1, help='Number of threads used to compress the output when its path ends with .gz. [Default: %(default)s]')
+    group_input = parser.add_argument_group('Inputs')  # Inputs
+    group_input.add_argument('-r', '--regions', help='Path to the target regions (format: BED). Only the variants overlapping these regions are normalized, read and written: the inputs are normalized with the targets option of bcftools and the merge reads the normalized inputs with random accesses on the regions extended by {} nucleotids. The result is the same as a merge without regions followed by a filter on the regions. [Default: all the variants]'.format(REGIONS_PADDING))
+    group_input.add_argument('-i', '--inputs-variants', required=True, nargs='+', help='Path to the variants files coming from different callers (format: VCF). The order determine the which AF and AD are retained: the first caller where it is found in this list.')
+    group_output = parser.add_argument_group('Outputs')  # Outputs
+    group_input.add_argument('-o', '--output-variants', required=True, help='Path to the merged variants file (format: VCF). If the path ends with .gz, the file is compressed in BGZF and indexed with tabix (.tbi) during the write. Tabix requires the records sorted by position: in compressed output, the records are moved to position order in a window of 10 kb (ex: a left-aligned deletion written before the SNV at the next position), so their order can differ from the uncompressed output, and the merge fails if a record must be moved further. An index which cannot be built during the write (positions beyond 2^29) is replaced by a CSI index.')
+    group_output.add_argument('-x', '--output-matrix', help='Path to the directory of the merged variants in columns (format: NumPy .npy by column, loadable with memory mapping): one row by merged variant with chrom, pos, ref, alt, callers bitmask, QUAL by caller and GT, AD and DP by caller and sample (see VariantMatrixWriter). [Default: no columnar output]')
+    args = parser.parse_args(argv)
+    args.shared_filters = set(args.shared_filters)
+    if args.update_from is not None and os.path.abspath(args.update_from) == os.path.abspath(args.output_variants):
+        parser.error("the output must be different from the updated merge")
+    BCFTOOLS_PATH = args.bcftools
+    NORMALIZER = args.normalizer
+    REFERENCE_GENOME = args.reference
+    for adapters_path in args.caller_adapters:
+        loadCallerAdapters(adapters_path)
+
+    # Logger
+    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.INFO)
+    log.info("Command: " + " ".join(sys.argv if argv is None else [__file__] + argv))
+
+    # Process
+    metrics = processSample(args)
+    if args.metrics_json is not None:
+        metrics.write(args.metrics_json)
+    if os.path.getsize("error_records.log") > 0:
+        print("There are some variants that require your attention. Please check error_records.log for warnings or errors that occurred during processing.") # JC
+    log.info("End of job")
+
+
+if __name__ == "__main__":
+    main()
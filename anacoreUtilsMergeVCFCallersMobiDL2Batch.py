@@ -0,0 +1,306 @@
+#!/mnt/Bioinfo/Softs/src/conda/Anaconda2-2019.07/envs/mobiDL/bin/python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import anacoreUtilsMergeVCFCallersMobiDL2 as merger
+
+
+MANIFEST_FIELDS = ["sample", "calling_sources", "inputs_variants", "output_variants"]
+SUMMARY_FIELDS = ["sample", "status", "wall_s", "cpu_s", "variants", "errored_records", "output_variants", "error_log", "metrics", "message"]
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def readManifest(manifest_path):
+    """
+    Return the samples described in the manifest.
+
+    The manifest is a JSON list of objects or a TSV file with a title line. Each sample has the fields: sample (name), calling_sources (list), inputs_variants (list in same order as calling_sources) and output_variants. In TSV the lists are comma separated.
+
+    :param manifest_path: Path to the manifest (format: JSON if the extension is .json, otherwise TSV).
+    :type manifest_path: str
+    :return: The samples.
+    :rtype: list
+    """
+    if manifest_path.endswith(".json"):
+        with open(manifest_path) as FH_manifest:
+            samples = json.load(FH_manifest)
+    else:
+        samples = []
+        with open(manifest_path) as FH_manifest:
+            titles = FH_manifest.readline().rstrip("\n").split("\t")
+            for line in FH_manifest:
+                if line.strip() != "":
+                    sample = dict(zip(titles, line.rstrip("\n").split("\t")))
+                    for list_field in ["calling_sources", "inputs_variants"]:
+                        if list_field in sample:
+                            sample[list_field] = [elt.strip() for elt in sample[list_field].split(",")]
+                    samples.append(sample)
+    # Check
+    names = set()
+    outputs = set()
+    for sample in samples:
+        for field in MANIFEST_FIELDS:
+            if field not in sample:
+                raise ValueError("The field {} is missing for sample {} in manifest {}.".format(field, sample.get("sample"), manifest_path))
+        if len(sample["calling_sources"]) != len(sample["inputs_variants"]):
+            raise ValueError("The number of calling sources and inputs variants are different for sample {} in manifest {}.".format(sample["sample"], manifest_path))
+        if sample["sample"] in names:
+            raise ValueError("The sample {} is duplicated in manifest {}.".format(sample["sample"], manifest_path))
+        if os.path.abspath(sample["output_variants"]) in outputs:
+            raise ValueError("The output {} is used by several samples in manifest {}.".format(sample["output_variants"], manifest_path))
+        names.add(sample["sample"])
+        outputs.add(os.path.abspath(sample["output_variants"]))
+    return samples
+
+def initWorker(bcftools_path, caller_adapters, normalizer="bcftools", reference=merger.REFERENCE_GENOME):
+    """
+    Initialize a process of the pool: logger, normalization engine and additional callers adapters.
+
+    :param bcftools_path: Path to bcftools or to a command accepting the same "norm" arguments.
+    :type bcftools_path: str
+    :param caller_adapters: Python files registering additional callers adapters.
+    :type caller_adapters: list
+    :param normalizer: Normalization engine: "bcftools" or "internal" (see anacoreUtilsMergeVCFCallersMobiDL2.py).
+    :type normalizer: str
+    :param reference: Path to the reference genome used by the normalization.
+    :type reference: str
+    """
+    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+    merger.log.setLevel(logging.INFO)
+    merger.BCFTOOLS_PATH = bcftools_path
+    merger.NORMALIZER = normalizer
+    merger.REFERENCE_GENOME = reference
+    for adapters_path in caller_adapters:
+        merger.loadCallerAdapters(adapters_path)
+
+def processManifestSample(sample, merge_args):
+    """
+    Merge the callers VCF of one sample. The errors are reported in the returned status and do not stop the batch.
+
+    :param sample: The sample as returned by readManifest.
+    :type sample: dict
+    :param merge_args: The merge parameters shared by the samples (see processSample in anacoreUtilsMergeVCFCallersMobiDL2).
+    :type merge_args: dict
+    :return: The status of the sample (see SUMMARY_FIELDS).
+    :rtype: dict
+    """
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    status = {
+        "sample": sample["sample"],
+        "status": "ok",
+        "variants": None,
+        "errored_records": None,
+        "output_variants": sample["output_variants"],
+        "error_log": sample["output_variants"] + ".error_records.log",
+        "metrics": sample["output_variants"] + ".metrics.json",
+        "message": ""
+    }
+    args = argparse.Namespace(
+        inputs_variants=sample["inputs_variants"],
+        calling_sources=sample["calling_sources"],
+        output_variants=sample["output_variants"],
+        **merge_args
+    )
+    merger.log.info("Start sample {}".format(sample["sample"]))
+    try:
+        metrics = merger.processSample(args, None, status["error_log"])
+        metrics.write(status["metrics"])
+        status["variants"] = metrics.variants["total"]
+        status["errored_records"] = sum(
+            sum(caller_metrics["errors"].values()) for caller_metrics in metrics.callers.values()
+        )
+        if os.path.getsize(status["error_log"]) > 0:
+            status["message"] = "Some variants require your attention: see the error log."
+    except SystemExit as error:  # The normalization exits on error
+        status["status"] = "failed"
+        status["metrics"] = None
+        status["message"] = "Exit with status {} (see the log)".format(error.code)
+        merger.log.error("Sample {} failed: {}".format(sample["sample"], status["message"]))
+    except Exception as error:
+        status["status"] = "failed"
+        status["metrics"] = None
+        status["message"] = "{}: {}".format(type(error).__name__, error)
+        merger.log.error("Sample {} failed: {}".format(sample["sample"], status["message"]))
+    status["wall_s"] = time.perf_counter() - start_wall
+    status["cpu_s"] = time.process_time() - start_cpu
+    merger.log.info("End sample {} ({}, {:.1f}s)".format(sample["sample"], status["status"], status["wall_s"]))
+    return status
+
+def getFailedStatus(sample, error):
+    """
+    Return the status of a sample whose process has not returned a status.
+
+    :param sample: The sample as returned by readManifest.
+    :type sample: dict
+    :param error: The exception raised by the result of the process.
+    :type error: Exception
+    :return: The status of the sample (see SUMMARY_FIELDS).
+    :rtype: dict
+    """
+    status = {
+        "sample": sample["sample"],
+        "status": "failed",
+        "output_variants": sample["output_variants"],
+        "message": "{}: {}".format(type(error).__name__, error)
+    }
+    merger.log.error("Sample {} failed: {}".format(sample["sample"], status["message"]))
+    return status
+
+def processSamples(samples, merge_args, nb_workers=1, init_args=()):
+    """
+    Return the status of the samples merged by a pool of processes.
+
+    A process killed during a merge (out of memory, signal) breaks the pool and all its unfinished samples. These samples are processed again each in its own process (nb_workers at the same time): only the sample killing its process is failed.
+
+    :param samples: The samples as returned by readManifest.
+    :type samples: list
+    :param merge_args: The merge parameters shared by the samples (see processSample in anacoreUtilsMergeVCFCallersMobiDL2).
+    :type merge_args: dict
+    :param nb_workers: Number of samples processed at the same time.
+    :type nb_workers: int
+    :param init_args: The parameters of initWorker.
+    :type init_args: tuple
+    :return: The status of the samples in the same order as samples (see SUMMARY_FIELDS).
+    :rtype: list
+    """
+    status_by_idx = {}
+    broken_idx = []
+    with ProcessPoolExecutor(max_workers=nb_workers, initializer=initWorker, initargs=init_args) as executor:
+        futures = [executor.submit(processManifestSample, sample, merge_args) for sample in samples]
+        for idx, future in enumerate(futures):
+            try:
+                status_by_idx[idx] = future.result()
+            except BrokenProcessPool:  # A process has been killed
+                broken_idx.append(idx)
+            except Exception as error:
+                status_by_idx[idx] = getFailedStatus(samples[idx], error)
+    # Process again the samples of the broken pool in isolated processes
+    if len(broken_idx) != 0:
+        merger.log.warning("A process of the pool has been killed: the {} unfinished samples are processed again each in its own process.".format(len(broken_idx)))
+    running = {}
+    try:
+        while len(broken_idx) != 0 or len(running) != 0:
+            while len(broken_idx) != 0 and len(running) < nb_workers:
+                idx = broken_idx.pop(0)
+                executor = ProcessPoolExecutor(max_workers=1, initializer=initWorker, initargs=init_args)
+                running[executor.submit(processManifestSample, samples[idx], merge_args)] = (idx, executor)
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, executor = running.pop(future)
+                executor.shutdown()
+                try:
+                    status_by_idx[idx] = future.result()
+                except Exception as error:  # The process has been killed
+                    status_by_idx[idx] = getFailedStatus(samples[idx], error)
+    finally:
+        for idx, executor in running.values():
+            executor.shutdown()
+    return [status_by_idx[idx] for idx in range(len(samples))]
+
+def writeSummary(out_path, statuses):
+    """
+    Write the status of the samples.
+
+    :param out_path: Path to the output file (format: TSV).
+    :type out_path: str
+    :param statuses: The status of the samples (see processManifestSample).
+    :type statuses: list
+    """
+    with open(out_path, "w") as FH_out:
+        FH_out.write("\t".join(SUMMARY_FIELDS) + "\n")
+        for status in statuses:
+            row = []
+            for field in SUMMARY_FIELDS:
+                value = status.get(field)
+                if value is None:
+                    value = ""
+                elif isinstance(value, float):
+                    value = "{:.3f}".format(value)
+                row.append(str(value))
+            FH_out.write("\t".join(row) + "\n")
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Merge the VCF coming from different calling for each sample of a cohort. The samples are processed by a pool of processes: the interpreter and the libraries are loaded once by process. Each sample has its own error log ([output_variants].error_records.log) and metrics ([output_variants].metrics.json), and a failure on one sample does not stop the others (the samples of a process killed by the system are processed again in isolated processes).')
+    parser.add_argument('-a', '--annotations-field', default="ANN", help='Field used to store annotations. [Default: %(default)s]')
+    parser.add_argument('-s', '--shared-filters', nargs='*', default=["lowAF", "OOT", "homoP", "popAF", "CSQ", "ANN.COLLOC", "ANN.RNA", "ANN.CSQ", "ANN.popAF"], help='Filters tags applying to the variant and independent of caller like filters on annotations. These filters are not renamed to add caller ID as suffix. [Default: %(default)s]')
+    parser.add_argument('-p', '--prioritize', action='store_true', help='Prioritize complex variants over simple variants at the same position.')
+    parser.add_argument('-g', '--reconcile-overlaps', action='store_true', help='Remove the SNVs corresponding to the decomposed form of a complex variant found by other callers (see anacoreUtilsMergeVCFCallersMobiDL2.py).')
+    parser.add_argument('-y', '--skip-non-variant', action='store_true', help='Drop the hom-ref, no-call and reference blocks records of the callers before parsing them (see anacoreUtilsMergeVCFCallersMobiDL2.py).')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of samples processed at the same time. [Default: %(default)s]')
+    parser.add_argument('-b', '--bcftools', default=merger.BCFTOOLS_PATH, help='Path to bcftools or to a command accepting the same "norm" arguments used to normalize the inputs. [Default: %(default)s]')
+    parser.add_argument('--normalizer', choices=["bcftools", "internal"], default=merger.NORMALIZER, help='Engine used to split the multiallelic records and to left-align the indels (see anacoreUtilsMergeVCFCallersMobiDL2.py). [Default: %(default)s]')
+    parser.add_argument('--reference', default=merger.REFERENCE_GENOME, help='Path to the reference genome used by the normalization (format: FASTA indexed with samtools faidx). [Default: %(default)s]')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Maximum number of VCF normalizations running at the same time for one sample. [Default: %(default)s]')
+    parser.add_argument('-k', '--cache-dir', help='Directory used to store the normalized VCFs and to skip normalization of already normalized inputs. [Default: no cache]')
+    parser.add_argument('-m', '--cache-max-size', type=float, default=20, help='Maximum size of the normalization cache (in GB). [Default: %(default)s]')
+    parser.add_argument('-t', '--streaming', action='store_true', help='Merge the normalized inputs contig by contig (see anacoreUtilsMergeVCFCallersMobiDL2.py).')
+    parser.add_argument('-l', '--lazy', action='store_true', help='Keep INFO and samples values as raw strings (see anacoreUtilsMergeVCFCallersMobiDL2.py).')
+    parser.add_argument('-d', '--caller-adapters', nargs='*', default=[], help='Python files registering additional callers adapters (see anacoreUtilsMergeVCFCallersMobiDL2.py).')
+    parser.add_argument('-u', '--compression-threads', type=int, default=1, help='Number of threads used to compress the outputs when their path ends with .gz (BGZF indexed with tabix). [Default: %(default)s]')
+    group_input = parser.add_argument_group('Inputs')  # Inputs
+    group_input.add_argument('-r', '--regions', help='Path to the target regions shared by the samples (format: BED). Only the variants overlapping these regions are merged (see anacoreUtilsMergeVCFCallersMobiDL2.py). [Default: all the variants]')
+    group_input.add_argument('-i', '--input-manifest', required=True, help='Path to the samples description (format: JSON if the extension is .json, otherwise TSV). Each sample has the fields: sample, calling_sources, inputs_variants and output_variants. In TSV, the file starts with the fields titles and the lists are comma separated.')
+    group_output = parser.add_argument_group('Outputs')  # Outputs
+    group_output.add_argument('-o', '--output-summary', default="batch_summary.tsv", help='Path to the status, time, number of variants and number of records in error by sample (format: TSV). [Default: %(default)s]')
+    args = parser.parse_args()
+
+    # Logger
+    logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.INFO)
+    log.info("Command: " + " ".join(sys.argv))
+
+    # Process
+    samples = readManifest(args.input_manifest)
+    merge_args = {
+        "annotations_field": args.annotations_field,
+        "shared_filters": set(args.shared_filters),
+        "prioritize": args.prioritize,
+        "jobs": args.jobs,
+        "cache_dir": args.cache_dir,
+        "cache_max_size": args.cache_max_size,
+        "streaming": args.streaming,
+        "processes": 1,
+        "chunk_size": None,
+        "lazy": args.lazy,
+        "profile": None,
+        "compression_threads": args.compression_threads,
+        "concordance_json": None,
+        "output_matrix": None,
+        "reconcile_overlaps": args.reconcile_overlaps,
+        "update_from": None,
+        "write_state": False,
+        "regions": args.regions,
+        "skip_non_variant": args.skip_non_variant
+    }
+    statuses = processSamples(samples, merge_args, args.workers, (args.bcftools, args.caller_adapters, args.normalizer, args.reference))
+    writeSummary(args.output_summary, statuses)
+    nb_failed = sum(1 for status in statuses if status["status"] != "ok")
+    log.info("{} samples processed, {} failed".format(len(statuses), nb_failed))
+    if nb_failed != 0:
+        sys.exit(1)
+    log.info("End of job")
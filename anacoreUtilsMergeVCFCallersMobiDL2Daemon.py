@@ -0,0 +1,192 @@
+#!/mnt/Bioinfo/Softs/src/conda/Anaconda2-2019.07/envs/mobiDL/bin/python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def sendMessage(conn, message):
+    """
+    Send a message on the connection. Messages are JSON objects on one line.
+
+    :param conn: The connection.
+    :type conn: socket.socket
+    :param message: The message.
+    :type message: dict
+    """
+    conn.sendall((json.dumps(message) + "\n").encode())
+
+def readMessage(conn):
+    """
+    Return the next message of the connection.
+
+    :param conn: The connection.
+    :type conn: socket.socket
+    :return: The message or None if the connection is closed before the end of the message.
+    :rtype: dict
+    """
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        if chunk.endswith(b"\n"):
+            return json.loads(b"".join(chunks).decode())
+
+def runJob(conn, request):
+    """
+    Run the merge of a request in the current process and send the exit status and the log to the client. This function is called in the process forked by the daemon for the request.
+
+    :param conn: The client connection.
+    :type conn: socket.socket
+    :param request: The request: {"argv": [parameters of anacoreUtilsMergeVCFCallersMobiDL2.py], "cwd": working directory of the client}.
+    :type request: dict
+    """
+    import tempfile
+    import traceback
+    import anacoreUtilsMergeVCFCallersMobiDL2 as merger
+    with tempfile.TemporaryFile() as FH_log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(FH_log.fileno(), 1)  # Standard outputs (and the outputs of sub-processes) are sent to the client
+        os.dup2(FH_log.fileno(), 2)
+        try:
+            os.chdir(request["cwd"])
+            merger.main(request["argv"])
+            status = 0
+        except SystemExit as error:
+            if error.code is None or isinstance(error.code, int):
+                status = 0 if error.code is None else error.code
+            else:
+                print(error.code, file=sys.stderr)
+                status = 1
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        FH_log.seek(0)
+        sendMessage(conn, {"status": status, "log": FH_log.read().decode(errors="replace")})
+
+def serve(socket_path):
+    """
+    Listen for merge requests on a Unix socket. The libraries are loaded once in the daemon and each request is run in a forked process: the requests are isolated and can run at the same time.
+
+    :param socket_path: Path to the Unix socket. The socket is only accessible by the user of the daemon.
+    :type socket_path: str
+    """
+    import signal
+    import logging
+    import anacoreUtilsMergeVCFCallersMobiDL2 as merger  # Warm imports
+    import concurrent.futures.process  # Lazy import of merger used with several processes
+    import pysam  # Lazy import of merger used by the modes reading the inputs by region
+    log = logging.getLogger(os.path.basename(__file__))
+    if os.path.exists(socket_path):
+        raise FileExistsError("The socket {} already exists. Remove it if no daemon is running.".format(socket_path))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(previous_umask)
+    server.listen()
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # Jobs processes are reaped automatically
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    log.info("Listen on {}".format(socket_path))
+    try:
+        while True:
+            conn, address = server.accept()
+            with conn:
+                request = readMessage(conn)
+                if request is None:
+                    continue
+                if request.get("command") == "stop":
+                    sendMessage(conn, {"status": 0, "log": "Daemon stopped.\n"})
+                    break
+                log.info("Job: {}".format(" ".join(request["argv"])))
+                if os.fork() == 0:  # Job process
+                    server.close()
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)  # The job waits its sub-processes
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    try:
+                        runJob(conn, request)
+                    finally:
+                        os._exit(0)
+    finally:
+        server.close()
+        os.remove(socket_path)
+        log.info("End of daemon")
+
+def submit(socket_path, request):
+    """
+    Send a request to the daemon and return its response.
+
+    :param socket_path: Path to the Unix socket of the daemon.
+    :type socket_path: str
+    :param request: The request.
+    :type request: dict
+    :return: The response: {"status": exit status, "log": outputs of the job}.
+    :rtype: dict
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        sendMessage(conn, request)
+        response = readMessage(conn)
+    if response is None:
+        response = {"status": 1, "log": "The job process has been interrupted.\n"}
+    return response
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Merge VCF with anacoreUtilsMergeVCFCallersMobiDL2.py in a long-lived daemon: the libraries are loaded once and each job runs in a process forked from the daemon. The client only uses the standard library and returns the exit status and the log of the job.')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_start = subparsers.add_parser("start", help='Start the daemon.')
+    parser_start.add_argument('-s', '--socket', required=True, help='Path to the Unix socket used to receive the jobs.')
+    parser_submit = subparsers.add_parser("submit", help='Submit a merge job and wait its end.')
+    parser_submit.add_argument('-s', '--socket', required=True, help='Path to the Unix socket of the daemon.')
+    parser_submit.add_argument('merge_parameters', nargs=argparse.REMAINDER, help='Parameters of anacoreUtilsMergeVCFCallersMobiDL2.py (after --). Relative paths are relative to the current directory.')
+    parser_stop = subparsers.add_parser("stop", help='Stop the daemon. The running jobs are not interrupted.')
+    parser_stop.add_argument('-s', '--socket', required=True, help='Path to the Unix socket of the daemon.')
+    args = parser.parse_args()
+
+    # Process
+    if args.command == "start":
+        import logging
+        logging.basicConfig(format='%(asctime)s -- [%(filename)s][pid:%(process)d][%(levelname)s] -- %(message)s')
+        logging.getLogger(os.path.basename(__file__)).setLevel(logging.INFO)
+        serve(args.socket)
+    else:
+        if args.command == "submit":
+            merge_parameters = args.merge_parameters
+            if len(merge_parameters) != 0 and merge_parameters[0] == "--":
+                merge_parameters = merge_parameters[1:]
+            request = {"command": "merge", "argv": merge_parameters, "cwd": os.getcwd()}
+        else:
+            request = {"command": "stop"}
+        try:
+            response = submit(args.socket, request)
+        except (FileNotFoundError, ConnectionRefusedError) as error:
+            print("The daemon is not reachable on {}: {}".format(args.socket, error), file=sys.stderr)
+            sys.exit(1)
+        sys.stdout.write(response["log"])
+        sys.exit(response["status"])
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import warnings
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import anacoreUtilsMergeVCFCallersMobiDL2 as merger
+
+
+PHASES = ["header", "normalization", "merge", "write"]
+CALLER_STYLES = ["FreeBayes", "Strelka2"]  # Styles of callers with dedicated AD/DP conventions, the others use HaplotypeCaller style
+CONTIGS = ["1", "2", "10", "X"]
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def getCallersStyles(nb_callers, special_share):
+    """
+    Return the style of each caller: FreeBayes and Strelka2 alternately for a share of the callers and HaplotypeCaller for the others.
+
+    :param nb_callers: Number of callers.
+    :type nb_callers: int
+    :param special_share: Share of callers with FreeBayes/Strelka2 style.
+    :type special_share: float
+    :return: The style by caller.
+    :rtype: list
+    """
+    nb_special = round(nb_callers * special_share)
+    return [CALLER_STYLES[idx % len(CALLER_STYLES)] if idx < nb_special else "HaplotypeCaller" for idx in range(nb_callers)]
+
+def getSyntheticVariants(nb_variants, nb_callers, overlap_ratio):
+    """
+    Return sorted biallelic variants and the callers where they are found. A share of the variants (overlap_ratio) is found by all the callers, each other variant is found by only one caller.
+
+    :param nb_variants: Number of distinct variants.
+    :type nb_variants: int
+    :param nb_callers: Number of callers.
+    :type nb_callers: int
+    :param overlap_ratio: Share of the variants found by all the callers.
+    :type overlap_ratio: float
+    :return: The variants: (chrom, pos, ref, alt, callers indexes).
+    :rtype: list
+    """
+    variants = []
+    nb_by_contig = nb_variants // len(CONTIGS) + 1
+    for chrom in CONTIGS:
+        pos = 1
+        for idx in range(min(nb_by_contig, nb_variants - len(variants))):
+            pos += random.randint(1, 20)
+            ref = random.choice("ACGT")
+            variant_kind = random.random()
+            if variant_kind < 0.7:  # Substitution
+                alt = random.choice([nt for nt in "ACGT" if nt != ref])
+            elif variant_kind < 0.85:  # Insertion
+                alt = ref + "".join(random.choice("ACGT") for idx_nt in range(random.randint(1, 5)))
+            else:  # Deletion
+                ref += "".join(random.choice("ACGT") for idx_nt in range(random.randint(1, 5)))
+                alt = ref[0]
+            if random.random() < overlap_ratio:
+                callers = set(range(nb_callers))
+            else:
+                callers = {random.randrange(nb_callers)}
+            variants.append((chrom, pos, ref, alt, callers))
+            pos += len(ref)
+    return variants
+
+def writeSyntheticCaller(out_path, variants, idx_caller, style, samples, nb_info, nb_format):
+    """
+    Write the VCF produced by a synthetic caller. The header and the fields used to store AD and DP follow the conventions of the caller style.
+
+    :param out_path: Path to the output file.
+    :type out_path: str
+    :param variants: The variants returned by getSyntheticVariants().
+    :type variants: list
+    :param idx_caller: Index of the caller.
+    :type idx_caller: int
+    :param style: Style of the caller: FreeBayes, Strelka2 or HaplotypeCaller.
+    :type style: str
+    :param samples: Samples names.
+    :type samples: list
+    :param nb_info: Number of INFO fields by record (in addition to the annotation field).
+    :type nb_info: int
+    :param nb_format: Number of FORMAT fields by sample (in addition to GT, AD and DP).
+    :type nb_format: int
+    """
+    with open(out_path, "w") as FH_out:
+        FH_out.write("##fileformat=VCFv4.2\n")
+        if style == "FreeBayes":
+            FH_out.write("##source=freeBayes v1.3.2\n")
+        elif style == "Strelka2":
+            FH_out.write("##source=strelka\n")
+        else:
+            FH_out.write('##GATKCommandLine=<ID=HaplotypeCaller,CommandLine="HaplotypeCaller">\n')
+        for chrom in CONTIGS:
+            FH_out.write("##contig=<ID={},length=250000000>\n".format(chrom))
+        FH_out.write('##FILTER=<ID=lowQ,Description="Low quality">\n')
+        FH_out.write('##FILTER=<ID=OOT,Description="Out of target">\n')
+        FH_out.write('##INFO=<ID=ANN,Number=.,Type=String,Description="Annotations">\n')
+        for idx in range(nb_info):
+            FH_out.write('##INFO=<ID=I{},Number=1,Type=Integer,Description="Info {}">\n'.format(idx, idx))
+        FH_out.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        FH_out.write('##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allele depth">\n')
+        FH_out.write('##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">\n')
+        if style == "Strelka2":
+            FH_out.write('##FORMAT=<ID=DPI,Number=1,Type=Integer,Description="Depth for indels">\n')
+        for idx in range(nb_format):
+            FH_out.write('##FORMAT=<ID=F{},Number=1,Type=Integer,Description="Format {}">\n'.format(idx, idx))
+        FH_out.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + "\t".join(samples) + "\n")
+        extra_format = ["F{}".format(idx) for idx in range(nb_format)]
+        for chrom, pos, ref, alt, callers in variants:
+            if idx_caller not in callers:
+                continue
+            info = ["ANN={}|{}".format(alt, "missense_variant")] + ["I{}={}".format(idx, random.randint(0, 999)) for idx in range(nb_info)]
+            format_tags = ["GT", "AD", "DP"]
+            if style == "Strelka2" and len(ref) != len(alt):
+                format_tags = ["GT", "AD", "DPI"]
+            spl_cells = []
+            for spl in samples:
+                depth = random.randint(10, 500)
+                alt_depth = random.randint(1, depth)
+                spl_cells.append(":".join(
+                    [random.choice(["0/1", "1/1"]), "{},{}".format(depth - alt_depth, alt_depth), str(depth)] + [str(random.randint(0, 99)) for idx in range(nb_format)]
+                ))
+            FH_out.write("\t".join([
+                chrom, str(pos), ".", ref, alt,
+                "{:.1f}".format(random.uniform(10, 1000)),
+                random.choice(["PASS", "PASS", "lowQ", "OOT"]),
+                ";".join(info),
+                ":".join(format_tags + extra_format)
+            ] + spl_cells) + "\n")
+
+def writeSyntheticCallers(out_dir, nb_callers, nb_variants, overlap_ratio, nb_samples, nb_info, nb_format, special_share):
+    """
+    Write the VCF of synthetic callers and return their paths and their names.
+
+    :param out_dir: Path to the output directory.
+    :type out_dir: str
+    :param nb_callers: Number of callers.
+    :type nb_callers: int
+    :param nb_variants: Number of distinct variants.
+    :type nb_variants: int
+    :param overlap_ratio: Share of the variants found by all the callers.
+    :type overlap_ratio: float
+    :param nb_samples: Number of samples.
+    :type nb_samples: int
+    :param nb_info: Number of INFO fields by record (in addition to the annotation field).
+    :type nb_info: int
+    :param nb_format: Number of FORMAT fields by sample (in addition to GT, AD and DP).
+    :type nb_format: int
+    :param special_share: Share of callers with FreeBayes/Strelka2 style.
+    :type special_share: float
+    :return: Paths to the VCF and names of the callers.
+    :rtype: (list, list)
+    """
+    samples = ["spl{}".format(idx) for idx in range(nb_samples)]
+    variants = getSyntheticVariants(nb_variants, nb_callers, overlap_ratio)
+    vcf_paths = []
+    callers_names = []
+    for idx_caller, style in enumerate(getCallersStyles(nb_callers, special_share)):
+        callers_names.append("{}{}".format(style, idx_caller))  # Adapters are selected from the header
+        vcf_paths.append(os.path.join(out_dir, "{}.vcf".format(callers_names[-1])))
+        writeSyntheticCaller(vcf_paths[-1], variants, idx_caller, style, samples, nb_info, nb_format)
+    return vcf_paths, callers_names
+
+def timePhases(vcf_paths, callers_names, out_dir, nb_jobs, lazy):
+    """
+    Return the time spent in each phase of the merge.
+
+    :param vcf_paths: Paths to the callers VCF.
+    :type vcf_paths: list
+    :param callers_names: Names of the callers (in same order as vcf_paths).
+    :type callers_names: list
+    :param out_dir: Path to the directory used for the normalized and merged VCF.
+    :type out_dir: str
+    :param nb_jobs: Maximum number of normalizations running at the same time.
+    :type nb_jobs: int
+    :param lazy: Whether to read the records as LazyRecord.
+    :type lazy: bool
+    :return: Time (in seconds) by phase.
+    :rtype: dict
+    """
+    args = argparse.Namespace(
+        inputs_variants=vcf_paths,
+        calling_sources=callers_names,
+        annotations_field="ANN",
+        shared_filters={"OOT"},
+        reconcile_overlaps=False
+    )
+    elapsed_by_phase = {}
+    # Header
+    start_time = time.perf_counter()
+    new_header = merger.getNewHeaderAttr(args)
+    elapsed_by_phase["header"] = time.perf_counter() - start_time
+    # Normalization
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        normalized_vcfs = merger.normalize_vcfs(vcf_paths, nb_jobs)
+    elapsed_by_phase["normalization"] = time.perf_counter() - start_time
+    # Merge
+    start_time = time.perf_counter()
+    with open(os.path.join(out_dir, "error_records.log"), "w") as error_log:
+        variants = merger.mergeNormalizedRecords(normalized_vcfs, args.calling_sources, args.annotations_field, args.shared_filters, False, error_log, lazy)
+    elapsed_by_phase["merge"] = time.perf_counter() - start_time
+    # Sorted write
+    start_time = time.perf_counter()
+    variants = sorted(variants, key=lambda record: (record.chrom, record.refStart(), record.refEnd()))
+    with merger.MergedVCFIO(os.path.join(out_dir, "merged.vcf"), "w") as FH_out:
+        FH_out.samples = new_header["samples"]
+        FH_out.info = new_header["info"]
+        FH_out.format = new_header["format"]
+        FH_out.filter = new_header["filter"]
+        FH_out.writeHeader()
+        for record in variants:
+            if record.filter is not None and len(record.filter) == 0:
+                record.filter = ["PASS"]
+            FH_out.write(record)
+    elapsed_by_phase["write"] = time.perf_counter() - start_time
+    for normalized_vcf in normalized_vcfs:
+        os.remove(normalized_vcf)
+    return elapsed_by_phase
+
+def getRegressions(elapsed_by_phase, baseline, tolerance, min_delta):
+    """
+    Return the phases slower than in baseline.
+
+    :param elapsed_by_phase: Time (in seconds) by phase.
+    :type elapsed_by_phase: dict
+    :param baseline: The baseline stored by --save-baseline.
+    :type baseline: dict
+    :param tolerance: Accepted slowdown ratio (ex: 0.2 for 20%).
+    :type tolerance: float
+    :param min_delta: Slowdowns lower than this time (in seconds) are ignored.
+    :type min_delta: float
+    :return: The regressed phases.
+    :rtype: list
+    """
+    regressions = []
+    for phase in PHASES:
+        baseline_time = baseline["phases"][phase]
+        if elapsed_by_phase[phase] > baseline_time * (1 + tolerance) and elapsed_by_phase[phase] - baseline_time > min_delta:
+            regressions.append(phase)
+    return regressions
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Time the phases of the merge (header building, normalization, merge and sorted write) on synthetic callers VCF and compare them to a stored baseline. The normalization uses a pass-through stand-in for bcftools by default: the benchmark does not need the reference genome nor bcftools.')
+    parser.add_argument('-c', '--nb-callers', type=int, default=3, help='Number of callers. [Default: %(default)s]')
+    parser.add_argument('-r', '--nb-variants', type=int, default=20000, help='Number of distinct variants. [Default: %(default)s]')
+    parser.add_argument('-v', '--overlap-ratio', type=float, default=0.5, help='Share of the variants found by all the callers, the others are found by only one caller. [Default: %(default)s]')
+    parser.add_argument('-s', '--nb-samples', type=int, default=2, help='Number of samples. [Default: %(default)s]')
+    parser.add_argument('-i', '--nb-info', type=int, default=10, help='Number of INFO fields by record. [Default: %(default)s]')
+    parser.add_argument('-f', '--nb-format', type=int, default=5, help='Number of FORMAT fields by sample. [Default: %(default)s]')
+    parser.add_argument('-y', '--special-share', type=float, default=2 / 3, help='Share of callers with FreeBayes/Strelka2 style for AD and DP, the others have HaplotypeCaller style. [Default: %(default)s]')
+    parser.add_argument('-b', '--normalizer', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakeBcftools.py"), help='Path to bcftools or to a command accepting the same "norm" arguments. [Default: %(default)s]')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Maximum number of normalizations running at the same time. [Default: %(default)s]')
+    parser.add_argument('-l', '--lazy', action='store_true', help='Read the records as LazyRecord.')
+    parser.add_argument('-n', '--nb-repeats', type=int, default=3, help='Number of measures: the best is kept for each phase. [Default: %(default)s]')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data generator. [Default: %(default)s]')
+    group_baseline = parser.add_argument_group('Baseline')
+    group_baseline.add_argument('-e', '--baseline', help='Path to a baseline saved by --save-baseline with the same parameters. The script exits with an error if a phase is slower than in baseline.')
+    group_baseline.add_argument('-t', '--tolerance', type=float, default=0.2, help='Accepted slowdown ratio compared to the baseline. [Default: %(default)s]')
+    group_baseline.add_argument('-d', '--min-delta', type=float, default=0.05, help='Slowdowns lower than this time (in seconds) are ignored. [Default: %(default)s]')
+    group_baseline.add_argument('-a', '--save-baseline', help='Path to the file used to store the measures as baseline (format: JSON).')
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+    random.seed(args.seed)
+    merger.BCFTOOLS_PATH = args.normalizer
+    parameters = {
+        "nb_callers": args.nb_callers,
+        "nb_variants": args.nb_variants,
+        "overlap_ratio": args.overlap_ratio,
+        "nb_samples": args.nb_samples,
+        "nb_info": args.nb_info,
+        "nb_format": args.nb_format,
+        "special_share": args.special_share,
+        "lazy": args.lazy,
+        "seed": args.seed
+    }
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as FH_baseline:
+            baseline = json.load(FH_baseline)
+        if baseline["parameters"] != parameters:
+            raise Exception("The parameters of the baseline {} are different: {}.".format(args.baseline, baseline["parameters"]))
+
+    # Measures
+    best_by_phase = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vcf_paths, callers_names = writeSyntheticCallers(
+            tmp_dir, args.nb_callers, args.nb_variants, args.overlap_ratio, args.nb_samples,
+            args.nb_info, args.nb_format, args.special_share
+        )
+        for repeat in range(args.nb_repeats):
+            elapsed_by_phase = timePhases(vcf_paths, callers_names, tmp_dir, args.jobs, args.lazy)
+            for phase, elapsed_time in elapsed_by_phase.items():
+                if phase not in best_by_phase or elapsed_time < best_by_phase[phase]:
+                    best_by_phase[phase] = elapsed_time
+
+    # Report
+    print("phase\tseconds\tbaseline_seconds\tratio")
+    for phase in PHASES + ["total"]:
+        elapsed_time = best_by_phase[phase] if phase != "total" else sum(best_by_phase.values())
+        if baseline is None:
+            print("{}\t{:.3f}\t\t".format(phase, elapsed_time))
+        else:
+            baseline_time = baseline["phases"][phase] if phase != "total" else sum(baseline["phases"].values())
+            print("{}\t{:.3f}\t{:.3f}\t{:.2f}".format(phase, elapsed_time, baseline_time, elapsed_time / baseline_time))
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as FH_baseline:
+            json.dump({"parameters": parameters, "phases": best_by_phase}, FH_baseline, indent=2)
+    if baseline is not None:
+        regressions = getRegressions(best_by_phase, baseline, args.tolerance, args.min_delta)
+        if len(regressions) != 0:
+            print("Regression on: {}".format(", ".join(regressions)), file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+import tempfile
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from anacore.vcf import VCFIO
+from anacoreUtilsMergeVCFCallersMobiDL2 import getMergePlan, renameRecord
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def writeSyntheticVCF(out_path, nb_records, nb_info, nb_format, nb_samples):
+    """
+    Write a VCF with wide INFO and FORMAT.
+
+    :param out_path: Path to the output file.
+    :type out_path: str
+    :param nb_records: Number of records.
+    :type nb_records: int
+    :param nb_info: Number of INFO fields by record (in addition to the annotation field).
+    :type nb_info: int
+    :param nb_format: Number of FORMAT fields by sample (in addition to GT, AD and DP).
+    :type nb_format: int
+    :param nb_samples: Number of samples.
+    :type nb_samples: int
+    """
+    samples = ["spl{}".format(idx) for idx in range(nb_samples)]
+    with open(out_path, "w") as FH_out:
+        FH_out.write("##fileformat=VCFv4.2\n")
+        FH_out.write('##FILTER=<ID=lowQ,Description="Low quality">\n')
+        FH_out.write('##FILTER=<ID=OOT,Description="Out of target">\n')
+        FH_out.write('##INFO=<ID=ANN,Number=.,Type=String,Description="Annotations">\n')
+        for idx in range(nb_info):
+            FH_out.write('##INFO=<ID=I{},Number=1,Type=Integer,Description="Info {}">\n'.format(idx, idx))
+        FH_out.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        FH_out.write('##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allele depth">\n')
+        FH_out.write('##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">\n')
+        for idx in range(nb_format):
+            FH_out.write('##FORMAT=<ID=F{},Number=1,Type=Integer,Description="Format {}">\n'.format(idx, idx))
+        FH_out.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + "\t".join(samples) + "\n")
+        format_tags = ["GT", "AD", "DP"] + ["F{}".format(idx) for idx in range(nb_format)]
+        for pos in range(1, nb_records + 1):
+            info = ["ANN=a|b"] + ["I{}={}".format(idx, random.randint(0, 99)) for idx in range(nb_info)]
+            spl_cells = []
+            for spl in samples:
+                spl_cells.append(":".join(
+                    ["0/1", "10,5", "15"] + [str(random.randint(0, 99)) for idx in range(nb_format)]
+                ))
+            FH_out.write("\t".join(
+                ["1", str(pos), ".", "A", "T", "30.0", random.choice(["PASS", "lowQ", "OOT;lowQ"]), ";".join(info), ":".join(format_tags)] + spl_cells
+            ) + "\n")
+
+
+def legacyRenameRecord(record, idx_in, annotations_field, shared_filters, is_first):
+    """
+    Rename FILTER, INFO and FORMAT of the record as before the merge plans (strings built for each key of each record).
+
+    :param record: The VCF record coming from the caller.
+    :type record: VCFRecord
+    :param idx_in: Index of the caller in inputs.
+    :type idx_in: int
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags applying to the variant and independent of caller.
+    :type shared_filters: set
+    :param is_first: True if it is the first occurrence of the variant in merged records.
+    :type is_first: bool
+    """
+    if record.filter is not None:
+        new_filter = []
+        for tag in record.filter:
+            if tag != "PASS":
+                if tag in shared_filters:
+                    new_filter.append(tag)
+                else:
+                    new_filter.append("s{}_{}".format(idx_in, tag))
+        record.filter = new_filter
+    new_info = {}
+    for key, val in record.info.items():
+        if key == annotations_field:
+            new_info[key] = val
+        else:
+            new_info["s{}_{}".format(idx_in, key)] = val
+    record.info = new_info
+    if record.qual is not None:
+        record.info["s{}_VCQUAL".format(idx_in)] = record.qual
+    if is_first:
+        record.format = [curr_filter for curr_filter in record.format]
+        record.format += ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
+    else:
+        record.format = ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
+    for spl_name, spl_info in record.samples.items():
+        renamed_info = {}
+        for key, val in spl_info.items():
+            if key not in renamed_info:
+                renamed_info[key] = val
+            renamed_info["s{}_{}".format(idx_in, key)] = val
+        record.samples[spl_name] = renamed_info
+
+
+def timeRenaming(records, rename_fct, nb_repeats):
+    """
+    Return the best time to rename copies of the records.
+
+    :param records: The records.
+    :type records: list
+    :param rename_fct: Function applied on each record with its index.
+    :type rename_fct: function
+    :param nb_repeats: Number of measures.
+    :type nb_repeats: int
+    :return: The best time (in seconds) and the renamed records of the last measure.
+    :rtype: (float, list)
+    """
+    best_time = None
+    for repeat in range(nb_repeats):
+        copied_records = copy.deepcopy(records)
+        start_time = time.perf_counter()
+        for idx_record, record in enumerate(copied_records):
+            rename_fct(record, idx_record % 2 == 0)
+        elapsed_time = time.perf_counter() - start_time
+        if best_time is None or elapsed_time < best_time:
+            best_time = elapsed_time
+    return best_time, copied_records
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Compare the time spent in renaming the caller dependant elements of the records with and without merge plan.')
+    parser.add_argument('-r', '--nb-records', type=int, default=20000, help='Number of records. [Default: %(default)s]')
+    parser.add_argument('-i', '--nb-info', type=int, default=30, help='Number of INFO fields by record. [Default: %(default)s]')
+    parser.add_argument('-f', '--nb-format', type=int, default=15, help='Number of FORMAT fields by sample. [Default: %(default)s]')
+    parser.add_argument('-s', '--nb-samples', type=int, default=2, help='Number of samples. [Default: %(default)s]')
+    parser.add_argument('-n', '--nb-repeats', type=int, default=5, help='Number of measures: the best is kept. [Default: %(default)s]')
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+    random.seed(42)
+    annotations_field = "ANN"
+    shared_filters = {"OOT"}
+
+    # Records
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vcf_path = os.path.join(tmp_dir, "synthetic.vcf")
+        writeSyntheticVCF(vcf_path, args.nb_records, args.nb_info, args.nb_format, args.nb_samples)
+        with VCFIO(vcf_path) as FH_in:
+            merge_plan = getMergePlan(1, "caller", FH_in, annotations_field, shared_filters)
+            records = FH_in.read()
+
+    # Measures
+    legacy_time, legacy_records = timeRenaming(
+        records,
+        lambda record, is_first: legacyRenameRecord(record, 1, annotations_field, shared_filters, is_first),
+        args.nb_repeats
+    )
+    plan_time, plan_records = timeRenaming(
+        records,
+        lambda record, is_first: renameRecord(record, merge_plan, is_first),
+        args.nb_repeats
+    )
+    for legacy_record, plan_record in zip(legacy_records, plan_records):
+        if (legacy_record.filter, legacy_record.info, legacy_record.format, legacy_record.samples) != (plan_record.filter, plan_record.info, plan_record.format, plan_record.samples):
+            raise Exception("Renamed records are different for {}.".format(legacy_record.getName()))
+    print("records\tinfo\tformat\tsamples\tlegacy_us_by_record\tplan_us_by_record\tspeedup")
+    print("{}\t{}\t{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}".format(
+        args.nb_records, args.nb_info, args.nb_format, args.nb_samples,
+        legacy_time / args.nb_records * 10**6,
+        plan_time / args.nb_records * 10**6,
+        legacy_time / plan_time
+    ))
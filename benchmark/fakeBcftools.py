@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import sys
+import argparse
+from pysam import tabix_compress
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    # Manage parameters
+    parser = argparse.ArgumentParser(description='Stand-in for "bcftools norm" used by the benchmarks: the input is only compressed in BGZF. The input must already be left-aligned and without multiallelic records (as the VCF produced by benchmarkMerge.py).')
+    subparsers = parser.add_subparsers(dest="command")
+    parser_norm = subparsers.add_parser("norm", help='Pass-through normalization.')
+    parser_norm.add_argument('-f', '--fasta-ref', help='Ignored.')
+    parser_norm.add_argument('-m', '--multiallelics', help='Ignored.')
+    parser_norm.add_argument('-T', '--targets-file', help='Ignored (the records outside the targets are removed by the merge).')
+    parser_norm.add_argument('-O', '--output-type', default="z", choices=["z"], help='Output type. Only BGZF compressed VCF is managed. [Default: %(default)s]')
+    parser_norm.add_argument('-o', '--output', required=True, help='Path to the output file (format: VCF.GZ).')
+    parser_norm.add_argument('input', help='Path to the input file (format: VCF).')
+    argv = sys.argv[1:]
+    for idx, arg in enumerate(argv[:-1]):
+        if arg in {"-m", "--multiallelics"}:  # The value starts with a dash (ex: -both)
+            argv[idx:idx + 2] = ["{}={}".format(arg, argv[idx + 1])]
+            break
+    args = parser.parse_args(argv)
+    if args.command != "norm":
+        parser.error("only the norm command is managed")
+
+    # Process
+    try:
+        tabix_compress(args.input, args.output, force=True)
+    except OSError as error:
+        print("[fakeBcftools] {}".format(error), file=sys.stderr)
+        sys.exit(1)
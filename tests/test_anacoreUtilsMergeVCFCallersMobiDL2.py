@@ -0,0 +1,1393 @@
+#!/usr/bin/env python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import os
+import re
+import sys
+import gzip
+import json
+import math
+import shutil
+import tempfile
+import unittest
+import warnings
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(TEST_DIR, "data")
+APP_DIR = os.path.dirname(TEST_DIR)
+sys.path.insert(0, APP_DIR)
+import anacoreUtilsMergeVCFCallersMobiDL2 as merger
+import pysam
+try:
+    import pysam.bcftools
+    HAS_PYSAM_BCFTOOLS = True
+except ImportError:  # pysam built without bcftools
+    HAS_PYSAM_BCFTOOLS = False
+
+CALLERS = ["HaplotypeCaller", "FreeBayes", "Strelka2"]
+REFERENCE = os.path.join(DATA_DIR, "ref.fa")
+REGIONS = os.path.join(DATA_DIR, "regions.bed")
+
+
+########################################################################
+#
+# FUNCTIONS
+#
+########################################################################
+def readLines(path):
+    """
+    Return the lines of a text file (format: text or gzip).
+
+    :param path: Path to the file.
+    :type path: str
+    :return: The lines without end of line.
+    :rtype: list
+    """
+    FH_in = gzip.open(path, "rt") if path.endswith(".gz") else open(path)
+    with FH_in:
+        return FH_in.read().splitlines()
+
+def readRecordsLines(path):
+    """
+    Return the records lines of a VCF file (format: VCF or VCF.GZ).
+
+    :param path: Path to the file.
+    :type path: str
+    :return: The lines of the records without end of line.
+    :rtype: list
+    """
+    return [line for line in readLines(path) if not line.startswith("#")]
+
+def canonicalFloats(line):
+    """
+    Return the line with the floats written in their shortest form (ex: -13.0 becomes -13).
+
+    :param line: The line.
+    :type line: str
+    :return: The line with the canonical floats.
+    :rtype: str
+    """
+    return re.sub(r"(?<![\w.])(-?\d+)\.0(?![\w.])", r"\1", line)
+
+def baselineRename(record, idx_in, is_first, annotations_field, shared_filters):
+    """
+    Rename FILTER, INFO and FORMAT of the record as the merge before the merge plans (prefix "s{idx_in}_" computed for each tag).
+
+    :param record: The VCF record coming from the caller.
+    :type record: VCFRecord
+    :param idx_in: Index of the caller in inputs.
+    :type idx_in: int
+    :param is_first: True if it is the first occurrence of the variant in merged records.
+    :type is_first: bool
+    :param annotations_field: Field used to store annotations.
+    :type annotations_field: str
+    :param shared_filters: Filters tags not renamed.
+    :type shared_filters: set
+    """
+    if record.filter is not None:
+        new_filter = []
+        for tag in record.filter:
+            if tag != "PASS":
+                if tag in shared_filters:
+                    new_filter.append(tag)
+                else:
+                    new_filter.append("s{}_{}".format(idx_in, tag))
+        record.filter = new_filter
+    new_info = {}
+    for key, val in record.info.items():
+        if key == annotations_field:
+            new_info[key] = val
+        else:
+            new_info["s{}_{}".format(idx_in, key)] = val
+    record.info = new_info
+    if record.qual is not None:
+        record.info["s{}_VCQUAL".format(idx_in)] = record.qual
+    if is_first:
+        record.format = [curr_filter for curr_filter in record.format]
+        record.format += ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
+    else:
+        record.format = ["s{}_{}".format(idx_in, curr_filter) for curr_filter in record.format]
+    for spl_name, spl_info in record.samples.items():
+        renamed_info = {}
+        for key, val in spl_info.items():
+            if key not in renamed_info:
+                renamed_info[key] = val
+            renamed_info["s{}_{}".format(idx_in, key)] = val
+        record.samples[spl_name] = renamed_info
+
+
+########################################################################
+#
+# TESTS
+#
+########################################################################
+class MergeTestCase(unittest.TestCase):
+    """
+    Run the merge script on copies of the callers VCF in tests/data. The inputs are normalized with the internal normalizer on the fixture reference: the tests do not need bcftools.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.inputs = []
+        for caller in CALLERS:
+            input_path = self.tmpPath(caller + ".vcf")
+            shutil.copyfile(os.path.join(DATA_DIR, caller + ".vcf"), input_path)
+            self.inputs.append(input_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def tmpPath(self, filename):
+        return os.path.join(self.tmp_dir, filename)
+
+    def merge(self, out_filename, *options, callers=None, inputs=None, normalizer="internal", expected_status=0):
+        """
+        Run the merge in a new process and return its log.
+
+        :param out_filename: Name of the output file in the temporary directory.
+        :type out_filename: str
+        :param options: Additional parameters of the merge.
+        :type options: list
+        :param callers: Names of the callers. None for CALLERS.
+        :type callers: list
+        :param inputs: Paths to the callers VCF. None for the copies of the CALLERS VCF.
+        :type inputs: list
+        :param normalizer: Value of --normalizer.
+        :type normalizer: str
+        :param expected_status: Expected exit status.
+        :type expected_status: int
+        :return: The standard and error outputs of the merge.
+        :rtype: str
+        """
+        cmd = [
+            sys.executable, os.path.join(APP_DIR, "anacoreUtilsMergeVCFCallersMobiDL2.py"),
+            "--normalizer", normalizer,
+            "--reference", REFERENCE,
+            "--calling-sources", *(CALLERS if callers is None else callers),
+            "--inputs-variants", *(self.inputs if inputs is None else inputs),
+            "--output-variants", self.tmpPath(out_filename),
+            *options
+        ]
+        process = subprocess.run(
+            cmd,
+            cwd=self.tmp_dir,
+            env=dict(os.environ, PYTHONHASHSEED="0"),  # The order of merged filters depends on the hash seed
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True
+        )
+        self.assertEqual(process.returncode, expected_status, process.stdout)
+        return process.stdout
+
+    def assertSameAsDefault(self, out_filename, *options, **kwargs):
+        """Run the merge with and without options and check that the outputs are identical."""
+        self.merge("default.vcf", **kwargs)
+        self.merge(out_filename, *options, **kwargs)
+        expected = readLines(self.tmpPath("default.vcf"))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(readLines(self.tmpPath(out_filename)), expected)
+
+
+class TestStreamingMerge(MergeTestCase):
+    def testSameAsDefault(self):
+        self.assertSameAsDefault("streamed.vcf", "--streaming")
+        self.assertGreater(len(readRecordsLines(self.tmpPath("streamed.vcf"))), 50)
+
+    def testSameAsDefaultWithPrioritize(self):
+        self.assertSameAsDefault("streamed.vcf", "--streaming", "--prioritize")
+
+    def testSorted(self):
+        self.merge("streamed.vcf", "--streaming")
+        with merger.VCFIO(self.tmpPath("streamed.vcf")) as FH_in:
+            keys = [(record.chrom, record.refStart(), record.refEnd()) for record in FH_in]
+        self.assertEqual(keys, sorted(keys))
+
+
+class TestErrorLog(MergeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.previous_globals = (merger.NORMALIZER, merger.REFERENCE_GENOME)
+        merger.NORMALIZER = "internal"
+        merger.REFERENCE_GENOME = REFERENCE
+        # FreeBayes record without AD
+        lines = readLines(self.inputs[1])
+        idx_first = next(idx for idx, line in enumerate(lines) if not line.startswith("#"))
+        fields = lines[idx_first].split("\t")
+        idx_AD = fields[8].split(":").index("AD")
+        for idx_field in range(8, len(fields)):
+            tokens = fields[idx_field].split(":")
+            del tokens[idx_AD]
+            fields[idx_field] = ":".join(tokens)
+        lines[idx_first] = "\t".join(fields)
+        with open(self.inputs[1], "w") as FH_out:
+            FH_out.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        merger.NORMALIZER, merger.REFERENCE_GENOME = self.previous_globals
+        super().tearDown()
+
+    def testClosedAfterMerge(self):
+        for mode, get_records in [("default", merger.getMergedRecords), ("streaming", merger.getStreamedMergedRecords)]:
+            with self.subTest(mode=mode):
+                error_log_path = self.tmpPath(mode + "_errors.log")
+                default_showwarning = warnings.showwarning
+                records = list(get_records(self.inputs, CALLERS, "ANN", set(), False, error_log_path=error_log_path))
+                self.assertGreater(len(records), 50)
+                self.assertIs(warnings.showwarning, default_showwarning)
+                with open(error_log_path) as FH_in:  # Flushed
+                    self.assertIn("in FreeBayes: missing AD", FH_in.read())
+
+
+class TestConcurrentNormalization(MergeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.previous_globals = (merger.NORMALIZER, merger.REFERENCE_GENOME)
+        merger.NORMALIZER = "internal"
+        merger.REFERENCE_GENOME = REFERENCE
+
+    def tearDown(self):
+        merger.NORMALIZER, merger.REFERENCE_GENOME = self.previous_globals
+        super().tearDown()
+
+    def testOrder(self):
+        sequential = [readRecordsLines(path) for path in merger.normalize_vcfs(self.inputs, 1)]
+        outputs = merger.normalize_vcfs(self.inputs, 3)
+        self.assertEqual(outputs, [path + ".normalized.vcf.gz" for path in self.inputs])
+        self.assertEqual([readRecordsLines(path) for path in outputs], sequential)
+
+    def testFailFast(self):
+        # Input with a REF different from the reference on its first record
+        lines = readLines(self.inputs[0])
+        idx_first = next(idx for idx, line in enumerate(lines) if not line.startswith("#"))
+        fields = lines[idx_first].split("\t")
+        fields[3] = "N" * len(fields[3])
+        lines[idx_first] = "\t".join(fields)
+        invalid_path = self.tmpPath("invalid.vcf")
+        with open(invalid_path, "w") as FH_out:
+            FH_out.write("\n".join(lines) + "\n")
+        # Long input
+        lines = readLines(self.inputs[1])
+        header = [line for line in lines if line.startswith("#")]
+        records = [line for line in lines if not line.startswith("#")]
+        long_path = self.tmpPath("long.vcf")
+        with open(long_path, "w") as FH_out:
+            FH_out.write("\n".join(header + records * 500) + "\n")
+        # Normalize
+        with self.assertRaises(SystemExit) as context:
+            merger.normalize_vcfs([invalid_path, long_path], 2)
+        self.assertEqual(context.exception.code, 1)
+        self.assertFalse(os.path.exists(long_path + ".normalized.vcf.gz"))  # Stopped before its end
+
+
+class TestNormalizationCache(MergeTestCase):
+    def testHit(self):
+        cache_dir = self.tmpPath("cache")
+        self.merge("default.vcf")
+        log = self.merge("first.vcf", "--streaming", "--cache-dir", cache_dir)
+        self.assertEqual(log.count("Normalization cache miss"), len(CALLERS))
+        log = self.merge("second.vcf", "--streaming", "--cache-dir", cache_dir)
+        self.assertEqual(log.count("Normalization cache hit"), len(CALLERS))
+        self.assertEqual(len([filename for filename in os.listdir(cache_dir) if filename.endswith(".normalized.vcf.gz")]), len(CALLERS))
+        self.assertEqual([filename for filename in os.listdir(cache_dir) if ".tmp" in filename], [])
+        expected = readLines(self.tmpPath("default.vcf"))
+        self.assertEqual(readLines(self.tmpPath("first.vcf")), expected)
+        self.assertEqual(readLines(self.tmpPath("second.vcf")), expected)
+
+    def testNotModifiedByRunWithoutCache(self):
+        cache_dir = self.tmpPath("cache")
+        self.merge("default.vcf")
+        self.merge("first.vcf", "--streaming", "--cache-dir", cache_dir)
+        # Run without cache on a modified input: the output linked to the cache entry is replaced
+        original_lines = readLines(self.inputs[0])
+        with open(self.inputs[0], "w") as FH_out:
+            FH_out.write("\n".join(line for line in original_lines if line.startswith("#")) + "\n")
+        self.merge("without_cache.vcf", "--streaming")
+        # Run with cache on the original input
+        with open(self.inputs[0], "w") as FH_out:
+            FH_out.write("\n".join(original_lines) + "\n")
+        log = self.merge("second.vcf", "--streaming", "--cache-dir", cache_dir)
+        self.assertEqual(log.count("Normalization cache hit"), len(CALLERS))
+        self.assertEqual(readLines(self.tmpPath("second.vcf")), readLines(self.tmpPath("default.vcf")))
+
+
+class TestShardedMerge(MergeTestCase):
+    def testContigs(self):
+        self.assertSameAsDefault("sharded.vcf", "--processes", "2")
+
+    def testChunks(self):
+        self.assertSameAsDefault("sharded.vcf", "--processes", "3", "--chunk-size", "300")
+
+    def testGetShards(self):
+        previous_globals = (merger.NORMALIZER, merger.REFERENCE_GENOME)
+        merger.NORMALIZER = "internal"
+        merger.REFERENCE_GENOME = REFERENCE
+        try:
+            normalized_vcfs = merger.getIndexedNormalizedVCFs(self.inputs)
+        finally:
+            merger.NORMALIZER, merger.REFERENCE_GENOME = previous_globals
+        self.assertEqual(merger.getShards(normalized_vcfs), [("1", None, None), ("2", None, None)])
+        self.assertEqual(
+            merger.getShards(normalized_vcfs, 500),
+            [("1", 0, 500), ("1", 500, 1000), ("1", 1000, merger.TABIX_MAX_POS), ("2", None, None)]
+        )
+
+
+class TestMergePlan(unittest.TestCase):
+    def getRecord(self, pFilter):
+        return merger.VCFRecord(
+            "1", 66, None, "G", ["C"], 558.96, pFilter,
+            {"AO": [19], "RO": 17, "ANN": ["C|missense"], "SOMATIC": True},
+            ["GT", "DP", "AD"],
+            {
+                "splA": {"GT": "0/1", "DP": 49, "AD": [36, 13]},
+                "splB": {"GT": "1/1", "DP": 47, "AD": [44, 3]}
+            }
+        )
+
+    def testSameAsBaseline(self):
+        shared_filters = {"lowComplexity"}
+        with merger.VCFIO(os.path.join(DATA_DIR, "FreeBayes.vcf")) as FH_in:
+            for idx_in in [0, 2]:
+                merge_plan = merger.getMergePlan(idx_in, "FreeBayes", FH_in, "ANN", shared_filters)
+                for pFilter in [["PASS"], ["lowQual", "lowComplexity"], ["lowComplexity", "PASS"], None]:
+                    for is_first in [True, False]:
+                        for nb_renaming in range(2):  # The second renaming uses the tables and the FORMAT lists cached by the first
+                            with self.subTest(idx_in=idx_in, filter=pFilter, is_first=is_first, nb_renaming=nb_renaming):
+                                record = self.getRecord(None if pFilter is None else list(pFilter))
+                                merger.renameRecord(record, merge_plan, is_first)
+                                expected = self.getRecord(None if pFilter is None else list(pFilter))
+                                baselineRename(expected, idx_in, is_first, "ANN", shared_filters)
+                                self.assertEqual(record.filter, expected.filter)
+                                self.assertEqual(record.info, expected.info)
+                                self.assertEqual(list(record.info), list(expected.info))
+                                self.assertEqual(record.format, expected.format)
+                                self.assertEqual(record.samples, expected.samples)
+                                for spl_name in expected.samples:
+                                    self.assertEqual(list(record.samples[spl_name]), list(expected.samples[spl_name]))
+        # Values of the first occurrence
+        record = self.getRecord(["lowQual", "PASS", "lowComplexity"])
+        merger.renameRecord(record, merge_plan, True)
+        self.assertEqual(record.filter, ["s2_lowQual", "lowComplexity"])
+        self.assertEqual(record.info, {"s2_AO": [19], "s2_RO": 17, "ANN": ["C|missense"], "s2_SOMATIC": True, "s2_VCQUAL": 558.96})
+        self.assertEqual(record.format, ["GT", "DP", "AD", "s2_GT", "s2_DP", "s2_AD"])
+        self.assertEqual(record.samples["splB"], {"GT": "1/1", "s2_GT": "1/1", "DP": 47, "s2_DP": 47, "AD": [44, 3], "s2_AD": [44, 3]})
+
+
+class TestCallerAdapters(MergeTestCase):
+    def tearDown(self):
+        merger.CALLER_ADAPTERS[:] = [adapter_class for adapter_class in merger.CALLER_ADAPTERS if adapter_class.name != "Constant"]
+        super().tearDown()
+
+    def testSelection(self):
+        for caller_name, input_path, expected in [
+            ("FreeBayes", self.inputs[1], "FreeBayes"),  # By name
+            ("caller_3", self.inputs[2], "Strelka2"),  # By header
+            ("caller_1", self.inputs[0], "HaplotypeCaller"),  # By header
+            ("GATK", self.inputs[2], "HaplotypeCaller")  # By name before header
+        ]:
+            with self.subTest(caller=caller_name):
+                with merger.VCFIO(input_path) as FH_in:
+                    if caller_name.startswith("caller_"):
+                        with self.assertLogs(merger.log, "WARNING") as logs:
+                            self.assertEqual(merger.getCallerAdapter(caller_name, FH_in).name, expected)
+                        self.assertIn("selected from the VCF header", logs.output[0])
+                    else:
+                        self.assertEqual(merger.getCallerAdapter(caller_name, FH_in).name, expected)
+        # Generic
+        lines = [line for line in readLines(self.inputs[0]) if not line.startswith("##source=")]
+        with open(self.tmpPath("unknown.vcf"), "w") as FH_out:
+            FH_out.write("\n".join(lines) + "\n")
+        with merger.VCFIO(self.tmpPath("unknown.vcf")) as FH_in:
+            adapter = merger.getCallerAdapter("caller_1", FH_in)
+            self.assertEqual(adapter.name, "generic")
+            record = next(iter(FH_in))
+            support, reason = adapter.extract(record, FH_in.samples[0])
+            self.assertIsNone(reason)
+            self.assertEqual(support["AD"], record.getAltAD(FH_in.samples[0])[0])
+            self.assertEqual(support["DP"], record.getDP(FH_in.samples[0]))
+
+    def testExtract(self):
+        with merger.VCFIO(self.inputs[1]) as FH_in:
+            adapter = merger.getCallerAdapter("FreeBayes", FH_in)
+            for record in FH_in:
+                for spl in FH_in.samples:
+                    support, reason = adapter.extract(record, spl)
+                    self.assertIsNone(reason)
+                    self.assertEqual(support["GT"], record.samples[spl]["GT"])
+                    self.assertIsInstance(support["AD"], int)
+                    self.assertIsInstance(support["DP"], int)
+                    self.assertLessEqual(support["AD"], support["DP"])
+
+    def testMissingSupport(self):
+        for caller_name, input_path in [("FreeBayes", self.inputs[1]), ("HaplotypeCaller", self.inputs[0]), ("Strelka2", self.inputs[2])]:
+            with self.subTest(caller=caller_name):
+                with merger.VCFIO(input_path) as FH_in:
+                    adapter = merger.getCallerAdapter(caller_name, FH_in)
+                    record = next(iter(FH_in))
+                    spl = FH_in.samples[0]
+                    for field, expected in [("GT", "missing GT"), ("AD", "missing AD")]:
+                        with self.subTest(field=field):
+                            spl_data = dict(record.samples[spl])
+                            del spl_data[field]
+                            if field == "AD":
+                                spl_data.pop("AF", None)
+                            missing_record = merger.VCFRecord(record.chrom, record.pos, None, record.ref, record.alt, None, None, {}, list(spl_data), {spl: spl_data})
+                            self.assertEqual(adapter.extract(missing_record, spl), (None, expected))
+                    if caller_name != "HaplotypeCaller":  # The invalid values are not hidden
+                        spl_data = dict(record.samples[spl], AD=["x", "y"])
+                        invalid_record = merger.VCFRecord(record.chrom, record.pos, None, record.ref, record.alt, None, None, {}, list(spl_data), {spl: spl_data})
+                        with self.assertRaises(ValueError):
+                            adapter.extract(invalid_record, spl)
+
+    def testLoad(self):
+        plugin_path = self.tmpPath("plugin.py")
+        with open(plugin_path, "w") as FH_out:
+            FH_out.write("""@registerCallerAdapter
+class ConstantAdapter(CallerAdapter):
+    name = "Constant"
+    aliases = ["HaplotypeCaller"]
+
+    def extract(self, record, spl):
+        return {"AD": 1, "DP": 2, "GT": record.samples[spl]["GT"]}, None
+""")
+        merger.loadCallerAdapters(plugin_path)
+        with merger.VCFIO(self.inputs[0]) as FH_in:
+            adapter = merger.getCallerAdapter("HaplotypeCaller", FH_in)
+            self.assertEqual(adapter.name, "Constant")
+            self.assertEqual(adapter.extract(next(iter(FH_in)), FH_in.samples[0]), ({"AD": 1, "DP": 2, "GT": "1/1"}, None))
+        # The merge output does not depend on AD and DP extraction
+        self.assertSameAsDefault("plugin.vcf", "--caller-adapters", plugin_path)
+
+
+class TestLazyMerge(MergeTestCase):
+    def assertSameAsDefaultFloats(self, out_filename, *options):
+        """Check that the output is the same as the default merge except the trailing .0 of floats kept as in the callers VCF."""
+        self.merge("default.vcf")
+        self.merge(out_filename, *options)
+        expected = [canonicalFloats(line) for line in readLines(self.tmpPath("default.vcf"))]
+        self.assertEqual([canonicalFloats(line) for line in readLines(self.tmpPath(out_filename))], expected)
+
+    def testSameAsDefault(self):
+        self.assertSameAsDefaultFloats("lazy.vcf", "--lazy")
+
+    def testStreaming(self):
+        self.assertSameAsDefaultFloats("lazy.vcf", "--lazy", "--streaming")
+
+    def testRawValues(self):
+        self.merge("lazy.vcf", "--lazy")
+        self.assertIn("-9.87,-13,-10.96", "\n".join(readRecordsLines(self.tmpPath("lazy.vcf"))))  # As in FreeBayes VCF
+
+
+class TestMetrics(MergeTestCase):
+    def assertVariantsCounts(self, out_filename, metrics):
+        """Check the variants counts of the metrics against the SRC of the merged records."""
+        with merger.VCFIO(self.tmpPath(out_filename)) as FH_in:
+            sources = [record.info["SRC"] for record in FH_in]
+        self.assertEqual(metrics["variants"]["total"], len(sources))
+        self.assertEqual(metrics["variants"]["shared"], len([src for src in sources if len(src) > 1]))
+        expected_private = {}
+        for src in sources:
+            if len(src) == 1:
+                expected_private[src[0]] = expected_private.get(src[0], 0) + 1
+        self.assertEqual(metrics["variants"]["private"], expected_private)
+
+    def testDefault(self):
+        self.merge("default.vcf", "--metrics-json", self.tmpPath("metrics.json"))
+        with open(self.tmpPath("metrics.json")) as FH_in:
+            metrics = json.load(FH_in)
+        self.assertEqual(set(metrics["phases"]), {"merge", "sort", "header", "write"})
+        self.assertEqual(list(metrics["callers"]), CALLERS)
+        for caller, caller_metrics in metrics["callers"].items():
+            with self.subTest(caller=caller):
+                self.assertGreater(caller_metrics["records"], 0)
+                self.assertEqual(caller_metrics["errors"], {})
+        self.assertVariantsCounts("default.vcf", metrics)
+        self.assertGreater(metrics["peak_rss_bytes"], 0)
+
+    def testStreaming(self):
+        self.merge("default.vcf", "--metrics-json", self.tmpPath("default.json"))
+        self.merge("streamed.vcf", "--streaming", "--metrics-json", self.tmpPath("streamed.json"))
+        with open(self.tmpPath("default.json")) as FH_in:
+            default_metrics = json.load(FH_in)
+        with open(self.tmpPath("streamed.json")) as FH_in:
+            metrics = json.load(FH_in)
+        self.assertIn("merge_and_write", metrics["phases"])
+        self.assertEqual(metrics["variants"], default_metrics["variants"])
+        self.assertEqual(
+            {caller: caller_metrics["records"] for caller, caller_metrics in metrics["callers"].items()},
+            {caller: caller_metrics["records"] for caller, caller_metrics in default_metrics["callers"].items()}
+        )
+        self.assertVariantsCounts("streamed.vcf", metrics)
+
+
+class TestCompressedOutput(MergeTestCase):
+    def assertSameAsDefaultCompressed(self, *options):
+        """Check that the compressed output is the same as the default merge once decompressed and that its index is valid."""
+        self.merge("default.vcf")
+        self.merge("merged.vcf.gz", *options)
+        expected = readLines(self.tmpPath("default.vcf"))
+        out_path = self.tmpPath("merged.vcf.gz")
+        self.assertEqual(readLines(out_path), expected)
+        # BGZF with end of file marker
+        with open(out_path, "rb") as FH_in:
+            content = FH_in.read()
+        self.assertEqual(content[12:16], b"BC\x02\x00")
+        self.assertTrue(content.endswith(merger.BGZF_EOF))
+        # Index
+        self.assertTrue(os.path.exists(out_path + ".tbi"))
+        expected_records = [line for line in expected if not line.startswith("#")]
+        with pysam.TabixFile(out_path) as FH_idx:
+            self.assertEqual(sorted(FH_idx.contigs), ["1", "2"])
+            for chrom, start, end in [("1", 0, 1200), ("1", 350, 520), ("1", 949, 960), ("2", 100, 250)]:
+                with self.subTest(region=(chrom, start, end)):
+                    expected_region = []
+                    for line in expected_records:
+                        fields = line.split("\t")
+                        record_start = int(fields[1]) - 1
+                        record_end = record_start + len(fields[3])
+                        if fields[0] == chrom and record_start < end and record_end > start:
+                            expected_region.append(line)
+                    self.assertEqual(list(FH_idx.fetch(chrom, start, end)), expected_region)
+
+    def testDefault(self):
+        self.assertSameAsDefaultCompressed()
+
+    def testStreaming(self):
+        self.assertSameAsDefaultCompressed("--streaming", "--compression-threads", "3")
+
+    def testSharded(self):
+        self.assertSameAsDefaultCompressed("--processes", "2", "--chunk-size", "500", "--compression-threads", "2")
+
+    def writeLines(self, out_filename, lines):
+        """Write the records lines with the header of the HaplotypeCaller VCF and return the path to the file."""
+        out_path = self.tmpPath(out_filename)
+        with merger.VCFIO(self.inputs[0]) as FH_in:
+            with merger.MergedVCFIO(out_path, "w") as FH_out:
+                FH_out.copyHeader(FH_in)
+                FH_out.writeHeader()
+                for line in lines:
+                    FH_out.writeVCFLine(line)
+        return out_path
+
+    def testPositionOrder(self):
+        # Sorted by (chrom, refStart, refEnd) as the merge: the deletion 1:100 ATG>A starts at 101 and ends after the SNV 1:101
+        lines = [
+            "1\t90\t.\tC\tA\t.\t.\t.",
+            "1\t101\t.\tT\tG\t.\t.\t.",
+            "1\t100\t.\tATG\tA\t.\t.\t.",
+            "2\t5\t.\tG\tC\t.\t.\t."
+        ]
+        self.assertEqual(
+            [(record.refStart(), record.refEnd()) for record in [merger.VCFRecord("1", 101, None, "T", ["G"]), merger.VCFRecord("1", 100, None, "ATG", ["A"])]],
+            [(101, 101), (101, 102)]
+        )
+        self.assertEqual(readRecordsLines(self.writeLines("merged.vcf", lines)), lines)
+        out_path = self.writeLines("merged.vcf.gz", lines)
+        self.assertEqual(readRecordsLines(out_path), [lines[0], lines[2], lines[1], lines[3]])  # Position order for tabix
+        with pysam.TabixFile(out_path) as FH_idx:
+            self.assertEqual(list(FH_idx.fetch("1", 100, 101)), [lines[2], lines[1]])
+
+    def testOutOfWindow(self):
+        lines = [
+            "1\t100\t.\tC\tA\t.\t.\t.",
+            "1\t{}\t.\tT\tG\t.\t.\t.".format(200 + merger.POSITION_REORDER_WINDOW),
+            "1\t50\t.\tA\tG\t.\t.\t."
+        ]
+        with self.assertRaisesRegex(ValueError, "1:50 cannot be written"):
+            self.writeLines("merged.vcf.gz", lines)
+        self.assertEqual(readRecordsLines(self.writeLines("merged.vcf", lines)), lines)
+
+    def testCSIFallback(self):
+        lines = [
+            "1\t100\t.\tC\tA\t.\t.\t.",
+            "1\t{}\t.\tT\tG\t.\t.\t.".format(merger.TABIX_MAX_POS + 10)
+        ]
+        with self.assertLogs(merger.log, "WARNING"):
+            out_path = self.writeLines("merged.vcf.gz", lines)
+        self.assertFalse(os.path.exists(out_path + ".tbi"))
+        self.assertTrue(os.path.exists(out_path + ".csi"))
+        with pysam.TabixFile(out_path, index=out_path + ".csi") as FH_idx:
+            self.assertEqual(list(FH_idx.fetch("1", merger.TABIX_MAX_POS, merger.TABIX_MAX_POS + 20)), [lines[1]])
+
+
+class TestConcordanceStats(unittest.TestCase):
+    def getRecords(self):
+        """Return merged records with hand-computed differences: A/B on 5 variants, A/C on 1 variant with DP missing for C and an AD difference beyond MAX_DEPTH_DIFF."""
+        records = []
+        for pos, B_AD in enumerate([10, 11, 12, 13, 20]):  # AD differences: 0, 1, 2, 3, 10 and AF differences: 0, 0.01, 0.02, 0.03, 0.1
+            records.append(merger.VCFRecord(
+                "1", pos + 1, None, "A", ["T"], None, None, {"SRC": ["A", "B"]}, ["s0_AD", "s0_DP", "s1_AD", "s1_DP"],
+                {"splA": {"s0_AD": [90, 10], "s0_DP": 100, "s1_AD": [100 - B_AD, B_AD], "s1_DP": 100}}
+            ))
+        records.append(merger.VCFRecord(
+            "1", 10, None, "A", ["T"], None, None, {"SRC": ["C"]}, ["s2_AD", "s2_DP"],
+            {"splA": {"s2_AD": [1, 1], "s2_DP": 2}}
+        ))
+        records.append(merger.VCFRecord(
+            "1", 11, None, "A", ["T"], None, None, {"SRC": ["A", "C"]}, ["s0_AD", "s0_DP", "s2_AD"],
+            {"splA": {"s0_AD": [0, 5], "s0_DP": 5, "s2_AD": [0, 20005]}}
+        ))
+        return records
+
+    def assertExpected(self, observed):
+        self.assertEqual(observed["shared_variants"], 6)
+        self.assertEqual(list(observed["pairs"]), ["A/B", "A/C", "B/C"])
+        A_B = observed["pairs"]["A/B"]
+        self.assertEqual(A_B["AD"], {"count": 5, "median": 2, "p75": 3, "p90": 10, "max": 10})
+        self.assertEqual(A_B["DP"], {"count": 5, "median": 0, "p75": 0, "p90": 0, "max": 0})
+        self.assertEqual(A_B["AF"]["count"], 5)
+        for name, expected in [("median", 0.02), ("p75", 0.03), ("p90", 0.1), ("max", 0.1)]:
+            self.assertAlmostEqual(A_B["AF"][name], expected)
+        A_C = observed["pairs"]["A/C"]
+        self.assertEqual(A_C["AD"], {"count": 1, "median": merger.ConcordanceStats.MAX_DEPTH_DIFF, "p75": merger.ConcordanceStats.MAX_DEPTH_DIFF, "p90": merger.ConcordanceStats.MAX_DEPTH_DIFF, "max": 20000})
+        missing = {"count": 0, "median": None, "p75": None, "p90": None, "max": None}
+        self.assertEqual(A_C["DP"], missing)
+        self.assertEqual(A_C["AF"], missing)
+        self.assertEqual(observed["pairs"]["B/C"], {"AD": missing, "DP": missing, "AF": missing})
+
+    def testPercentiles(self):
+        concordance = merger.ConcordanceStats(["A", "B", "C"])
+        for record in self.getRecords():
+            concordance.add(record)
+        self.assertExpected(concordance.toDict())
+
+    def testChunksAndUpdate(self):
+        previous_chunk_size = merger.ConcordanceStats.CHUNK_SIZE
+        merger.ConcordanceStats.CHUNK_SIZE = 2
+        try:
+            first = merger.ConcordanceStats(["A", "B", "C"])
+            second = merger.ConcordanceStats(["A", "B", "C"])
+            records = self.getRecords()
+            for record in records[:3]:
+                first.add(record)
+            for record in records[3:]:
+                second.add(record)
+            first.update(second)
+            self.assertExpected(first.toDict())
+        finally:
+            merger.ConcordanceStats.CHUNK_SIZE = previous_chunk_size
+
+    def testWithoutSharedVariants(self):
+        concordance = merger.ConcordanceStats(["A", "B", "C"])
+        concordance.add(self.getRecords()[5])
+        self.assertEqual(concordance.toDict(), {"shared_variants": 0, "pairs": {}})
+
+
+class TestConcordance(MergeTestCase):
+    def getExpectedConcordance(self, merged_path):
+        """Return the differences by pair of callers computed from the prefixed FORMAT sN_AD and sN_DP of the merged records."""
+        diff_by_pair = {}
+        nb_shared = 0
+        with merger.VCFIO(merged_path) as FH_in:
+            for record in FH_in:
+                callers = record.info["SRC"]
+                if len(callers) < 2:
+                    continue
+                nb_shared += 1
+                for spl_data in record.samples.values():
+                    values = {}
+                    for caller in callers:
+                        idx = CALLERS.index(caller)
+                        AD = spl_data.get("s{}_AD".format(idx))
+                        DP = spl_data.get("s{}_DP".format(idx))
+                        values[caller] = (None if AD is None else AD[-1], DP)
+                    for first_idx, first in enumerate(CALLERS):
+                        for second in CALLERS[first_idx + 1:]:
+                            if first in values and second in values:
+                                pair_diff = diff_by_pair.setdefault("{}/{}".format(first, second), {"AD": [], "DP": [], "AF": []})
+                                (first_AD, first_DP), (second_AD, second_DP) = values[first], values[second]
+                                if first_AD is not None and second_AD is not None:
+                                    pair_diff["AD"].append(abs(first_AD - second_AD))
+                                if first_DP is not None and second_DP is not None:
+                                    pair_diff["DP"].append(abs(first_DP - second_DP))
+                                    if first_AD is not None and second_AD is not None and first_DP > 0 and second_DP > 0:
+                                        pair_diff["AF"].append(abs(first_AD / first_DP - second_AD / second_DP))
+        expected = {"shared_variants": nb_shared, "pairs": {}}
+        for pair, diff_by_metric in diff_by_pair.items():
+            expected["pairs"][pair] = {}
+            for metric, diff in diff_by_metric.items():
+                if metric == "AF":
+                    diff = [round(value * merger.ConcordanceStats.AF_BINS) / merger.ConcordanceStats.AF_BINS for value in diff]
+                diff = sorted(diff)
+                expected["pairs"][pair][metric] = {"count": len(diff)}
+                for name, quantile in [("median", 0.5), ("p75", 0.75), ("p90", 0.9)]:
+                    expected["pairs"][pair][metric][name] = diff[max(math.ceil(len(diff) * quantile), 1) - 1]  # Nearest rank
+                expected["pairs"][pair][metric]["max"] = diff[-1]
+        return expected
+
+    def testSameAsRecords(self):
+        self.assertSameAsDefault("merged.vcf", "--concordance-json", self.tmpPath("concordance.json"))
+        with open(self.tmpPath("concordance.json")) as FH_in:
+            observed = json.load(FH_in)
+        expected = self.getExpectedConcordance(self.tmpPath("default.vcf"))
+        self.assertGreater(expected["shared_variants"], 0)
+        self.assertEqual(list(observed["pairs"]), ["HaplotypeCaller/FreeBayes", "HaplotypeCaller/Strelka2", "FreeBayes/Strelka2"])
+        self.assertEqual(observed["shared_variants"], expected["shared_variants"])
+        for pair, expected_pair in expected["pairs"].items():
+            for metric, expected_stats in expected_pair.items():
+                with self.subTest(pair=pair, metric=metric):
+                    observed_stats = observed["pairs"][pair][metric]
+                    if metric == "AF":  # The maximum is not rounded
+                        self.assertAlmostEqual(observed_stats.pop("max"), expected_stats.pop("max"), places=2)
+                    self.assertEqual(observed_stats, expected_stats)
+
+    def testChunks(self):
+        self.merge("default.vcf", "--concordance-json", self.tmpPath("concordance.json"))
+        with open(self.tmpPath("concordance.json")) as FH_in:
+            expected = json.load(FH_in)
+        previous_chunk_size = merger.ConcordanceStats.CHUNK_SIZE
+        merger.ConcordanceStats.CHUNK_SIZE = 7
+        try:
+            concordance = merger.ConcordanceStats(CALLERS)
+            with merger.VCFIO(self.tmpPath("default.vcf")) as FH_in:
+                for record in FH_in:
+                    concordance.add(record)
+            self.assertEqual(json.loads(json.dumps(concordance.toDict())), expected)
+        finally:
+            merger.ConcordanceStats.CHUNK_SIZE = previous_chunk_size
+
+    def testModes(self):
+        self.merge("default.vcf", "--concordance-json", self.tmpPath("default.json"))
+        with open(self.tmpPath("default.json")) as FH_in:
+            expected = json.load(FH_in)
+        for mode, options in [("lazy", ["--lazy"]), ("streaming", ["--streaming"]), ("sharded", ["--processes", "2", "--chunk-size", "500"])]:
+            with self.subTest(mode=mode):
+                self.merge(mode + ".vcf", *options, "--concordance-json", self.tmpPath(mode + ".json"))
+                with open(self.tmpPath(mode + ".json")) as FH_in:
+                    self.assertEqual(json.load(FH_in), expected)
+
+
+class TestVariantMatrixWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.records = [
+            merger.VCFRecord(
+                "2", 5, None, "A", ["T"], None, None, {"SRC": ["A"], "s0_VCQUAL": 30.5}, ["s0_GT", "s0_AD", "s0_DP"],
+                {"splA": {"s0_GT": "0/1", "s0_AD": [3, 7], "s0_DP": 10}, "splB": {"s0_GT": "1|1", "s0_DP": 4}}
+            ),
+            merger.VCFRecord(
+                "1", 7, None, "AC", ["A", "ACC"], None, None, {"SRC": ["A", "B"], "s1_VCQUAL": 12}, ["s0_GT", "s0_AD", "s0_DP", "s1_GT", "s1_AD", "s1_DP"],
+                {
+                    "splA": {"s0_GT": "1/2", "s0_AD": [1, 2, 3], "s0_DP": 6, "s1_GT": "./.", "s1_AD": [0, 5], "s1_DP": 5},
+                    "splB": {"s0_GT": "0/0", "s1_GT": "0/1"}
+                }
+            ),
+            merger.VCFRecord(
+                "2", 9, None, "G", ["C"], None, None, {"SRC": ["B"]}, ["s1_GT"],
+                {"splA": {"s1_GT": "1/1"}, "splB": {"s1_GT": ".|1"}}
+            )
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, dirname, records):
+        matrix_dir = os.path.join(self.tmp_dir, dirname)
+        writer = merger.VariantMatrixWriter(matrix_dir, ["A", "B"], ["splA", "splB"])
+        for record in records:
+            writer.add(record)
+        return writer
+
+    def assertExpected(self, matrix_dir):
+        matrix = merger.readVariantMatrix(matrix_dir, None)
+        self.assertEqual(matrix["nb_variants"], 3)
+        self.assertEqual(matrix["contigs"], ["2", "1"])
+        self.assertEqual(matrix["chrom"].tolist(), [0, 1, 0])
+        self.assertEqual(matrix["pos"].tolist(), [5, 7, 9])
+        self.assertEqual(matrix["ref_offsets"].tolist(), [0, 1, 3, 4])
+        self.assertEqual(bytes(matrix["ref_data"]), b"AACG")
+        self.assertEqual(matrix["alt_offsets"].tolist(), [0, 1, 6, 7])
+        self.assertEqual(bytes(matrix["alt_data"]), b"TA,ACCC")
+        self.assertEqual(matrix["src"].tolist(), [1, 3, 2])
+        self.assertEqual(str(matrix["qual"].tolist()), str([[30.5, math.nan], [math.nan, 12.0], [math.nan, math.nan]]))
+        # By variant, caller and sample
+        self.assertEqual(matrix["gt"].tolist(), [[[1, 2], [-1, -1]], [[2, 0], [-1, 1]], [[-1, -1], [2, 1]]])
+        self.assertEqual(matrix["ad"].tolist(), [[[7, -1], [-1, -1]], [[3, -1], [5, -1]], [[-1, -1], [-1, -1]]])
+        self.assertEqual(matrix["dp"].tolist(), [[[10, 4], [-1, -1]], [[6, -1], [5, -1]], [[-1, -1], [-1, -1]]])
+
+    def testColumns(self):
+        self.write("matrix", self.records).close()
+        self.assertExpected(os.path.join(self.tmp_dir, "matrix"))
+
+    def testBufferAndAppend(self):
+        previous_buffer_size = merger.VariantMatrixWriter.BUFFER_SIZE
+        merger.VariantMatrixWriter.BUFFER_SIZE = 1
+        try:
+            self.write("part", self.records[2:]).close()
+            writer = self.write("matrix", self.records[:2])
+            writer.append(os.path.join(self.tmp_dir, "part"))
+            writer.close()
+        finally:
+            merger.VariantMatrixWriter.BUFFER_SIZE = previous_buffer_size
+        self.assertExpected(os.path.join(self.tmp_dir, "matrix"))
+
+
+class TestVariantMatrix(MergeTestCase):
+    def assertSameAsRecords(self, matrix_dir, merged_path):
+        """Check that the matrix contains the values of the merged records."""
+        matrix = merger.readVariantMatrix(matrix_dir)
+        with merger.VCFIO(merged_path) as FH_in:
+            records = list(FH_in)
+            samples = FH_in.samples
+        self.assertEqual(matrix["nb_variants"], len(records))
+        self.assertEqual(matrix["calling_sources"], CALLERS)
+        self.assertEqual(matrix["samples"], samples)
+        for idx, record in enumerate(records):
+            with self.subTest(variant=record.getName()):
+                self.assertEqual(matrix["contigs"][matrix["chrom"][idx]], record.chrom)
+                self.assertEqual(matrix["pos"][idx], record.pos)
+                ref = bytes(matrix["ref_data"][matrix["ref_offsets"][idx]:matrix["ref_offsets"][idx + 1]]).decode()
+                self.assertEqual(ref, record.ref)
+                alt = bytes(matrix["alt_data"][matrix["alt_offsets"][idx]:matrix["alt_offsets"][idx + 1]]).decode()
+                self.assertEqual(alt, ",".join(record.alt))
+                self.assertEqual(matrix["src"][idx], sum(1 << CALLERS.index(caller) for caller in record.info["SRC"]))
+                for idx_caller, caller in enumerate(CALLERS):
+                    prefix = "s{}_".format(idx_caller)
+                    if caller not in record.info["SRC"]:
+                        self.assertTrue(math.isnan(matrix["qual"][idx][idx_caller]))
+                        self.assertEqual(matrix["dp"][idx][idx_caller].tolist(), [-1] * len(samples))
+                        continue
+                    if prefix + "VCQUAL" in record.info:
+                        self.assertAlmostEqual(float(matrix["qual"][idx][idx_caller]), record.info[prefix + "VCQUAL"], places=2)
+                    for idx_spl, spl in enumerate(samples):
+                        spl_data = record.samples[spl]
+                        alleles = spl_data[prefix + "GT"].replace("|", "/").split("/")
+                        expected_gt = -1 if all(allele == "." for allele in alleles) else sum(1 for allele in alleles if allele not in {"0", "."})
+                        self.assertEqual(matrix["gt"][idx][idx_caller][idx_spl], expected_gt)
+                        self.assertEqual(matrix["ad"][idx][idx_caller][idx_spl], spl_data[prefix + "AD"][-1])
+                        self.assertEqual(matrix["dp"][idx][idx_caller][idx_spl], spl_data[prefix + "DP"])
+
+    def testSameAsRecords(self):
+        self.assertSameAsDefault("merged.vcf", "--output-matrix", self.tmpPath("matrix"))
+        self.assertSameAsRecords(self.tmpPath("matrix"), self.tmpPath("default.vcf"))
+
+    def testModes(self):
+        self.merge("default.vcf", "--output-matrix", self.tmpPath("default_matrix"))
+        expected = merger.readVariantMatrix(self.tmpPath("default_matrix"), None)
+        for mode, options in [("lazy", ["--lazy"]), ("streaming", ["--streaming"]), ("sharded", ["--processes", "2", "--chunk-size", "500"])]:
+            with self.subTest(mode=mode):
+                self.merge(mode + ".vcf", *options, "--output-matrix", self.tmpPath(mode + "_matrix"))
+                observed = merger.readVariantMatrix(self.tmpPath(mode + "_matrix"), None)
+                self.assertEqual(observed["nb_variants"], expected["nb_variants"])
+                self.assertEqual(observed["contigs"], expected["contigs"])
+                for column in merger.VariantMatrixWriter.COLUMNS:
+                    self.assertEqual(observed[column].tobytes(), expected[column].tobytes(), column)
+
+    def testBuffer(self):
+        self.merge("default.vcf")
+        previous_buffer_size = merger.VariantMatrixWriter.BUFFER_SIZE
+        merger.VariantMatrixWriter.BUFFER_SIZE = 7
+        try:
+            with merger.VCFIO(self.tmpPath("default.vcf")) as FH_in:
+                writer = merger.VariantMatrixWriter(self.tmpPath("matrix"), CALLERS, FH_in.samples)
+                for record in FH_in:
+                    writer.add(record)
+                writer.close()
+        finally:
+            merger.VariantMatrixWriter.BUFFER_SIZE = previous_buffer_size
+        self.assertSameAsRecords(self.tmpPath("matrix"), self.tmpPath("default.vcf"))
+
+
+class TestReconcileOverlappingRecords(unittest.TestCase):
+    def getRecord(self, chrom, pos, ref, alt, callers):
+        return merger.VCFRecord(chrom, pos, None, ref, [alt], None, None, {"SRC": callers})
+
+    def testSweepLine(self):
+        records = [
+            # Group 1:10-11: the SNVs of B and C are substitutions of the MNV of A
+            self.getRecord("1", 10, "A", "G", ["B"]),  # Removed
+            self.getRecord("1", 10, "AC", "GT", ["A"]),
+            self.getRecord("1", 11, "C", "T", ["C"]),  # Removed
+            self.getRecord("1", 11, "C", "A", ["B"]),  # Not a substitution of the MNV
+            self.getRecord("1", 12, "G", "T", ["B"]),  # Starts after the end of the group
+            # Group 1:30-31: the caller of the SNV has found the MNV
+            self.getRecord("1", 30, "A", "G", ["B", "C"]),
+            self.getRecord("1", 30, "AC", "GT", ["A", "B"]),
+            # Group 1:50-54: substitution at the end of the complex variant, found after the SNV overlapping its middle
+            self.getRecord("1", 50, "ACGTA", "TCGTT", ["A"]),
+            self.getRecord("1", 52, "G", "C", ["C"]),  # Not a substitution of the complex variant
+            self.getRecord("1", 54, "A", "T", ["C"]),  # Removed
+            # Other contig
+            self.getRecord("2", 50, "A", "T", ["C"])
+        ]
+        self.assertEqual(records, sorted(records, key=lambda record: (record.chrom, record.refStart(), record.refEnd())))
+        metrics = merger.RunMetrics()
+        reconciled = list(merger.reconcileOverlappingRecords(records, ["A", "B", "C"], metrics))
+        self.assertEqual(
+            [record.getName() for record in reconciled],
+            [records[idx].getName() for idx in [1, 3, 4, 5, 6, 7, 8, 10]]
+        )
+        self.assertEqual(records[1].info["DECSRC"], ["B", "C"])
+        self.assertNotIn("DECSRC", records[6].info)
+        self.assertEqual(records[7].info["DECSRC"], ["C"])
+        self.assertEqual(metrics.variants["decomposed"], 3)
+
+    def testWithoutComplex(self):
+        records = [self.getRecord("1", 10, "A", "G", ["A"]), self.getRecord("1", 10, "A", "T", ["B"])]
+        self.assertEqual(list(merger.reconcileOverlappingRecords(records, ["A", "B"])), records)
+        self.assertEqual(list(merger.reconcileOverlappingRecords([], ["A", "B"])), [])
+
+
+class TestReconcileOverlaps(MergeTestCase):
+    @staticmethod
+    def isDecomposedForm(snv, complex_record):
+        """Return True if the SNV is a substitution of the complex record, reported in its DECSRC and found by other callers."""
+        if snv.chrom != complex_record.chrom or snv.info["SRC"][0] not in complex_record.info.get("DECSRC", []):
+            return False
+        if not set(snv.info["SRC"]).isdisjoint(complex_record.info["SRC"]):
+            return False
+        offset = snv.pos - complex_record.pos
+        for alt in complex_record.alt:
+            if 0 <= offset < min(len(complex_record.ref), len(alt)) and (complex_record.ref[offset], alt[offset]) == (snv.ref, snv.alt[0]):
+                return True
+        return False
+
+    def testRemovedSNVs(self):
+        self.merge("default.vcf")
+        self.merge("reconciled.vcf", "--reconcile-overlaps", "--metrics-json", self.tmpPath("metrics.json"))
+        with merger.VCFIO(self.tmpPath("default.vcf")) as FH_in:
+            default_by_name = {record.getName(): record for record in FH_in}
+        with merger.VCFIO(self.tmpPath("reconciled.vcf")) as FH_in:
+            reconciled_by_name = {record.getName(): record for record in FH_in}
+        # Kept records
+        self.assertTrue(set(reconciled_by_name).issubset(default_by_name))
+        for name, record in reconciled_by_name.items():
+            expected_info = dict(default_by_name[name].info)
+            if "DECSRC" in record.info:
+                self.assertTrue(merger.is_complex_variant(record))
+                expected_info["DECSRC"] = record.info["DECSRC"]
+            self.assertEqual(record.info, expected_info, name)
+        # Removed records
+        removed = [record for name, record in default_by_name.items() if name not in reconciled_by_name]
+        self.assertGreater(len(removed), 0)
+        for snv in removed:
+            with self.subTest(snv=snv.getName()):
+                self.assertFalse(merger.is_complex_variant(snv))
+                complex_records = [record for record in reconciled_by_name.values() if self.isDecomposedForm(snv, record)]
+                self.assertNotEqual(complex_records, [])
+        with open(self.tmpPath("metrics.json")) as FH_in:
+            self.assertEqual(json.load(FH_in)["variants"]["decomposed"], len(removed))
+
+    def testModes(self):
+        self.merge("default.vcf", "--reconcile-overlaps")
+        expected = readLines(self.tmpPath("default.vcf"))
+        for mode, options in [("lazy", ["--lazy"]), ("streaming", ["--streaming"]), ("sharded", ["--processes", "2"])]:
+            with self.subTest(mode=mode):
+                self.merge(mode + ".vcf", *options, "--reconcile-overlaps")
+                if mode == "lazy":
+                    self.assertEqual([canonicalFloats(line) for line in readLines(self.tmpPath(mode + ".vcf"))], [canonicalFloats(line) for line in expected])
+                else:
+                    self.assertEqual(readLines(self.tmpPath(mode + ".vcf")), expected)
+
+
+class TestUpdateMerge(MergeTestCase):
+    def mergePrevious(self, *options):
+        """Merge the two first callers in previous.vcf."""
+        self.merge("previous.vcf", *options, "--write-state", callers=CALLERS[:2], inputs=self.inputs[:2])
+
+    def assertFullMerge(self, log, reason, *options, callers=None, inputs=None):
+        """Check that the update has been replaced by the merge of all the callers."""
+        self.assertIn("cannot be updated: ", log)
+        self.assertIn(reason, log)
+        self.assertIn("All the callers are merged", log)
+        self.assertNotIn("Update ", log)
+        self.merge("default.vcf", *options, callers=callers, inputs=inputs)
+        self.assertEqual(readLines(self.tmpPath("updated.vcf")), readLines(self.tmpPath("default.vcf")))
+
+    def testSameAsDefault(self):
+        self.mergePrevious()
+        log = self.merge("updated.vcf", "--update-from", self.tmpPath("previous.vcf"))
+        self.assertIn("Update {} with {}".format(self.tmpPath("previous.vcf"), CALLERS[2:]), log)
+        self.merge("default.vcf")
+        self.assertEqual(readLines(self.tmpPath("updated.vcf")), readLines(self.tmpPath("default.vcf")))
+
+    def testSameAsDefaultWithOptions(self):
+        options = ["--prioritize", "--skip-non-variant", "--regions", REGIONS]
+        self.mergePrevious(*options)
+        self.merge("updated.vcf", *options, "--update-from", self.tmpPath("previous.vcf"))
+        self.merge("default.vcf", *options)
+        self.assertEqual(readLines(self.tmpPath("updated.vcf")), readLines(self.tmpPath("default.vcf")))
+
+    def testPreviousCallerRunAgain(self):
+        self.mergePrevious()
+        # Same content in a new file
+        shutil.copyfile(self.inputs[0], self.tmpPath("HaplotypeCaller_run2.vcf"))
+        inputs = [self.tmpPath("HaplotypeCaller_run2.vcf")] + self.inputs[1:]
+        self.merge("updated.vcf", "--update-from", self.tmpPath("previous.vcf"), inputs=inputs)
+        self.merge("default.vcf")
+        self.assertEqual(readLines(self.tmpPath("updated.vcf")), readLines(self.tmpPath("default.vcf")))
+
+    def testPreviousCallerChanged(self):
+        self.mergePrevious()
+        lines = readLines(self.inputs[0])
+        idx_last = max(idx for idx, line in enumerate(lines) if not line.startswith("#"))
+        with open(self.inputs[0], "w") as FH_out:
+            FH_out.write("\n".join(lines[:idx_last] + lines[idx_last + 1:]) + "\n")
+        log = self.merge("updated.vcf", "--update-from", self.tmpPath("previous.vcf"))
+        self.assertFullMerge(log, "the content of the input of HaplotypeCaller has changed")
+
+    def testNotUpdatable(self):
+        self.mergePrevious()
+        for reason, options, callers in [
+            ("the option prioritize is different", ["--prioritize"], CALLERS),
+            ("the option lazy is not managed by update", ["--lazy"], CALLERS),
+            ("the option reconcile_overlaps is not managed by update", ["--reconcile-overlaps"], CALLERS),
+            ("are not the first callers", [], [CALLERS[1], CALLERS[0], CALLERS[2]])
+        ]:
+            with self.subTest(reason=reason):
+                inputs = [self.inputs[CALLERS.index(caller)] for caller in callers]
+                log = self.merge("updated.vcf", *options, "--update-from", self.tmpPath("previous.vcf"), callers=callers, inputs=inputs)
+                self.assertFullMerge(log, reason, *options, callers=callers, inputs=inputs)
+
+    def testState(self):
+        # Written only on request
+        self.merge("previous.vcf", callers=CALLERS[:2], inputs=self.inputs[:2])
+        self.assertFalse(os.path.exists(self.tmpPath("previous.vcf" + merger.MERGE_STATE_SUFFIX)))
+        log = self.merge("updated.vcf", "--update-from", self.tmpPath("previous.vcf"))
+        self.assertFullMerge(log, "{} does not exist (previous merge without --write-state)".format(self.tmpPath("previous.vcf" + merger.MERGE_STATE_SUFFIX)))
+        # Content
+        self.mergePrevious()
+        self.assertEqual(os.listdir(self.tmp_dir).count("previous.vcf" + merger.MERGE_STATE_SUFFIX), 1)  # Without temporary file
+        with open(self.tmpPath("previous.vcf" + merger.MERGE_STATE_SUFFIX)) as FH_in:
+            state = json.load(FH_in)
+        self.assertEqual(state["calling_sources"], CALLERS[:2])
+        self.assertEqual([elt["path"] for elt in state["inputs_variants"]], [os.path.realpath(path) for path in self.inputs[:2]])
+        self.assertEqual(len(state["inputs_variants"][0]["sha256"]), 64)
+
+
+class TestRegionIndex(unittest.TestCase):
+    def setUp(self):
+        self.regions = merger.RegionIndex([("2", 5, 10), ("1", 251, 300), ("1", 150, 250), ("1", 400, 450), ("1", 100, 200)])
+
+    def testMergedIntervals(self):
+        self.assertEqual(list(self.regions), [("1", 100, 300), ("1", 400, 450), ("2", 5, 10)])  # Overlapping and adjacent intervals are merged
+        self.assertEqual(self.regions.getIntervals("1"), [(100, 300), (400, 450)])
+        self.assertEqual(self.regions.getIntervals("3"), [])
+        self.assertEqual(self.regions.toBED(), "1\t99\t300\n1\t399\t450\n2\t4\t10\n")
+
+    def testPaddingEdges(self):
+        # The padded intervals are separated by one base
+        padded = self.regions.getPadded(49)
+        self.assertEqual(list(padded), [("1", 51, 349), ("1", 351, 499), ("2", 1, 59)])  # The start is limited to 1
+        for pos, expected in [(50, False), (51, True), (349, True), (350, False), (351, True), (499, True), (500, False)]:
+            with self.subTest(padding=49, pos=pos):
+                self.assertEqual(padded.overlaps("1", pos, pos), expected)
+        self.assertTrue(padded.overlaps("1", 340, 360))  # Interval containing the gap
+        # The padded intervals are adjacent
+        padded = self.regions.getPadded(50)
+        self.assertEqual(list(padded), [("1", 50, 500), ("2", 1, 60)])
+        for pos, expected in [(49, False), (50, True), (350, True), (500, True), (501, False)]:
+            with self.subTest(padding=50, pos=pos):
+                self.assertEqual(padded.overlaps("1", pos, pos), expected)
+        self.assertEqual(self.regions.getPadded(0).toBED(), self.regions.toBED())
+
+    def testOverlapsRecord(self):
+        for record, expected in [
+            (merger.VCFRecord("1", 98, None, "ACG", ["A"]), True),  # Deletion ending on the first base of the region
+            (merger.VCFRecord("1", 97, None, "AC", ["A"]), False),  # Deletion ending before the region
+            (merger.VCFRecord("1", 300, None, "A", ["AT"]), True),  # Insertion after the last base of the region
+            (merger.VCFRecord("1", 301, None, "A", ["AT"]), False),
+            (merger.VCFRecord("2", 4, None, "A", ["T"]), False),
+            (merger.VCFRecord("3", 100, None, "A", ["T"]), False)  # Contig without regions
+        ]:
+            with self.subTest(record=record.getName()):
+                self.assertEqual(self.regions.overlapsRecord(record), expected)
+
+
+class TestRegionsMerge(MergeTestCase):
+    def getExpectedLines(self, merged_path):
+        """Return the lines of the merged VCF without the records outside REGIONS."""
+        intervals = []
+        with open(REGIONS) as FH_in:
+            for line in FH_in:
+                chrom, start, end = line.rstrip("\n").split("\t")[:3]
+                intervals.append((chrom, int(start) + 1, int(end)))
+        expected = []
+        for line in readLines(merged_path):
+            if line.startswith("#"):
+                expected.append(line)
+            else:
+                chrom, pos, record_id, ref = line.split("\t")[:4]
+                start = int(pos)
+                end = start + len(ref) - 1
+                if any(chrom == region_chrom and start <= region_end and end >= region_start for region_chrom, region_start, region_end in intervals):
+                    expected.append(line)
+        return expected
+
+    def testRegionIndex(self):
+        regions = merger.RegionIndex.fromBED(REGIONS)
+        with open(REGIONS) as FH_in:
+            self.assertEqual(regions.toBED(), FH_in.read())
+        self.assertTrue(regions.overlaps("1", 101, 101))  # First base of the region
+        self.assertFalse(regions.overlaps("1", 100, 100))  # Before the region
+        self.assertTrue(regions.overlaps("1", 95, 101))
+        self.assertTrue(regions.overlaps("1", 500, 510))  # Last base of the region
+        self.assertFalse(regions.overlaps("1", 501, 899))  # Between regions
+        self.assertFalse(regions.overlaps("3", 1, 1000))  # Contig without regions
+        padded = regions.getPadded(10)
+        self.assertTrue(padded.overlaps("1", 91, 91))
+        self.assertFalse(padded.overlaps("1", 90, 90))
+        self.assertTrue(padded.overlaps("1", 501, 510))
+
+    def testSameAsFilteredDefault(self):
+        for mode, options in [
+            ("default", []),
+            ("streaming", ["--streaming"]),
+            ("sharded", ["--processes", "3", "--chunk-size", "300"]),
+            ("reconciled", ["--reconcile-overlaps"])
+        ]:
+            with self.subTest(mode=mode):
+                self.merge("all_" + mode + ".vcf", *options)
+                self.merge("regions_" + mode + ".vcf", *options, "--regions", REGIONS)
+                expected = self.getExpectedLines(self.tmpPath("all_" + mode + ".vcf"))
+                observed = readLines(self.tmpPath("regions_" + mode + ".vcf"))
+                self.assertGreater(len([line for line in observed if not line.startswith("#")]), 10)
+                self.assertLess(len(observed), len(readLines(self.tmpPath("all_" + mode + ".vcf"))))
+                self.assertEqual(observed, expected)
+
+
+class TestVariantLinesReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.vcf_path = os.path.join(self.tmp_dir, "calls.vcf")
+        lines = [
+            "##fileformat=VCFv4.2",
+            "##contig=<ID=1,length=1000>",
+            "##contig=<ID=2,length=1000>",
+            '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+            '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+            "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tsplA\tsplB",
+            "1\t10\t.\tA\tT\t.\tPASS\t.\tGT:DP\t0/1:10\t0/0:12",  # Kept
+            "1\t20\t.\tA\t<NON_REF>\t.\tPASS\t.\tGT:DP\t0/1:10\t0/1:12",  # Reference block
+            "1\t30\t.\tA\tT\t.\tPASS\t.\tGT:DP\t0/0:10\t0|0:12",  # Hom-ref
+            "1\t40\t.\tA\tT\t.\tPASS\t.\tGT:DP\t./.:10\t0/.:12",  # No-call
+            "1\t50\t.\tA\tT\t.\tPASS\t.\tGT:DP\t./.:10\t1|1:12",  # Kept
+            "1\t60\t.\tA\tT\t.\tPASS\t.\tDP\t10\t12",  # Kept: without GT
+            "2\t5\t.\tA\t<*>\t.\tPASS\t.\tGT:DP\t0/0:10\t0/0:12",  # Reference block
+            "2\t15\t.\tA\tC\t.\tPASS\t.\tGT:DP\t0/1:10\t./.:12"  # Kept
+        ]
+        with open(self.vcf_path, "w") as FH_out:
+            FH_out.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def testIter(self):
+        counts = {"kept": 0, "dropped": 0}
+        with merger.VCFIO(self.vcf_path) as FH_in:
+            records = list(merger.VariantLinesReader(FH_in, counts))
+        self.assertEqual([record.getName() for record in records], ["1:10=A/T", "1:50=A/T", "1:60=A/T", "2:15=A/C"])
+        self.assertEqual(records[1].samples["splB"]["GT"], "1|1")
+        self.assertEqual(counts, {"kept": 4, "dropped": 4})
+        # Without counts all the lines are kept
+        with merger.VCFIO(self.vcf_path) as FH_in:
+            self.assertEqual(len(list(merger.VariantLinesReader(FH_in))), 8)
+
+    def testGetSubCounts(self):
+        gz_path = pysam.tabix_index(self.vcf_path, preset="vcf", keep_original=True)
+        counts = {"kept": 0, "dropped": 0}
+        with merger.VCFIO(gz_path, "i") as FH_in:
+            reader = merger.VariantLinesReader(FH_in, counts)
+            # Overlapping regions: the lines are counted only in their counting interval
+            first = [record.pos for record in reader.getSub("1", 1, 40, None, 35)]
+            second = [record.pos for record in reader.getSub("1", 25, 100, 36, None)]
+            self.assertEqual(first, [10])
+            self.assertEqual(second, [50, 60])
+            self.assertEqual(counts, {"kept": 3, "dropped": 3})
+            self.assertEqual([record.pos for record in reader.getSub("2", 1, 100)], [15])
+            self.assertEqual(list(reader.getSub("3", 1, 100)), [])
+        self.assertEqual(counts, {"kept": 4, "dropped": 4})
+
+
+class TestPrefilter(MergeTestCase):
+    def setUp(self):
+        super().setUp()
+        # All-sites inputs: hom-ref, no-call and reference blocks lines added after the biallelic records
+        self.all_sites_inputs = []
+        self.nb_added = []
+        for input_path in self.inputs:
+            lines = []
+            nb_added = 0
+            for line in readLines(input_path):
+                lines.append(line)
+                fields = line.split("\t")
+                if line.startswith("#") or "," in fields[4]:
+                    continue
+                gt_idx = fields[8].split(":").index("GT")
+                for added_type, (alt, gt) in enumerate([(fields[4], "0/0"), (fields[4], "./."), ("<NON_REF>", "0|0"), (fields[4], "0")]):
+                    if nb_added % 4 == added_type:
+                        added_fields = fields[:4] + [alt] + fields[5:9]
+                        for spl_field in fields[9:]:
+                            spl_tokens = spl_field.split(":")
+                            spl_tokens[gt_idx] = gt
+                            added_fields.append(":".join(spl_tokens))
+                        lines.append("\t".join(added_fields))
+                        nb_added += 1
+                        break
+            self.all_sites_inputs.append(input_path[:-4] + "_all_sites.vcf")
+            with open(self.all_sites_inputs[-1], "w") as FH_out:
+                FH_out.write("\n".join(lines) + "\n")
+            self.nb_added.append(nb_added)
+
+    def testSameAsDefault(self):
+        self.merge("default.vcf")
+        expected = readLines(self.tmpPath("default.vcf"))
+        self.merge("clean.vcf", "--skip-non-variant", "--metrics-json", self.tmpPath("clean.json"))
+        self.assertEqual(readLines(self.tmpPath("clean.vcf")), expected)
+        with open(self.tmpPath("clean.json")) as FH_in:
+            clean_metrics = json.load(FH_in)
+        for mode, options in [("default", []), ("streaming", ["--streaming"]), ("sharded", ["--processes", "2", "--chunk-size", "500"])]:
+            with self.subTest(mode=mode):
+                log = self.merge(mode + ".vcf", *options, "--skip-non-variant", "--metrics-json", self.tmpPath(mode + ".json"), inputs=self.all_sites_inputs)
+                self.assertEqual(readLines(self.tmpPath(mode + ".vcf")), expected)
+                with open(self.tmpPath(mode + ".json")) as FH_in:
+                    metrics = json.load(FH_in)
+                for caller, nb_added in zip(CALLERS, self.nb_added):
+                    clean_counts = clean_metrics["callers"][caller]["prefilter"]
+                    expected_counts = {"kept": clean_counts["kept"], "dropped": clean_counts["dropped"] + nb_added}
+                    self.assertEqual(metrics["callers"][caller]["prefilter"], expected_counts)
+                    self.assertIn("Prefilter {}: {} lines kept and {} hom-ref".format(caller, expected_counts["kept"], expected_counts["dropped"]), log)
+
+    def testCountsWithRegions(self):
+        # All the lines are in the regions extended by REGIONS_PADDING: they are counted once whatever the reading intervals
+        self.merge("clean.vcf", "--skip-non-variant", "--metrics-json", self.tmpPath("clean.json"))
+        with open(self.tmpPath("clean.json")) as FH_in:
+            clean_metrics = json.load(FH_in)
+        for mode, options in [("streaming", ["--streaming"]), ("sharded", ["--processes", "2", "--chunk-size", "300"])]:
+            with self.subTest(mode=mode):
+                self.merge(mode + ".vcf", *options, "--regions", REGIONS, "--skip-non-variant", "--metrics-json", self.tmpPath(mode + ".json"), inputs=self.all_sites_inputs)
+                with open(self.tmpPath(mode + ".json")) as FH_in:
+                    metrics = json.load(FH_in)
+                for caller, nb_added in zip(CALLERS, self.nb_added):
+                    clean_counts = clean_metrics["callers"][caller]["prefilter"]
+                    self.assertEqual(metrics["callers"][caller]["prefilter"], {"kept": clean_counts["kept"], "dropped": clean_counts["dropped"] + nb_added})
+
+    def testIsVariantLine(self):
+        reader = merger.VariantLinesReader(None)
+        for line, expected in [
+            ("1\t10\t.\tA\tT\t.\tPASS\t.\tGT:DP\t0/1:10\t0/0:12", True),
+            ("1\t10\t.\tA\tT\t.\tPASS\t.\tGT:DP\t0/0:10\t./.:12", False),
+            ("1\t10\t.\tA\tT\t.\tPASS\t.\tDP:GT\t10:0|0\t12:1|0", True),
+            ("1\t10\t.\tA\tT\t.\tPASS\t.\tDP:GT\t10:0\t12:.", False),
+            ("1\t10\t.\tA\t<NON_REF>\t.\tPASS\t.\tGT:DP\t0/1:10", False),
+            ("1\t10\t.\tA\t<*>\t.\tPASS\t.\tGT:DP\t0/1:10", False),
+            ("1\t10\t.\tA\tT\t.\tPASS\t.\tDP\t10", True),  # Without GT
+            ("1\t10\t.\tA\tT\t.\tPASS\t.", True)  # Without samples
+        ]:
+            with self.subTest(line=line):
+                self.assertEqual(reader.isVariantLine(line), expected)
+
+
+class TestLineNormalizer(MergeTestCase):
+    """
+    Compare the internal normalizer with "bcftools norm -m -both" on tests/data/normalization_input.vcf: multiallelic records with Number A, R and G fields, indels to left-align in repeats, alleles to trim, lowercase reference, overlapping deletions (*) and records at the start of the sequences. tests/data/normalization_expected.vcf is the output of "bcftools norm --no-version -m -both -f tests/data/ref.fa".
+    """
+    INPUT = os.path.join(DATA_DIR, "normalization_input.vcf")
+    EXPECTED = os.path.join(DATA_DIR, "normalization_expected.vcf")
+
+    def normalizeLines(self, input_path):
+        with merger.VCFIO(input_path) as FH_in, merger.IndexedFasta(REFERENCE) as reference:
+            normalizer = merger.LineNormalizer(FH_in, reference)
+            return list(normalizer.iterLines(readRecordsLines(input_path)))
+
+    def testSameAsExpected(self):
+        input_records = readRecordsLines(self.INPUT)
+        expected = readRecordsLines(self.EXPECTED)
+        # The fixture contains multiallelic records and moved or trimmed alleles
+        self.assertGreater(len(expected), len(input_records))
+        input_positions = {tuple(line.split("\t")[:2]) for line in input_records}
+        self.assertGreater(len([line for line in expected if tuple(line.split("\t")[:2]) not in input_positions]), 5)
+        self.assertEqual(self.normalizeLines(self.INPUT), expected)
+
+    def testWriteNormalizedVCF(self):
+        previous_reference = merger.REFERENCE_GENOME
+        merger.REFERENCE_GENOME = REFERENCE
+        try:
+            self.assertTrue(merger.writeNormalizedVCF(self.INPUT, self.tmpPath("normalized.vcf.gz")))
+        finally:
+            merger.REFERENCE_GENOME = previous_reference
+        self.assertEqual(readRecordsLines(self.tmpPath("normalized.vcf.gz")), readRecordsLines(self.EXPECTED))
+        self.assertTrue(os.path.exists(self.tmpPath("normalized.vcf.gz.tbi")))
+
+    @unittest.skipUnless(HAS_PYSAM_BCFTOOLS, "pysam is built without bcftools")
+    def testSameAsBcftools(self):
+        for input_path in [self.INPUT] + self.inputs:
+            with self.subTest(input=os.path.basename(input_path)):
+                bcftools_output = pysam.bcftools.norm("--no-version", "-m", "-both", "-f", REFERENCE, input_path, catch_stdout=True)
+                expected = [line for line in bcftools_output.splitlines() if not line.startswith("#")]
+                self.assertEqual(self.normalizeLines(input_path), expected)
+
+    @unittest.skipUnless(HAS_PYSAM_BCFTOOLS, "pysam is built without bcftools")
+    def testMergeSameAsBcftools(self):
+        # bcftools stand-in running the bcftools of pysam
+        bcftools_path = self.tmpPath("bcftools")
+        with open(bcftools_path, "w") as FH_out:
+            FH_out.write("#!{}\nimport sys\nimport pysam.bcftools\n\npysam.bcftools.norm(*sys.argv[2:], catch_stdout=False)\n".format(sys.executable))
+        os.chmod(bcftools_path, 0o755)
+        for mode, options in [("default", []), ("streaming", ["--streaming"]), ("regions", ["--regions", REGIONS, "--skip-non-variant"])]:
+            with self.subTest(mode=mode):
+                self.merge("bcftools.vcf", *options, "--bcftools", bcftools_path, normalizer="bcftools")
+                self.merge("internal.vcf", *options)
+                expected = readLines(self.tmpPath("bcftools.vcf"))
+                self.assertGreater(len(expected), 50)
+                self.assertEqual(readLines(self.tmpPath("internal.vcf")), expected)
+
+
+class TestNormalizationErrors(MergeTestCase):
+    def setUp(self):
+        super().setUp()
+        lines = readLines(self.inputs[0])
+        idx_records = [idx for idx, line in enumerate(lines) if not line.startswith("#")]
+        fields = lines[idx_records[10]].split("\t")
+        invalid_nt = next(nt for nt in "ACGT" if nt != fields[3][0].upper() and all(not alt.upper().startswith(nt) for alt in fields[4].split(",")))
+        fields[3] = invalid_nt + fields[3][1:]
+        lines[idx_records[10]] = "\t".join(fields)
+        self.invalid_variant = "{}:{}".format(fields[0], fields[1])
+        with open(self.inputs[0], "w") as FH_out:
+            FH_out.write("\n".join(lines) + "\n")
+
+    def testReferenceMismatch(self):
+        expected_error = "does not correspond to the reference sequence"
+        for mode, options in [("default", []), ("lazy", ["--lazy"]), ("streaming", ["--streaming"]), ("sharded", ["--processes", "2"])]:
+            with self.subTest(mode=mode):
+                log = self.merge(mode + ".vcf", *options, expected_status=1)
+                if mode in {"default", "lazy"}:  # Normalized during the merge
+                    self.assertIn("Error normalizing VCF file {} (HaplotypeCaller): The reference allele".format(self.inputs[0]), log)
+                else:
+                    self.assertIn("Error normalizing VCF file {}: The reference allele".format(self.inputs[0]), log)
+                self.assertIn("of the variant {} {}".format(self.invalid_variant, expected_error), log)
+                self.assertNotIn("Traceback", log)
+
+    def testReferenceMismatchInUpdate(self):
+        self.merge("previous.vcf", callers=CALLERS[1:], inputs=self.inputs[1:])
+        callers = CALLERS[1:] + CALLERS[:1]
+        inputs = self.inputs[1:] + self.inputs[:1]
+        log = self.merge("updated.vcf", "--update-from", self.tmpPath("previous.vcf"), callers=callers, inputs=inputs, expected_status=1)
+        self.assertIn("Error normalizing VCF file {} (HaplotypeCaller): The reference allele".format(self.inputs[0]), log)
+        self.assertNotIn("Traceback", log)
+
+    def testUnknownSequence(self):
+        lines = readLines(self.inputs[1])
+        idx_last = max(idx for idx, line in enumerate(lines) if not line.startswith("#"))
+        lines.append("3" + lines[idx_last][lines[idx_last].index("\t"):])
+        with open(self.inputs[1], "w") as FH_out:
+            FH_out.write("\n".join(lines) + "\n")
+        log = self.merge("merged.vcf", callers=CALLERS[1:], inputs=self.inputs[1:], expected_status=1)
+        self.assertIn("Error normalizing VCF file {} (FreeBayes): The variant 3:".format(self.inputs[1]), log)
+        self.assertIn("cannot be placed on the reference: The sequence 3 is not in", log)
+        self.assertNotIn("Traceback", log)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(TEST_DIR, "data")
+APP_DIR = os.path.dirname(TEST_DIR)
+sys.path.insert(0, APP_DIR)
+import anacoreUtilsMergeVCFCallersMobiDL2Batch as batch
+
+CALLERS = ["HaplotypeCaller", "FreeBayes", "Strelka2"]
+REFERENCE = os.path.join(DATA_DIR, "ref.fa")
+KILLER_ADAPTER = """import os
+import signal
+
+
+@registerCallerAdapter
+class KillerAdapter(CallerAdapter):
+    name = "Killer"
+    aliases = ["Killer"]
+
+    def extract(self, record, spl):
+        os.kill(os.getpid(), signal.SIGKILL)
+"""
+
+
+########################################################################
+#
+# TESTS
+#
+########################################################################
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        env = dict(os.environ, PYTHONHASHSEED="0")  # The order of merged filters depends on the hash seed
+        self.run_args = {"cwd": self.tmp_dir, "env": env, "stdout": subprocess.PIPE, "stderr": subprocess.STDOUT, "universal_newlines": True}
+        # Samples
+        self.samples = []
+        for spl_idx in range(4):
+            spl_name = "spl_{}".format(spl_idx)
+            spl_dir = self.tmpPath(spl_name)
+            os.mkdir(spl_dir)
+            inputs = []
+            for caller in CALLERS:
+                inputs.append(os.path.join(spl_dir, caller + ".vcf"))
+                shutil.copyfile(os.path.join(DATA_DIR, caller + ".vcf"), inputs[-1])
+            self.samples.append({
+                "sample": spl_name,
+                "calling_sources": list(CALLERS),
+                "inputs_variants": inputs,
+                "output_variants": os.path.join(spl_dir, "merged.vcf")
+            })
+        # Caller adapter killing its process
+        self.adapter_path = self.tmpPath("killer.py")
+        with open(self.adapter_path, "w") as FH_out:
+            FH_out.write(KILLER_ADAPTER)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def tmpPath(self, filename):
+        return os.path.join(self.tmp_dir, filename)
+
+    def runBatch(self, nb_workers):
+        """
+        Run the batch on self.samples and return its exit status and the summary by sample.
+
+        :param nb_workers: Number of samples processed at the same time.
+        :type nb_workers: int
+        :return: The exit status and the summary by sample name.
+        :rtype: (int, dict)
+        """
+        manifest_path = self.tmpPath("manifest.tsv")
+        with open(manifest_path, "w") as FH_out:
+            FH_out.write("\t".join(batch.MANIFEST_FIELDS) + "\n")
+            for spl in self.samples:
+                FH_out.write("\t".join([spl["sample"], ",".join(spl["calling_sources"]), ",".join(spl["inputs_variants"]), spl["output_variants"]]) + "\n")
+        summary_path = self.tmpPath("summary.tsv")
+        cmd = [
+            sys.executable, os.path.join(APP_DIR, "anacoreUtilsMergeVCFCallersMobiDL2Batch.py"),
+            "--normalizer", "internal",
+            "--reference", REFERENCE,
+            "--workers", str(nb_workers),
+            "--caller-adapters", self.adapter_path,
+            "--input-manifest", manifest_path,
+            "--output-summary", summary_path
+        ]
+        process = subprocess.run(cmd, **self.run_args)
+        summary_by_spl = {}
+        with open(summary_path) as FH_in:
+            titles = FH_in.readline().rstrip("\n").split("\t")
+            for line in FH_in:
+                row = dict(zip(titles, line.rstrip("\n").split("\t")))
+                summary_by_spl[row["sample"]] = row
+        return process.returncode, summary_by_spl
+
+    def assertSameAsMerge(self, spl):
+        """Check that the output of the sample in batch is the same as the output of the merge script."""
+        expected_path = self.tmpPath(spl["sample"] + "_expected.vcf")
+        cmd = [
+            sys.executable, os.path.join(APP_DIR, "anacoreUtilsMergeVCFCallersMobiDL2.py"),
+            "--normalizer", "internal",
+            "--reference", REFERENCE,
+            "--calling-sources", *spl["calling_sources"],
+            "--inputs-variants", *spl["inputs_variants"],
+            "--output-variants", expected_path
+        ]
+        process = subprocess.run(cmd, **self.run_args)
+        self.assertEqual(process.returncode, 0, process.stdout)
+        with open(expected_path) as FH_expected, open(spl["output_variants"]) as FH_observed:
+            self.assertEqual(FH_observed.read(), FH_expected.read())
+
+    def testOk(self):
+        status, summary_by_spl = self.runBatch(2)
+        self.assertEqual(status, 0)
+        self.assertEqual(list(summary_by_spl), [spl["sample"] for spl in self.samples])
+        for spl in self.samples:
+            with self.subTest(sample=spl["sample"]):
+                self.assertEqual(summary_by_spl[spl["sample"]]["status"], "ok")
+                self.assertSameAsMerge(spl)
+
+    def testKilledWorker(self):
+        self.samples[0]["calling_sources"][0] = "Killer"
+        status, summary_by_spl = self.runBatch(2)
+        self.assertEqual(status, 1)
+        self.assertEqual(list(summary_by_spl), [spl["sample"] for spl in self.samples])
+        self.assertEqual(summary_by_spl["spl_0"]["status"], "failed")
+        self.assertIn("BrokenProcessPool", summary_by_spl["spl_0"]["message"])
+        for spl in self.samples[1:]:
+            with self.subTest(sample=spl["sample"]):
+                self.assertEqual(summary_by_spl[spl["sample"]]["status"], "ok")
+                self.assertSameAsMerge(spl)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()
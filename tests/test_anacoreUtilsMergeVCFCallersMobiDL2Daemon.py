@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+__author__ = 'Jean-Charles Delmas'
+__copyright__ = 'Copyright (C) 2019 IUCT-O'
+__license__ = 'GNU General Public License'
+__version__ = '1.0.0'
+__status__ = 'dev'
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(TEST_DIR, "data")
+APP_DIR = os.path.dirname(TEST_DIR)
+DAEMON_SCRIPT = os.path.join(APP_DIR, "anacoreUtilsMergeVCFCallersMobiDL2Daemon.py")
+
+CALLERS = ["HaplotypeCaller", "FreeBayes", "Strelka2"]
+REFERENCE = os.path.join(DATA_DIR, "ref.fa")
+
+
+########################################################################
+#
+# TESTS
+#
+########################################################################
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.run_args = {
+            "cwd": self.tmp_dir,
+            "env": dict(os.environ, PYTHONHASHSEED="0"),  # The order of merged filters depends on the hash seed
+            "stdout": subprocess.PIPE,
+            "stderr": subprocess.STDOUT,
+            "universal_newlines": True
+        }
+        for caller in CALLERS:
+            shutil.copyfile(os.path.join(DATA_DIR, caller + ".vcf"), self.tmpPath(caller + ".vcf"))
+        # Start daemon
+        self.socket_path = self.tmpPath("daemon.sock")
+        self.daemon = subprocess.Popen([sys.executable, DAEMON_SCRIPT, "start", "--socket", self.socket_path], **self.run_args)
+        start_time = time.time()
+        while not os.path.exists(self.socket_path):
+            if self.daemon.poll() is not None or time.time() - start_time > 30:
+                self.fail("The daemon has not started: {}".format(self.daemon.communicate()[0]))
+            time.sleep(0.05)
+
+    def tearDown(self):
+        if self.daemon.poll() is None:
+            self.daemon.kill()
+        self.daemon.communicate()
+        shutil.rmtree(self.tmp_dir)
+
+    def tmpPath(self, filename):
+        return os.path.join(self.tmp_dir, filename)
+
+    def mergeParameters(self, out_filename, inputs=None):
+        """Return the parameters of anacoreUtilsMergeVCFCallersMobiDL2.py on the callers VCF. The paths are relative to the temporary directory."""
+        return [
+            "--normalizer", "internal",
+            "--reference", REFERENCE,
+            "--calling-sources", *CALLERS,
+            "--inputs-variants", *([caller + ".vcf" for caller in CALLERS] if inputs is None else inputs),
+            "--output-variants", out_filename
+        ]
+
+    def testSubmit(self):
+        process = subprocess.run([sys.executable, os.path.join(APP_DIR, "anacoreUtilsMergeVCFCallersMobiDL2.py"), *self.mergeParameters("expected.vcf")], **self.run_args)
+        self.assertEqual(process.returncode, 0, process.stdout)
+        for job_idx in range(2):  # The daemon is reused
+            with self.subTest(job=job_idx):
+                process = subprocess.run([sys.executable, DAEMON_SCRIPT, "submit", "--socket", self.socket_path, "--", *self.mergeParameters("daemon.vcf")], **self.run_args)
+                self.assertEqual(process.returncode, 0, process.stdout)
+                self.assertIn("End of job", process.stdout)
+                with open(self.tmpPath("expected.vcf")) as FH_expected, open(self.tmpPath("daemon.vcf")) as FH_observed:
+                    self.assertEqual(FH_observed.read(), FH_expected.read())
+
+    def testFailedJob(self):
+        inputs = [caller + ".vcf" for caller in CALLERS]
+        inputs[0] = "missing.vcf"
+        process = subprocess.run([sys.executable, DAEMON_SCRIPT, "submit", "--socket", self.socket_path, "--", *self.mergeParameters("daemon.vcf", inputs)], **self.run_args)
+        self.assertNotEqual(process.returncode, 0)
+        self.assertIn("missing.vcf", process.stdout)
+        self.assertIsNone(self.daemon.poll())  # The daemon is still running
+
+    def testStop(self):
+        process = subprocess.run([sys.executable, DAEMON_SCRIPT, "stop", "--socket", self.socket_path], **self.run_args)
+        self.assertEqual(process.returncode, 0, process.stdout)
+        self.assertEqual(self.daemon.wait(30), 0)
+        self.assertFalse(os.path.exists(self.socket_path))
+        process = subprocess.run([sys.executable, DAEMON_SCRIPT, "submit", "--socket", self.socket_path, "--", *self.mergeParameters("daemon.vcf")], **self.run_args)
+        self.assertEqual(process.returncode, 1)
+        self.assertIn("not reachable", process.stdout)
+
+
+########################################################################
+#
+# MAIN
+#
+########################################################################
+if __name__ == "__main__":
+    unittest.main()